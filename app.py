@@ -3,50 +3,26 @@ from __future__ import annotations
 from pathlib import Path
 from datetime import datetime
 import os
-import re
+import threading
+import time
+from typing import Tuple
 import streamlit as st
 from slugify import slugify
 
-from search_providers import (
-    MockSearchProvider,
-    BingWebSearchProvider,
-    SerpApiSearchProvider,
-    SearchResult,
-)
-from extractors import extract_image_urls_from_page
-from downloader import download_image
-from packer import build_project_paths, AssetRecord, export_metadata, generate_caption_files
-from validate import check_image_url
+import metrics
+from packer import build_project_paths, export_metadata, generate_caption_files
+from manifest import RunManifest, find_incomplete_runs
+from instagram_pack import IG_FORMATS, render_instagram_pack
+from library_index import LibraryIndex, hit_rows
+from thumbs import ThumbnailCache
+from search_runner import run_searches
+from result_store import ResultStore
+from profiles import SAMPLE_PROFILE, DEFAULT_PROFILE, make_provider, auto_query, project_label, queries_for_profile
 
 
 # =========================
 # Demo profile + helpers
 # =========================
-SAMPLE_PROFILE = {
-    "talent_name": "Holli Smith",
-    "agency": "Art Partner",
-    "brand": "Jean Paul Gaultier",
-    "season": "Haute Couture Spring",
-    "year": 2025,
-    "location": "Paris",
-    "project_event": "JPG Couture Spring 2025 (Paris)",
-    "photographer": "",
-    "brand_domain": "",
-    "keywords": "backstage, runway, beauty, hair",
-    "ig_handle": "jeanpaulgaultier",
-    "credits_line": "Hair: Holli Smith (Art Partner)",
-    "hashtags": "#hair #fashion #runway #backstage #editorial",
-    "ig_mode": "Links-only (handle + show terms)",
-    "sources": ["Web", "Instagram (links-only)"],
-    "provider": "Mock (no API key)",
-    "use_vogue": True,
-    "use_voguerunway": True,
-    "use_brand_site": True,
-    "max_results": 10,
-    "min_kb": 30,
-    "max_images_per_page": 15,
-}
-
 def load_sample_profile():
     for k, v in SAMPLE_PROFILE.items():
         st.session_state[k] = v
@@ -56,95 +32,29 @@ def run_demo_search():
     load_sample_profile()
     st.session_state["RUN_SEARCH_NOW"] = True  # load fields + run
 
-def clear_results():
-    # Clear stored results + selections
-    st.session_state["results_by_source"] = {}
-    st.session_state["selected_urls"] = set()
+@st.cache_resource(show_spinner=False)
+def get_provider(provider_choice: str):
+    # One provider (and its search cache connection / hit counters) per choice, shared across reruns
+    return make_provider(provider_choice)
 
-    # Clear per-result checkbox keys so checkmarks don't persist
+def clear_selection_widgets():
+    # Clear per-result checkbox keys so checkmarks don't persist into the next results
     for k in list(st.session_state.keys()):
         if str(k).startswith("sel__"):
             st.session_state.pop(k, None)
+    st.session_state["grid_page"] = 1
+
+def clear_results():
+    # Clear stored results + selections
+    st.session_state["results_by_source"] = {}
+    st.session_state["result_store"] = ResultStore()
+    st.session_state["selected_urls"] = set()
+    clear_selection_widgets()
 
     # Optional: show a small confirmation message
     st.session_state["CLEARED_NOTICE"] = True
 
 
-def normalize_text(s: str) -> str:
-    s = (s or "").strip().replace(",", " ")
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
-
-def mk(*parts) -> str:
-    cleaned = []
-    for p in parts:
-        if p is None:
-            continue
-        if isinstance(p, int):
-            p = str(p)
-        p = normalize_text(str(p))
-        if p:
-            cleaned.append(p)
-    return " ".join(cleaned).strip()
-
-def get_provider(provider_choice: str):
-    if provider_choice.startswith("Mock"):
-        return MockSearchProvider()
-    if provider_choice.startswith("Bing"):
-        return BingWebSearchProvider()
-    return SerpApiSearchProvider()
-
-def do_search(provider_obj, mode: str, query: str, count: int) -> list[SearchResult]:
-    if mode == "images":
-        try:
-            return provider_obj.search_images(query=query, count=count)
-        except Exception:
-            return provider_obj.search(query=query, count=count)
-    return provider_obj.search(query=query, count=count)
-
-def build_queries(
-    base_query: str,
-    sources: list[str],
-    brand_domain: str,
-    ig_handle: str,
-    ig_mode: str,
-    use_vogue: bool,
-    use_voguerunway: bool,
-    use_brand_site: bool,
-) -> dict[str, dict[str, str]]:
-    q: dict[str, dict[str, str]] = {}
-
-    if "Web" in sources:
-        if use_vogue:
-            q["Vogue.com"] = {"mode": "images", "query": mk("site:vogue.com/fashion-shows", base_query)}
-        if use_voguerunway:
-            q["VogueRunway.com"] = {"mode": "images", "query": mk("site:voguerunway.com", base_query)}
-
-        if use_brand_site:
-            if brand_domain:
-                q["Brand site"] = {"mode": "images", "query": mk(f"site:{brand_domain}", base_query, "lookbook press runway")}
-            else:
-                q["Brand site (web)"] = {
-                    "mode": "images",
-                    "query": mk(base_query, "official site lookbook press runway", "-site:pinterest.com", "-site:tiktok.com"),
-                }
-
-    if "Instagram (links-only)" in sources:
-        base_ig = "site:instagram.com (inurl:/p/ OR inurl:/reel/)"
-        handle = (ig_handle or "").strip().lstrip("@")
-
-        if ig_mode == "Links-only (handle only)":
-            query = mk(base_ig, f"\"{handle}\"" if handle else base_query)
-        elif ig_mode == "Links-only (handle + show terms)":
-            query = mk(base_ig, f"\"{handle}\"" if handle else "", base_query)
-        else:
-            query = mk(base_ig, base_query)
-
-        q["Instagram"] = {"mode": "web", "query": query}
-
-    return q
-
-
 # =========================
 # Streamlit page
 # =========================
@@ -158,38 +68,17 @@ st.caption(
 # =========================
 # Session state defaults
 # =========================
-defaults = {
-    "provider": "Mock (no API key)",
-    "brand": "",
-    "season": "",
-    "year": datetime.now().year,
-    "location": "",
-    "keywords": "",
-    "sources": ["Web"],
-    "talent_name": "",
-    "agency": "",
-    "project_event": "",
-    "photographer": "",
-    "brand_domain": "",
-    "credits_line": "",
-    "hashtags": "",
-    "ig_handle": "",
-    "ig_mode": "Links-only (handle + show terms)",
-    "use_vogue": True,
-    "use_voguerunway": True,
-    "use_brand_site": True,
-    "max_results": 10,
-    "min_kb": 30,
-    "max_images_per_page": 15,
-}
+defaults = DEFAULT_PROFILE
 for k, v in defaults.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
 if "results_by_source" not in st.session_state:
     st.session_state["results_by_source"] = {}
+if "result_store" not in st.session_state:
+    st.session_state["result_store"] = ResultStore.from_results_by_source(st.session_state["results_by_source"])
 if "selected_urls" not in st.session_state:
-    st.session_state["selected_urls"] = set()
+    st.session_state["selected_urls"] = set()  # canonical URL keys (see result_store.canonicalize_url)
 if "RUN_SEARCH_NOW" not in st.session_state:
     st.session_state["RUN_SEARCH_NOW"] = False
 
@@ -209,7 +98,7 @@ st.sidebar.divider()
 
 provider_choice = st.sidebar.selectbox(
     "Search Provider",
-    ["SerpAPI (recommended)", "Bing Web Search API", "Mock (no API key)"],
+    ["SerpAPI (recommended)", "Bing Web Search API", "Federated (SerpAPI + Bing)", "Mock (no API key)"],
     key="provider",
 )
 
@@ -254,11 +143,28 @@ with st.sidebar.expander("Advanced", expanded=False):
     )
 
     st.markdown("### Search Limits")
-    st.slider("Max results per source", 5, 30, key="max_results")
+    st.slider("Max results per source", 5, 200, step=5, key="max_results", help="Above one page (10 web / 100 image results), SerpAPI pages are fetched concurrently; each page is one search of quota.")
 
     st.markdown("### Download Rules")
     st.slider("Skip images smaller than (KB)", 5, 250, key="min_kb")
+    st.slider("Skip images narrower than (px)", 0, 2000, step=50, key="min_width_px", help="0 = off. Checked from the image header, before downloading.")
+    st.slider("Skip images shorter than (px)", 0, 2000, step=50, key="min_height_px", help="0 = off. Checked from the image header, before downloading.")
     st.slider("Max images to try per selected page", 5, 60, key="max_images_per_page")
+    st.checkbox("Single-request fetch (skip HEAD check)", key="single_request_fetch")
+    st.checkbox(
+        "Follow gallery pages",
+        key="crawl_galleries",
+        help="Also fetches a selected page's slideshow / next pages (same site only) and pools their images.",
+    )
+    if st.session_state["crawl_galleries"]:
+        st.slider("Max gallery pages per selected page", 2, 40, key="crawl_max_pages")
+        st.slider("Max downloads per gallery", 8, 200, step=4, key="crawl_max_downloads")
+    st.checkbox("Also write Prometheus metrics (metrics.prom)", key="write_prometheus")
+    st.checkbox(
+        "Render Instagram crops",
+        key="render_pack",
+        help="Crops every download to " + ", ".join(f"{w}×{h}" for w, h in IG_FORMATS.values()) + " in Instagram_Pack/ (uses all CPU cores).",
+    )
 
 
 # =========================
@@ -268,6 +174,18 @@ if provider_choice.startswith("SerpAPI") and not os.environ.get("SERPAPI_API_KEY
     st.sidebar.warning("SerpAPI selected but **SERPAPI_API_KEY** is not set. Use Mock or add the key in Streamlit Secrets.")
 if provider_choice.startswith("Bing") and not os.environ.get("BING_API_KEY"):
     st.sidebar.warning("Bing selected but **BING_API_KEY** is not set. Use Mock or add the key in Streamlit Secrets.")
+if provider_choice.startswith("Federated"):
+    missing = [k for k in ("SERPAPI_API_KEY", "BING_API_KEY") if not os.environ.get(k)]
+    if len(missing) == 2:
+        st.sidebar.warning("Federated search needs **SERPAPI_API_KEY** and **BING_API_KEY**. Use Mock or add the keys in Streamlit Secrets.")
+    elif missing:
+        st.sidebar.warning(f"**{missing[0]}** is not set, so federated search will only get answers from the other provider.")
+
+provider_stats = getattr(get_provider(provider_choice), "stats", None)
+if callable(provider_stats):
+    quota = provider_stats().get("quota", {})
+    if quota.get("remaining") is not None:
+        st.sidebar.caption(f"Search quota: {quota['remaining']} left ({quota['used']} used this session)")
 
 
 # Optional confirmation notice after clearing
@@ -278,24 +196,17 @@ if st.session_state.pop("CLEARED_NOTICE", False):
 # =========================
 # Base query (editable)
 # =========================
-auto_query = mk(
-    st.session_state["brand"],
-    st.session_state["season"],
-    st.session_state["year"],
-    st.session_state["location"],
-    st.session_state["keywords"],
-    "runway backstage",
-)
+default_query = auto_query(st.session_state)
 
 if "base_query" not in st.session_state or not st.session_state["base_query"].strip():
-    st.session_state["base_query"] = auto_query
+    st.session_state["base_query"] = default_query
 
 colq1, colq2 = st.columns([5, 1])
 with colq1:
     base_query = st.text_area("Base query (editable)", key="base_query", height=70)
 with colq2:
     if st.button("Rebuild"):
-        st.session_state["base_query"] = auto_query
+        st.session_state["base_query"] = default_query
         st.rerun()
 
 
@@ -306,76 +217,267 @@ run_now = bool(search_clicked) or bool(st.session_state.pop("RUN_SEARCH_NOW", Fa
 
 if run_now:
     provider_obj = get_provider(st.session_state["provider"])
-    queries = build_queries(
-        base_query=st.session_state["base_query"],
-        sources=st.session_state["sources"],
-        brand_domain=st.session_state["brand_domain"],
-        ig_handle=st.session_state["ig_handle"],
-        ig_mode=st.session_state["ig_mode"],
-        use_vogue=st.session_state["use_vogue"],
-        use_voguerunway=st.session_state["use_voguerunway"],
-        use_brand_site=st.session_state["use_brand_site"],
-    )
-
-    results_by: dict[str, dict] = {}
-    for name, spec in queries.items():
-        mode = spec["mode"]
-        query = spec["query"]
-        try:
-            results = do_search(provider_obj, mode=mode, query=query, count=int(st.session_state["max_results"]))
-            results_by[name] = {"query": query, "mode": mode, "results": results}
-        except Exception as e:
-            results_by[name] = {"query": query, "mode": mode, "results": [], "error": str(e)}
+    queries = queries_for_profile(st.session_state)
+
+    # Live view of the first pages while later pages are still loading
+    live = st.empty()
+    so_far = {name: [] for name in queries}
+
+    def on_partial(name: str, results: list) -> None:
+        so_far[name] = results
+        lines = []
+        for src, res in so_far.items():
+            preview = ", ".join((r.title or r.url)[:40] for r in res[:3])
+            lines.append(f"- **{src}**: {len(res)} results" + (f" — {preview}…" if preview else ""))
+        live.markdown("\n".join(lines))
+
+    # Kept until the next download, so the run's metrics include the searches that found its pages
+    search_metrics = st.session_state["search_metrics"] = metrics.MetricsRegistry()
+    with st.spinner(f"Searching {len(queries)} sources..."), metrics.collecting(search_metrics):
+        results_by = run_searches(provider_obj, queries, count=int(st.session_state["max_results"]), on_partial=on_partial)
+    live.empty()
 
     st.session_state["results_by_source"] = results_by
+    st.session_state["result_store"] = ResultStore.from_results_by_source(results_by)
     st.session_state["selected_urls"] = set()
+    clear_selection_widgets()
 
 st.divider()
 
+
+def render_pack(records: list, pack_dir: Path) -> None:
+    """Instagram crops for every downloaded file, with a progress bar (no-op when turned off)."""
+    if not st.session_state["render_pack"]:
+        return
+    files = [f for r in records for f in r.downloaded_files]
+    pack_progress = st.progress(0.0, text=f"Rendering Instagram crops for {len(files)} images...")
+
+    def on_pack_progress(done: int, total: int, src: str) -> None:
+        pack_progress.progress(done / total, text=f"{done}/{total} images — {Path(src).name}")
+
+    stats = render_instagram_pack(files, pack_dir, on_progress=on_pack_progress)
+    pack_progress.empty()
+    st.caption(
+        f"Instagram pack: {stats.variants_written} crops rendered, {stats.variants_skipped} already up to date "
+        f"({stats.images_per_s} images/s)." + (f" {len(stats.failed)} images could not be read." if stats.failed else "")
+    )
+
+
+def metrics_panel(registry: metrics.MetricsRegistry) -> None:
+    """Collapsible per-stage breakdown of a run (the same numbers as Metadata/metrics.json)."""
+    snap = registry.snapshot()
+    with st.expander("Run metrics", expanded=False):
+        if snap["stages"]:
+            st.dataframe(snap["stages"], hide_index=True)
+        else:
+            st.caption("No timings recorded.")
+        dl = snap["downloads"]
+        if dl["bytes"]:
+            st.caption(f"Downloaded {dl['bytes'] / 1024 / 1024:.1f} MB in {dl['seconds']:.1f}s of transfer ({dl['mb_per_s']} MB/s per connection).")
+        if snap["counters"]:
+            st.dataframe([{"counter": c["name"], **c["labels"], "value": c["value"]} for c in snap["counters"]], hide_index=True)
+
+
+# =========================
+# Resume interrupted runs (manifest without a "complete" event)
+# =========================
+incomplete_runs = find_incomplete_runs(Path("output"))
+if incomplete_runs:
+    with st.expander(f"Interrupted runs ({len(incomplete_runs)})", expanded=False):
+        resume_dir = st.selectbox(
+            "Run to resume",
+            incomplete_runs,
+            format_func=lambda p: str(p.parent.relative_to(Path("output"))),
+        )
+        if st.button("Resume run"):
+            from pipeline import resume_run  # lazy: pulls in requests / numpy / Pillow / lxml
+
+            resume_progress = st.progress(0.0, text="Replaying manifest...")
+
+            def on_resume_progress(done: int, total: int, page_url: str) -> None:
+                resume_progress.progress(done / total, text=f"{done}/{total} pages — {page_url}")
+
+            resume_metrics = metrics.MetricsRegistry()
+            with metrics.collecting(resume_metrics):
+                resumed = resume_run(resume_dir, on_progress=on_resume_progress)
+            header = RunManifest(resume_dir).replay().header
+            fields = header.get("record_fields", {})
+            resume_pack_dir = resume_dir.parent / "Instagram_Pack"
+            resume_pack_dir.mkdir(parents=True, exist_ok=True)
+            with metrics.collecting(resume_metrics):
+                render_pack(resumed, resume_pack_dir)
+            resume_metrics.write(resume_dir, prometheus=bool(st.session_state["write_prometheus"]))
+            generate_caption_files(
+                resume_pack_dir,
+                fields.get("project", ""),
+                fields.get("year", ""),
+                fields.get("location", ""),
+                fields.get("photographer", ""),
+                fields.get("credit_line", ""),
+                st.session_state["hashtags"],
+            )
+            st.success(f"Resumed: {len(resumed)} pages exported.")
+            st.code(str(resume_dir.parent))
+            metrics_panel(resume_metrics)
+
+
+# =========================
+# Library (full-text search over every past run's assets; no search provider involved)
+# =========================
+@st.cache_resource(show_spinner=False)
+def get_library_index() -> Tuple[LibraryIndex, threading.Thread]:
+    index = LibraryIndex(Path("output"))
+    # Picks up runs exported before the index existed, once per server, without blocking the page
+    return index, index.sync_in_background()
+
+
+@st.fragment
+def library_view() -> None:
+    # Nothing is opened or queried until the toggle is on, so reruns don't pay for the Library
+    if not st.toggle("Library: search past runs", key="library_open", help="Full-text search over every run in output/; no search provider is called."):
+        return
+    index, background_sync = get_library_index()
+    if st.button("Rescan output/", help="Re-index runs added or edited outside the app."):
+        with st.spinner("Rescanning output/..."):
+            index.sync()
+    elif background_sync.is_alive():
+        st.caption("Indexing older runs in the background; results fill in as it goes.")
+    facets = index.facets()
+    q1, q2, q3 = st.columns([3, 1, 1])
+    query = q1.text_input("Search past runs", key="library_query", placeholder="e.g. gaultier backstage paris")
+    year = q2.selectbox("Year", ["Any"] + facets["years"], key="library_year")
+    location = q3.selectbox("Location", ["Any"] + facets["locations"], key="library_location")
+    downloaded_only = st.checkbox("Only records with downloaded files", key="library_downloaded_only")
+
+    t0 = time.perf_counter()
+    hits = index.search(
+        query,
+        limit=200,
+        year=None if year == "Any" else year,
+        location=None if location == "Any" else location,
+        downloaded_only=downloaded_only,
+    )
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    stats = index.stats()
+    st.caption(f"{len(hits)} matches in {elapsed_ms:.0f} ms · {stats['records']} records across {stats['runs']} runs")
+    if hits:
+        st.dataframe(
+            list(hit_rows(hits)),
+            hide_index=True,
+            column_config={"page_url": st.column_config.LinkColumn("page_url")},
+        )
+
+
+library_view()
+
 if not st.session_state["results_by_source"]:
     st.info("Click **Search sources** (or **Run demo**).")
     st.stop()
 
 
 # =========================
-# Results UI
+# Results UI (paginated grid; selection reruns only this fragment)
 # =========================
-st.subheader("Results by source")
+GRID_COLUMNS = 4
+PAGE_SIZES = [12, 24, 48]
+
+
+@st.cache_resource(show_spinner=False)
+def get_thumbnail_cache() -> ThumbnailCache:
+    return ThumbnailCache(Path("output") / ".cache" / "thumbs")
+
+
+def _sel_key(url_key: str) -> str:
+    return f"sel__{url_key}"
+
+
+def _toggle_selected(url_key: str) -> None:
+    if st.session_state[_sel_key(url_key)]:
+        st.session_state["selected_urls"].add(url_key)
+    else:
+        st.session_state["selected_urls"].discard(url_key)
+
+
+def _bulk_select(url_keys: list, selected: bool) -> None:
+    for url_key in url_keys:
+        if selected:
+            st.session_state["selected_urls"].add(url_key)
+        else:
+            st.session_state["selected_urls"].discard(url_key)
+        st.session_state[_sel_key(url_key)] = selected
+
+
+def _reset_grid_page() -> None:
+    st.session_state["grid_page"] = 1
+
+
+@st.fragment
+def results_grid() -> None:
+    result_store: ResultStore = st.session_state["result_store"]
+    sources = list(st.session_state["results_by_source"].keys())
+
+    f1, f2, f3 = st.columns([3, 1, 1])
+    source_filter = f1.selectbox("Show", ["All sources"] + sources, key="grid_source", on_change=_reset_grid_page)
+    page_size = f2.selectbox("Per page", PAGE_SIZES, key="grid_page_size", on_change=_reset_grid_page)
+
+    items = [it for it in result_store if source_filter == "All sources" or source_filter in it.sources]
+    pages = max(1, -(-len(items) // page_size))
+    if st.session_state.get("grid_page", 1) > pages:
+        st.session_state["grid_page"] = pages
+    page = f3.number_input("Page", min_value=1, max_value=pages, step=1, key="grid_page")
+    visible = items[(page - 1) * page_size: page * page_size]
+
+    visible_keys = [it.key for it in visible]
+    filtered_keys = [it.key for it in items]
+    b1, b2, b3, b4 = st.columns(4)
+    b1.button("Select page", on_click=_bulk_select, args=(visible_keys, True))
+    b2.button("Clear page", on_click=_bulk_select, args=(visible_keys, False))
+    b3.button(f"Select all ({len(items)})", on_click=_bulk_select, args=(filtered_keys, True))
+    b4.button("Clear all", on_click=_bulk_select, args=(list(st.session_state["selected_urls"]), False))
+    st.caption(
+        f"{len(st.session_state['selected_urls'])} selected · showing {len(visible)} of {len(items)} "
+        f"unique results · page {page}/{pages}"
+    )
+
+    thumb_cache = get_thumbnail_cache()
+    thumbs = thumb_cache.prefetch([it.result.thumbnail_url for it in visible])
+
+    for row_start in range(0, len(visible), GRID_COLUMNS):
+        cols = st.columns(GRID_COLUMNS)
+        for col, item in zip(cols, visible[row_start:row_start + GRID_COLUMNS]):
+            r = item.result
+            with col:
+                thumb = thumbs.get(r.thumbnail_url)
+                if thumb is not None:
+                    try:
+                        st.image(str(thumb), width=240)
+                    except Exception:
+                        pass  # evicted between prefetch and render
+                widget_key = _sel_key(item.key)
+                # selected_urls is the source of truth; widget state is dropped for off-page items
+                st.session_state.setdefault(widget_key, item.key in st.session_state["selected_urls"])
+                st.checkbox(f"Select: {r.title or r.url}", key=widget_key, on_change=_toggle_selected, args=(item.key,))
+                st.caption(f"[{r.url}]({r.url})")
+                st.caption("Sources: " + ", ".join(item.sources))
+                if r.snippet:
+                    st.caption(r.snippet)
+
+
+st.subheader("Results")
 
 for source, payload in st.session_state["results_by_source"].items():
     results = payload.get("results", []) or []
     mode = payload.get("mode", "web")
-    with st.expander(f"{source} — {len(results)} results ({mode})", expanded=True):
+    elapsed = payload.get("elapsed_s")
+    timing = f", {elapsed:.1f}s" if elapsed else ""
+    if results and all(getattr(r, "cached", False) for r in results):
+        timing += ", cached"
+    with st.expander(f"{source} — {len(results)} results ({mode}{timing})", expanded=bool(payload.get("error"))):
         st.code(payload.get("query", ""))
-
         if payload.get("error"):
             st.error(payload["error"])
-            continue
-
-        for i, r in enumerate(results):
-            key = f"sel__{source}__{i}"
-            current_selected = r.url in st.session_state["selected_urls"]
-
-            checked = st.checkbox(
-                f"Select: {r.title or r.url}",
-                value=current_selected,
-                key=key,
-            )
-            if checked:
-                st.session_state["selected_urls"].add(r.url)
-            else:
-                st.session_state["selected_urls"].discard(r.url)
 
-            st.write(r.url)
-            if getattr(r, "snippet", ""):
-                st.caption(r.snippet)
-
-            thumb = getattr(r, "thumbnail_url", "") or ""
-            if thumb:
-                try:
-                    st.image(thumb, width=240)
-                except Exception:
-                    pass
+results_grid()
 
 
 # =========================
@@ -383,15 +485,11 @@ for source, payload in st.session_state["results_by_source"].items():
 # =========================
 st.divider()
 
-brand = st.session_state["brand"].strip()
-season = st.session_state["season"].strip()
 year = str(st.session_state["year"])
 location = st.session_state["location"].strip()
 photographer = st.session_state["photographer"].strip()
 
-project_event = st.session_state["project_event"].strip()
-if not project_event:
-    project_event = mk(brand, season, year, location) or "Untitled Project"
+project_event = project_label(st.session_state)
 
 run_stamp = datetime.utcnow().strftime("%Y-%m-%d_%H%M%S")
 project_for_folder = f"{project_event}__{run_stamp}"
@@ -411,90 +509,79 @@ pack_dir = paths["pack"]
 st.write(f"Saving into: `{paths['root']}`")
 
 if st.button("Download / Organize Selected", type="primary"):
-    selected = list(st.session_state["selected_urls"])
-    if not selected:
+    from pipeline import PageJob, PipelineConfig, run_download_pipeline  # lazy: see Resume run
+
+    # Deterministic order: as the pages first appear in the results
+    result_store = st.session_state["result_store"]
+    picked = sorted(
+        (item for item in map(result_store.get, st.session_state["selected_urls"]) if item is not None),
+        key=lambda item: item.order,
+    )
+    if not picked:
         st.warning("Select at least one result.")
         st.stop()
 
-    all_results: list[SearchResult] = []
-    for p in st.session_state["results_by_source"].values():
-        all_results.extend(p.get("results", []) or [])
-
-    records: list[AssetRecord] = []
-    min_kb = int(st.session_state["min_kb"])
-    max_images_per_page = int(st.session_state["max_images_per_page"])
     credits_line = st.session_state["credits_line"]
     hashtags = st.session_state["hashtags"]
-    tags_text = st.session_state["keywords"]
-
-    for page_url in selected:
-        matched = next((rr for rr in all_results if rr.url == page_url), None)
-        downloaded: list[str] = []
-
-        if "instagram.com" in page_url:
-            records.append(
-                AssetRecord(
-                    project=project_event,
-                    year=year,
-                    location=location,
-                    photographer=photographer,
-                    title=(matched.title if matched else "(instagram)"),
-                    source_url=page_url,
-                    page_url=page_url,
-                    downloaded_files=[],
-                    notes="Instagram link saved (links-only).",
-                    credit_line=credits_line,
-                    tags=tags_text,
-                    created_at=datetime.utcnow().isoformat(),
-                )
-            )
-            continue
-
-        base_name = slugify(project_event)[:30] or "asset"
-
-        direct = getattr(matched, "image_url", "") if matched else ""
-        if direct:
-            chk = check_image_url(direct)
-            if chk.ok:
-                res = download_image(chk.final_url, out_dir=assets_dir, base_name=base_name, min_kb=min_kb)
-                if res.ok and res.filepath:
-                    downloaded.append(res.filepath)
-
-        if not downloaded:
-            try:
-                img_urls = extract_image_urls_from_page(page_url, max_images=max_images_per_page)
-            except Exception:
-                img_urls = []
-
-            for u in img_urls:
-                chk = check_image_url(u)
-                if not chk.ok:
-                    continue
-                res = download_image(chk.final_url, out_dir=assets_dir, base_name=base_name, min_kb=min_kb)
-                if res.ok and res.filepath:
-                    downloaded.append(res.filepath)
-                if len(downloaded) >= 8:
-                    break
-
-        records.append(
-            AssetRecord(
-                project=project_event,
-                year=year,
-                location=location,
-                photographer=photographer,
-                title=(matched.title if matched else "(selected)"),
-                source_url=page_url,
-                page_url=page_url,
-                downloaded_files=downloaded,
-                notes=("" if downloaded else "No downloadable images found (or skipped by rules)."),
-                credit_line=credits_line,
-                tags=tags_text,
-                created_at=datetime.utcnow().isoformat(),
-            )
+    base_name = slugify(project_event)[:30] or "asset"
+
+    jobs = [
+        PageJob(
+            page_url=item.result.url,
+            title=item.result.title,
+            image_url=item.result.image_url,
+            sources=list(item.sources),
         )
-
-    export_metadata(records, meta_dir)
+        for item in picked
+    ]
+
+    config = PipelineConfig(
+        min_kb=int(st.session_state["min_kb"]),
+        min_width=int(st.session_state["min_width_px"]),
+        min_height=int(st.session_state["min_height_px"]),
+        max_images_per_page=int(st.session_state["max_images_per_page"]),
+        single_request=bool(st.session_state["single_request_fetch"]),
+        crawl=bool(st.session_state["crawl_galleries"]),
+        crawl_max_pages=int(st.session_state["crawl_max_pages"]),
+        crawl_max_downloads=int(st.session_state["crawl_max_downloads"]),
+        store_dir=Path("output") / ".store",
+        page_cache_dir=Path("output") / ".cache" / "pages",
+    )
+    # Write-ahead log: if the session dies, the run can be resumed from Metadata/manifest.jsonl
+    manifest = RunManifest(meta_dir)
+    progress = st.progress(0.0, text=f"Processing {len(jobs)} pages...")
+
+    def on_progress(done: int, total: int, page_url: str) -> None:
+        progress.progress(done / total, text=f"{done}/{total} pages — {page_url}")
+
+    run_metrics = metrics.MetricsRegistry()
+    search_metrics = st.session_state.get("search_metrics")
+    if search_metrics is not None:
+        run_metrics.merge(search_metrics)
+    with metrics.collecting(run_metrics):
+        records = run_download_pipeline(
+            jobs,
+            assets_dir=assets_dir,
+            base_name=base_name,
+            record_fields={
+                "project": project_event,
+                "year": year,
+                "location": location,
+                "photographer": photographer,
+                "credit_line": credits_line,
+                "tags": st.session_state["keywords"],
+            },
+            config=config,
+            on_progress=on_progress,
+            manifest=manifest,
+        )
+        export_metadata(records, meta_dir)
     generate_caption_files(pack_dir, project_event, year, location, photographer, credits_line, hashtags)
+    with metrics.collecting(run_metrics):
+        render_pack(records, pack_dir)
+    manifest.append("complete", durable=True)
+    run_metrics.write(meta_dir, prometheus=bool(st.session_state["write_prometheus"]))
 
     st.success("Done! Exported downloads + metadata + Instagram pack.")
     st.code(str(paths["root"]))
+    metrics_panel(run_metrics)
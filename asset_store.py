@@ -0,0 +1,106 @@
+from __future__ import annotations
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_STORE_DIR = Path("output") / ".store"
+
+
+@dataclass
+class BlobRef:
+    digest: str
+    ext: str
+    size: int
+    content_type: str = ""
+
+
+class AssetStore:
+    """
+    Content-addressed blob store shared by every run.
+    - Blobs live at blobs/<digest[:2]>/<digest><ext> (sha256 of the bytes)
+    - A URL -> digest index lets repeat runs skip the network for known URLs
+    - Run folders get hardlinks (or symlinks / copies as a fallback) instead of copies
+    """
+
+    def __init__(self, root: Path = DEFAULT_STORE_DIR):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._db_path = self.root / "index.sqlite"
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS url_index ("
+                " url TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL,"
+                " size INTEGER NOT NULL, content_type TEXT, fetched_at REAL NOT NULL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_url_index_digest ON url_index(digest)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own `with` only commits; closing() releases the connection too
+        with closing(sqlite3.connect(str(self._db_path), timeout=10)) as con, con:
+            yield con
+
+    def blob_path(self, digest: str, ext: str) -> Path:
+        return self.blobs_dir / digest[:2] / f"{digest}{ext}"
+
+    def temp_path(self) -> Path:
+        """A scratch file on the store's filesystem, so ingest() is a cheap rename."""
+        return self.tmp_dir / f"{uuid.uuid4().hex}.part"
+
+    def lookup(self, url: str) -> Optional[BlobRef]:
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT digest, ext, size, content_type FROM url_index WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        ref = BlobRef(row[0], row[1], int(row[2]), row[3] or "")
+        if not self.blob_path(ref.digest, ref.ext).exists():
+            return None
+        return ref
+
+    def remember(self, url: str, ref: BlobRef) -> None:
+        with self._lock, self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO url_index (url, digest, ext, size, content_type, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, ref.digest, ref.ext, ref.size, ref.content_type, time.time()),
+            )
+
+    def ingest(self, tmp_path: Path, ref: BlobRef) -> Path:
+        """Moves a finished temp file into the store (or drops it if the blob already exists)."""
+        dest = self.blob_path(ref.digest, ref.ext)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            tmp_path.unlink(missing_ok=True)
+        else:
+            os.replace(tmp_path, dest)
+        return dest
+
+    def link_into(self, ref: BlobRef, out_dir: Path, base_name: str) -> Path:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        src = self.blob_path(ref.digest, ref.ext)
+        dest = out_dir / f"{base_name}_{ref.digest[:10]}{ref.ext}"
+        if dest.exists():
+            return dest
+        try:
+            os.link(src, dest)
+        except FileExistsError:
+            pass
+        except OSError:
+            try:
+                os.symlink(src.resolve(), dest)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copy2(src, dest)
+        return dest
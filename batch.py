@@ -0,0 +1,301 @@
+"""
+Headless batch runner: search + download + organize for many profiles at once.
+
+    python batch.py profiles.jsonl --workers 16 --profile-workers 4
+    python batch.py calendar.csv --summary output/fw_summary.json
+
+Each line / row is a search profile with the same fields as profiles.SAMPLE_PROFILE
+(missing fields fall back to profiles.DEFAULT_PROFILE; CSV lists use ";").
+Every result returned for a profile is downloaded, and each profile gets the usual
+run folder under <output>/Portfolio/... (with per-stage timings in Metadata/metrics.json).
+A JSON summary with per-profile timings, bytes and failures is written at the end.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import threading
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from slugify import slugify
+
+import metrics
+from instagram_pack import make_pool, render_instagram_pack
+from packer import build_project_paths, export_metadata, generate_caption_files
+from manifest import RunManifest
+from pipeline import HostLimiter, PageJob, PipelineConfig, run_download_pipeline
+from profiles import coerce_profile, make_provider, project_label, queries_for_profile
+from result_store import ResultStore
+from search_providers import BaseSearchProvider
+from search_runner import run_searches
+
+
+def load_profiles(path: Path) -> List[Dict[str, Any]]:
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return [coerce_profile(row) for row in csv.DictReader(f)]
+    profiles: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                profiles.append(coerce_profile(json.loads(line)))
+    return profiles
+
+
+def _file_bytes(paths: List[str]) -> int:
+    total = 0
+    for p in paths:
+        try:
+            total += os.path.getsize(p)
+        except OSError:
+            pass
+    return total
+
+
+class ProviderPool:
+    """
+    One search provider per provider choice, shared by every profile of the batch, so
+    concurrent profiles share its rate limit, quota reserve and single-flight cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers: Dict[str, BaseSearchProvider] = {}
+
+    def get(self, provider_choice: str) -> BaseSearchProvider:
+        with self._lock:
+            provider = self._providers.get(provider_choice)
+            if provider is None:
+                provider = self._providers[provider_choice] = make_provider(provider_choice)
+            return provider
+
+    def close(self) -> None:
+        with self._lock:
+            providers, self._providers = list(self._providers.values()), {}
+        for provider in providers:
+            provider.close()
+
+
+def run_profile(
+    profile: Dict[str, Any],
+    index: int,
+    base_output: Path,
+    limiter: HostLimiter,
+    config: PipelineConfig,
+    parquet: bool = False,
+    prometheus: bool = False,
+    pack_pool: Optional[Executor] = None,
+    providers: Optional[ProviderPool] = None,
+) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    registry = metrics.MetricsRegistry()
+    project_event = project_label(profile)
+    summary: Dict[str, Any] = {"index": index, "profile": project_event, "ok": False, "error": ""}
+
+    try:
+        with metrics.collecting(registry):
+            year = str(profile["year"])
+            location = str(profile.get("location") or "").strip()
+            photographer = str(profile.get("photographer") or "").strip()
+            run_stamp = datetime.utcnow().strftime("%Y-%m-%d_%H%M%S")
+            paths = build_project_paths(
+                base_output=base_output,
+                year=year,
+                location=location or "unknown-location",
+                project=f"{project_event}__{run_stamp}_{index:03d}",
+                photographer=photographer or "unknown-photographer",
+            )
+            summary["run_dir"] = str(paths["root"])
+
+            # Search
+            queries = queries_for_profile(profile)
+            provider = providers.get(profile["provider"]) if providers is not None else make_provider(profile["provider"])
+            results_by = run_searches(provider, queries, count=int(profile["max_results"]))
+            t_search = time.perf_counter()
+            summary["sources"] = {
+                name: {"results": len(p["results"]), "elapsed_s": p["elapsed_s"], "error": p["error"]}
+                for name, p in results_by.items()
+            }
+
+            # Download / organize (every result of the profile)
+            store = ResultStore.from_results_by_source(results_by)
+            jobs = [
+                PageJob(page_url=it.result.url, title=it.result.title, image_url=it.result.image_url, sources=list(it.sources))
+                for it in store
+            ]
+            cfg = PipelineConfig(**{
+                **config.__dict__,
+                "min_kb": int(profile["min_kb"]),
+                "min_width": int(profile.get("min_width_px") or 0),
+                "min_height": int(profile.get("min_height_px") or 0),
+                "max_images_per_page": int(profile["max_images_per_page"]),
+                "single_request": bool(profile.get("single_request_fetch", True)),
+                "crawl": bool(profile.get("crawl_galleries", False)),
+                "crawl_max_pages": int(profile.get("crawl_max_pages") or 10),
+                "crawl_max_downloads": int(profile.get("crawl_max_downloads") or 40),
+            })
+            credits_line = profile.get("credits_line", "")
+            manifest = RunManifest(paths["meta"])
+            records = run_download_pipeline(
+                jobs,
+                assets_dir=paths["assets"],
+                base_name=slugify(project_event)[:30] or "asset",
+                record_fields={
+                    "project": project_event,
+                    "year": year,
+                    "location": location,
+                    "photographer": photographer,
+                    "credit_line": credits_line,
+                    "tags": profile.get("keywords", ""),
+                },
+                config=cfg,
+                limiter=limiter,
+                manifest=manifest,
+            )
+            t_download = time.perf_counter()
+
+            export_metadata(records, paths["meta"], parquet=parquet)
+            generate_caption_files(
+                paths["pack"], project_event, year, location, photographer, credits_line, profile.get("hashtags", "")
+            )
+            t_export = time.perf_counter()
+
+            files = [f for r in records for f in r.downloaded_files]
+            if profile.get("render_pack", True):
+                pack = render_instagram_pack(files, paths["pack"], pool=pack_pool)
+                summary["pack"] = {
+                    "written": pack.variants_written,
+                    "up_to_date": pack.variants_skipped,
+                    "failed": pack.failed,
+                    "images_per_s": pack.images_per_s,
+                }
+            manifest.append("complete", durable=True)
+            t_pack = time.perf_counter()
+            registry.write(paths["meta"], prometheus=prometheus)
+
+            summary.update({
+                "ok": True,
+                "pages": len(records),
+                "pages_with_images": sum(1 for r in records if r.downloaded_files),
+                "images": len(files),
+                "bytes": _file_bytes(files),
+                "failures": [
+                    {"page_url": r.page_url, "notes": r.notes}
+                    for r in records
+                    if not r.downloaded_files and "instagram.com" not in r.page_url
+                ] + [
+                    {"source": name, "error": p["error"]} for name, p in results_by.items() if p["error"]
+                ],
+                "timings_s": {
+                    "search": round(t_search - t0, 3),
+                    "download": round(t_download - t_search, 3),
+                    "export": round(t_export - t_download, 3),
+                    "pack": round(t_pack - t_export, 3),
+                },
+            })
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    summary.setdefault("timings_s", {})["total"] = round(time.perf_counter() - t0, 3)
+    summary["stages"] = registry.stages()
+    return summary
+
+
+def run_batch(
+    profiles: List[Dict[str, Any]],
+    base_output: Path,
+    workers: int = 16,
+    profile_workers: int = 4,
+    per_host: int = 2,
+    parquet: bool = False,
+    prometheus: bool = False,
+) -> Dict[str, Any]:
+    """
+    Runs every profile concurrently; all downloads share one HostLimiter budget (workers
+    requests in flight, split across the running profiles' thread pools),
+    all searches one provider per provider choice (one rate limit and quota reserve)
+    and all Instagram crops one process pool (workers start on first use).
+    """
+    started = datetime.utcnow().isoformat()
+    t0 = time.perf_counter()
+    # Each running profile gets its share of the workers for its page and image pools;
+    # the shared limiter still caps requests across all of them at `workers`
+    concurrent_profiles = max(1, min(profile_workers, len(profiles)))
+    config = PipelineConfig(
+        max_workers=max(1, workers // concurrent_profiles),
+        per_host=per_host,
+        store_dir=base_output / ".store",
+        page_cache_dir=base_output / ".cache" / "pages",
+    )
+    limiter = HostLimiter(workers, per_host, config.host_interval_s)
+    providers = ProviderPool()
+
+    results: List[Dict[str, Any]] = []
+    try:
+        with make_pool() as pack_pool, \
+                ThreadPoolExecutor(max_workers=max(1, profile_workers), thread_name_prefix="profile") as pool:
+            futures = [
+                pool.submit(run_profile, p, i, base_output, limiter, config, parquet, prometheus, pack_pool, providers)
+                for i, p in enumerate(profiles)
+            ]
+            for fut in as_completed(futures):
+                res = fut.result()
+                results.append(res)
+                status = "ok" if res["ok"] else f"FAILED ({res['error']})"
+                print(f"[{len(results)}/{len(profiles)}] {res['profile']}: {status} in {res['timings_s']['total']:.1f}s", file=sys.stderr)
+    finally:
+        providers.close()
+
+    results.sort(key=lambda r: r["index"])
+    return {
+        "started_at": started,
+        "finished_at": datetime.utcnow().isoformat(),
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "workers": workers,
+        "profile_workers": profile_workers,
+        "totals": {
+            "profiles": len(results),
+            "failed_profiles": sum(1 for r in results if not r["ok"]),
+            "pages": sum(r.get("pages", 0) for r in results),
+            "images": sum(r.get("images", 0) for r in results),
+            "bytes": sum(r.get("bytes", 0) for r in results),
+        },
+        "profiles": results,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Run many search profiles headlessly.")
+    ap.add_argument("profiles", type=Path, help="JSONL or CSV file of search profiles")
+    ap.add_argument("--output", type=Path, default=Path("output"), help="base output folder (default: output)")
+    ap.add_argument("--workers", type=int, default=16, help="global cap on concurrent requests")
+    ap.add_argument("--profile-workers", type=int, default=4, help="profiles run at the same time")
+    ap.add_argument("--per-host", type=int, default=2, help="concurrent requests per host")
+    ap.add_argument("--parquet", action="store_true", help="also write Metadata/assets.parquet (needs pyarrow)")
+    ap.add_argument("--prometheus", action="store_true", help="also write Metadata/metrics.prom (Prometheus text format)")
+    ap.add_argument("--summary", type=Path, default=None, help="summary JSON path")
+    args = ap.parse_args(argv)
+
+    profiles = load_profiles(args.profiles)
+    if not profiles:
+        print("No profiles found.", file=sys.stderr)
+        return 1
+
+    summary = run_batch(profiles, args.output, args.workers, args.profile_workers, args.per_host, args.parquet, args.prometheus)
+    summary_path = args.summary or args.output / f"batch_summary_{datetime.utcnow().strftime('%Y-%m-%d_%H%M%S')}.json"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(str(summary_path))
+    return 0 if summary["totals"]["failed_profiles"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Compares extract_image_urls_from_page engines (mode="soup" vs mode="stream")
+on a synthetic multi-MB gallery page served from localhost.
+
+    python benchmarks/bench_extract.py [--looks 3000] [--repeat 5]
+
+Each mode runs in a fresh subprocess so peak RSS is measured per engine.
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+import threading
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def gallery_html(looks: int) -> bytes:
+    parts = [
+        "<html><head><meta property='og:image' content='/img/cover_2000.jpg'></head><body>",
+        "<script>" + ("var filler = 'x';" * 2000) + "</script>",
+    ]
+    for i in range(looks):
+        parts.append(
+            f"<figure class='look'><picture>"
+            f"<source type='image/avif' srcset='/img/look{i}_1600.avif 1600w'>"
+            f"<img src='/img/look{i}_320.jpg' srcset='/img/look{i}_320.jpg 320w, /img/look{i}_800.jpg 800w, "
+            f"/img/look{i}_1600.jpg 1600w' sizes='(max-width: 768px) 100vw, 50vw' alt='Look {i}'></picture>"
+            f"<figcaption>Look {i}: " + ("runway detail " * 20) + "</figcaption></figure>"
+        )
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def serve(body: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+CHILD = r"""
+import json, resource, statistics, sys, time
+sys.path.insert(0, {root!r})
+from extractors import extract_image_urls_from_page
+url, mode, repeat, max_images = {url!r}, {mode!r}, {repeat}, {max_images}
+times, n = [], 0
+for _ in range(repeat):
+    t0 = time.perf_counter()
+    n = len(extract_image_urls_from_page(url, max_images=max_images, mode=mode))
+    times.append(time.perf_counter() - t0)
+print(json.dumps({{
+    "mode": mode,
+    "candidates": n,
+    "p50_ms": round(statistics.median(times) * 1000, 1),
+    "min_ms": round(min(times) * 1000, 1),
+    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}}))
+"""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--looks", type=int, default=3000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--max-images", type=int, default=15)
+    args = ap.parse_args()
+
+    body = gallery_html(args.looks)
+    server = serve(body)
+    url = f"http://127.0.0.1:{server.server_address[1]}/gallery"
+    print(f"page size: {len(body) / 1024 / 1024:.1f} MB, looks: {args.looks}")
+
+    try:
+        for mode in ("soup", "stream"):
+            code = CHILD.format(root=str(ROOT), url=url, mode=mode, repeat=args.repeat, max_images=args.max_images)
+            out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            print(json.dumps(json.loads(out.stdout)))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
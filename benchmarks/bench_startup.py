@@ -0,0 +1,111 @@
+"""
+Start-up / rerun budget check for the Streamlit app.
+
+    python benchmarks/bench_startup.py [--import-budget-ms 100] [--rerun-budget-ms 250] [--reruns 10]
+
+- import: app.py's own top-level imports (streamlit itself excluded), in a fresh interpreter,
+  plus a check that the heavy modules (numpy, Pillow, bs4, lxml, pandas, pyarrow, serpapi,
+  requests) are not loaded until a download actually runs
+- rerun: median time of a checkbox-tick rerun via streamlit's AppTest, after a demo search
+
+Exits 1 when a budget is exceeded, so it can gate CI.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import List
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["numpy", "PIL", "bs4", "lxml", "pandas", "pyarrow", "serpapi", "requests"]
+
+IMPORT_CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+import streamlit, slugify  # baseline the app can't avoid
+t0 = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"import_ms": elapsed * 1000, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+RERUN_CHILD = r"""
+import json, statistics, sys, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+t0 = time.perf_counter()
+at.run()
+first = time.perf_counter() - t0
+at.sidebar.button[1].click().run()  # Run demo (Mock provider)
+times = []
+for i in range({reruns}):
+    box = [c for c in at.checkbox if c.label.startswith("Select")][0]
+    t0 = time.perf_counter()
+    (box.uncheck() if i % 2 else box.check()).run()
+    times.append(time.perf_counter() - t0)
+print(json.dumps({{
+    "first_run_ms": first * 1000,
+    "rerun_median_ms": statistics.median(times) * 1000,
+    "exceptions": [str(e.message) for e in at.exception],
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def app_imports(app: Path = ROOT / "app.py") -> List[str]:
+    """The repo modules app.py imports at module level (read from its AST, so it can't go stale)."""
+    names: List[str] = []
+    for node in ast.parse(app.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            names += [alias.name.split(".")[0] for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module.split(".")[0])
+    return [n for n in dict.fromkeys(names) if (ROOT / f"{n}.py").exists()]
+
+
+def run_child(code: str, cwd: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--import-budget-ms", type=float, default=100.0)
+    ap.add_argument("--rerun-budget-ms", type=float, default=250.0)
+    ap.add_argument("--reruns", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:  # the app creates output/ in its working directory
+        imp = run_child(IMPORT_CHILD.format(root=str(ROOT), modules=app_imports(), heavy=HEAVY_MODULES), tmp)
+        rerun = run_child(
+            RERUN_CHILD.format(root=str(ROOT), app=str(ROOT / "app.py"), reruns=args.reruns, heavy=HEAVY_MODULES), tmp
+        )
+
+    print(f"import   {imp['import_ms']:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"1st run  {rerun['first_run_ms']:8.1f} ms")
+    print(f"rerun    {rerun['rerun_median_ms']:8.1f} ms  median of {args.reruns} (budget {args.rerun_budget_ms:.0f} ms)")
+
+    if imp["import_ms"] > args.import_budget_ms:
+        failures.append("import time over budget")
+    if rerun["rerun_median_ms"] > args.rerun_budget_ms:
+        failures.append("rerun time over budget")
+    if imp["heavy"] or rerun["heavy"]:
+        failures.append(f"heavy modules loaded at start-up: {sorted(set(imp['heavy']) | set(rerun['heavy']))}")
+    if rerun["exceptions"]:
+        failures.append(f"app raised: {rerun['exceptions']}")
+
+    for f in failures:
+        print(f"FAIL: {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Stand-in web for the benchmarks: a local HTTP server with synthetic gallery pages and
+images of controlled sizes and latency, plus a search provider that points at it.
+
+    /gallery/<p>.html      gallery page p with images_per_page <img srcset> entries
+    /img/<p>_<i>.jpg       a real JPEG (1200x1600 header) padded to one of image_kb sizes
+    /slow/...              same as above with extra latency (every 10th image)
+
+Nothing here touches the network beyond 127.0.0.1.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Tuple
+import threading
+import time
+
+from search_providers import BaseSearchProvider, SearchResult
+
+
+def make_jpeg(size_kb: int, width: int = 1200, height: int = 1600) -> bytes:
+    """A decodable JPEG with the given pixel size, padded after EOI to roughly size_kb."""
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new("RGB", (width, height), (180, 120, 90)).save(buf, "JPEG", quality=85)
+    data = buf.getvalue()
+    return data + b"\0" * max(0, size_kb * 1024 - len(data))
+
+
+def gallery_html(page: int, images_per_page: int, filler_kb: int = 64) -> bytes:
+    parts = [
+        f"<html><head><title>Gallery {page}</title>"
+        f"<meta property='og:image' content='/img/{page}_0.jpg'></head><body>",
+        "<script>" + "var filler = 'x';" * (filler_kb * 1024 // 16) + "</script>",
+    ]
+    for i in range(images_per_page):
+        prefix = "/slow" if i % 10 == 9 else ""
+        parts.append(
+            f"<figure><img src='{prefix}/img/{page}_{i}.jpg?w=320' "
+            f"srcset='{prefix}/img/{page}_{i}.jpg?w=320 320w, {prefix}/img/{page}_{i}.jpg 1600w' "
+            f"sizes='100vw' alt='Look {i}'><figcaption>Look {i}</figcaption></figure>"
+        )
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+@dataclass
+class FixtureSite:
+    pages: int = 20
+    images_per_page: int = 8
+    image_kb: Tuple[int, ...] = (60, 250, 1000)
+    latency_ms: float = 20.0       # time to first byte for every request
+    slow_latency_ms: float = 200.0  # extra for /slow/ images (a tail for p95)
+    _images: Dict[int, bytes] = field(default_factory=dict, repr=False)
+
+    def image_bytes(self, page: int, index: int) -> bytes:
+        size = self.image_kb[(page + index) % len(self.image_kb)]
+        if size not in self._images:
+            self._images[size] = make_jpeg(size)
+        return self._images[size]
+
+    def total_image_bytes(self) -> int:
+        return sum(len(self.image_bytes(p, i)) for p in range(self.pages) for i in range(self.images_per_page))
+
+
+def _handler(site: FixtureSite):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like a CDN
+
+        def _route(self) -> Tuple[int, str, bytes]:
+            path = self.path.split("?", 1)[0]
+            delay = site.latency_ms
+            if path.startswith("/slow/"):
+                path = path[len("/slow"):]
+                delay += site.slow_latency_ms
+            time.sleep(delay / 1000.0)
+            try:
+                if path.startswith("/gallery/") and path.endswith(".html"):
+                    page = int(path[len("/gallery/"):-len(".html")])
+                    if 0 <= page < site.pages:
+                        return 200, "text/html; charset=utf-8", gallery_html(page, site.images_per_page)
+                if path.startswith("/img/") and path.endswith(".jpg"):
+                    page, index = (int(x) for x in path[len("/img/"):-len(".jpg")].split("_"))
+                    return 200, "image/jpeg", site.image_bytes(page, index)
+            except ValueError:
+                pass
+            return 404, "text/plain", b"not found"
+
+        def _send(self, with_body: bool) -> None:
+            status, ct, body = self._route()
+            self.send_response(status)
+            self.send_header("Content-Type", ct)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            self._send(True)
+
+        def do_HEAD(self):
+            self._send(False)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class FixtureServer:
+    """Runs a FixtureSite on 127.0.0.1 in background threads (use as a context manager)."""
+
+    def __init__(self, site: FixtureSite):
+        self.site = site
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(site))
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> "FixtureServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def page_urls(self) -> List[str]:
+        return [f"{self.base_url}/gallery/{p}.html" for p in range(self.site.pages)]
+
+    def image_urls(self) -> List[str]:
+        return [
+            f"{self.base_url}/img/{p}_{i}.jpg" for p in range(self.site.pages) for i in range(self.site.images_per_page)
+        ]
+
+
+class FixtureSearchProvider(BaseSearchProvider):
+    """
+    Returns the fixture site's gallery pages as search results.
+    - search(): gallery pages (the download flow extracts their images)
+    - search_images(): the same pages, each with its first image as image_url
+    """
+
+    def __init__(self, base_url: str, pages: int):
+        self.base_url = base_url.rstrip("/")
+        self.pages = pages
+
+    def _results(self, count: int, images: bool) -> List[SearchResult]:
+        return [
+            SearchResult(
+                title=f"Gallery {p}",
+                url=f"{self.base_url}/gallery/{p}.html",
+                image_url=f"{self.base_url}/img/{p}_0.jpg" if images else "",
+                source="fixture_images" if images else "fixture_web",
+            )
+            for p in range(min(count, self.pages))
+        ]
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        return self._results(count, images=False)
+
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        return self._results(count, images=True)
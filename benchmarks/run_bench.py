@@ -0,0 +1,337 @@
+"""
+Throughput benchmark suite against a local stand-in web (see benchmarks/fixtures.py).
+
+    python benchmarks/run_bench.py --out benchmarks/results/base.json
+    python benchmarks/run_bench.py --compare benchmarks/results/base.json [--tolerance 0.15]
+    python benchmarks/run_bench.py --scenarios extract,download --pages 40 --latency-ms 50
+
+Scenarios (each in a fresh subprocess, so peak RSS is per scenario):
+- extract:  extract_image_urls_from_page over every gallery page      -> pages/s, p50/p95
+- check:    check_image_url (HEAD) over every image                     -> req/s, p50/p95
+- download: download_image over every image                             -> images/s, MB/s, p50/p95
+- e2e:      fixture search -> ResultStore -> run_download_pipeline -> export_metadata
+                                                                        -> pages/s, images/s, MB/s
+- pack:     render_instagram_pack over --pack-images local JPEGs, cold then again
+            with every crop up to date                                  -> images/s (both)
+- library:  LibraryIndex over --library-runs synthetic runs (25 records each): backfill, then
+            a fixed query mix                                           -> records/s, query p50/p95
+
+Results are written as JSON (commit, params, metrics). --compare prints the change against a
+saved baseline and exits 1 when a metric regressed by more than --tolerance.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+SCENARIOS = ["extract", "check", "download", "e2e", "pack", "library"]
+LIBRARY_QUERIES = ["gaultier", "backstage paris", "holli smi", "vogue", "look 7", "", "milan runway 2024", "chanel look 12"]
+# Which way is better, by metric-name suffix
+HIGHER_IS_BETTER = ("_per_s",)
+LOWER_IS_BETTER = ("_ms", "_mb")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def _timed_map(fn: Callable[[str], Any], urls: List[str], concurrency: int) -> Tuple[List[Any], List[float], float]:
+    def one(url: str) -> Tuple[Any, float]:
+        t0 = time.perf_counter()
+        out = fn(url)
+        return out, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pairs = list(pool.map(one, urls))
+    wall = time.perf_counter() - t0
+    return [p[0] for p in pairs], [p[1] for p in pairs], wall
+
+
+def _latency(times: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(times, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(times, 0.95) * 1000, 2),
+    }
+
+
+# -------------------------
+# Scenarios (run in the child process)
+# -------------------------
+def bench_extract(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from extractors import extract_image_urls_from_page
+
+    urls = [f"{base_url}/gallery/{p}.html" for p in range(args.pages)]
+    found, times, wall = _timed_map(
+        lambda u: extract_image_urls_from_page(u, max_images=args.images_per_page * 2), urls, args.concurrency
+    )
+    return {"pages": len(urls), "candidates": sum(len(f) for f in found),
+            "pages_per_s": round(len(urls) / wall, 2), **_latency(times)}
+
+
+def _image_urls(base_url: str, args: argparse.Namespace) -> List[str]:
+    return [f"{base_url}/img/{p}_{i}.jpg" for p in range(args.pages) for i in range(args.images_per_page)]
+
+
+def bench_check(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from validate import check_image_url
+
+    urls = _image_urls(base_url, args)
+    checks, times, wall = _timed_map(check_image_url, urls, args.concurrency)
+    return {"requests": len(urls), "ok": sum(1 for c in checks if c.ok),
+            "requests_per_s": round(len(urls) / wall, 2), **_latency(times)}
+
+
+def bench_download(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from downloader import download_image
+
+    urls = _image_urls(base_url, args)
+    with tempfile.TemporaryDirectory() as tmp:
+        results, times, wall = _timed_map(
+            lambda u: download_image(u, Path(tmp), "bench", min_kb=1), urls, args.concurrency
+        )
+    total = sum(r.bytes_written for r in results if r.ok)
+    return {"images": sum(1 for r in results if r.ok), "bytes": total,
+            "images_per_s": round(len(urls) / wall, 2), "mb_per_s": round(total / 1024 / 1024 / wall, 2),
+            **_latency(times)}
+
+
+def bench_e2e(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from fixtures import FixtureSearchProvider
+    from packer import export_metadata
+    from pipeline import PageJob, PipelineConfig, run_download_pipeline
+    from result_store import ResultStore
+    from search_runner import run_searches
+
+    t0 = time.perf_counter()
+    provider = FixtureSearchProvider(base_url, args.pages)
+    results_by = run_searches(provider, {"Fixture": {"mode": "web", "query": "bench"}}, count=args.pages)
+    store = ResultStore.from_results_by_source(results_by)
+    jobs = [PageJob(page_url=it.result.url, title=it.result.title, sources=list(it.sources)) for it in store]
+    # One host serves everything, so politeness limits are lifted to measure raw throughput
+    cfg = PipelineConfig(
+        min_kb=1,
+        max_images_per_page=args.images_per_page * 2,
+        max_downloads_per_page=args.images_per_page,
+        max_workers=args.concurrency,
+        per_host=args.concurrency,
+        host_interval_s=0.0,
+        dedup_threshold=None,
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        assets, meta = Path(tmp) / "Assets", Path(tmp) / "Metadata"
+        meta.mkdir()
+        fields = {"project": "bench", "year": "2025", "location": "", "photographer": "", "credit_line": "", "tags": ""}
+        records = run_download_pipeline(jobs, assets, "bench", fields, config=cfg)
+        export_metadata(records, meta)
+        files = [f for r in records for f in r.downloaded_files]
+        total = sum(Path(f).stat().st_size for f in files)
+    wall = time.perf_counter() - t0
+    return {"pages": len(records), "images": len(files), "bytes": total, "wall_s": round(wall, 3),
+            "pages_per_s": round(len(records) / wall, 2), "images_per_s": round(len(files) / wall, 2),
+            "mb_per_s": round(total / 1024 / 1024 / wall, 2)}
+
+
+def bench_pack(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from fixtures import make_jpeg
+    from instagram_pack import render_instagram_pack
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for i in range(args.pack_images):
+            path = Path(tmp) / "Assets" / f"bench_{i:04d}.jpg"
+            path.parent.mkdir(exist_ok=True)
+            # Alternate portrait / landscape so every format needs a real crop
+            path.write_bytes(make_jpeg(0, *((2400, 3200) if i % 2 else (3200, 2400))))
+            sources.append(str(path))
+        cold = render_instagram_pack(sources, Path(tmp) / "Instagram_Pack", max_workers=args.pack_workers or None)
+        warm = render_instagram_pack(sources, Path(tmp) / "Instagram_Pack", max_workers=args.pack_workers or None)
+    return {"images": cold.images, "variants": cold.variants_written, "failed": len(cold.failed),
+            "images_per_s": cold.images_per_s, "up_to_date_images_per_s": warm.images_per_s}
+
+
+def bench_library(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from library_index import LibraryIndex
+    from packer import AssetRecord, build_project_paths, export_metadata
+
+    brands = ["Jean Paul Gaultier", "Chanel", "Dior", "Loewe", "Prada"]
+    cities = ["Paris", "Milan", "London", "New York"]
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        for i in range(args.library_runs):
+            brand, city, year = brands[i % len(brands)], cities[i % len(cities)], str(2023 + i % 3)
+            paths = build_project_paths(base, year, city, f"{brand} show {i}", "Holli Smith" if i % 2 else "")
+            records = [
+                AssetRecord(f"{brand} show {i}", year, city, "Holli Smith" if i % 2 else "", f"{brand} backstage look {j}",
+                            f"https://www.vogue.com/slideshow/{i}/{j}", f"https://www.vogue.com/slideshow/{i}", [],
+                            tags="#backstage #runway")
+                for j in range(25)
+            ]
+            export_metadata(records, paths["meta"], index=False)
+        index = LibraryIndex(base)
+        t0 = time.perf_counter()
+        synced = index.sync()
+        backfill_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index.sync()
+        resync_s = time.perf_counter() - t0
+        times = []
+        for _ in range(5):
+            for q in LIBRARY_QUERIES:
+                t = time.perf_counter()
+                index.search(q, limit=50)
+                times.append(time.perf_counter() - t)
+        records = index.stats()["records"]
+    return {"runs": synced.indexed, "records": records, "records_per_s": round(records / backfill_s, 1),
+            "resync_ms": round(resync_s * 1000, 1), **_latency(times)}
+
+
+BENCHES = {
+    "extract": bench_extract, "check": bench_check, "download": bench_download, "e2e": bench_e2e, "pack": bench_pack,
+    "library": bench_library,
+}
+
+
+# -------------------------
+# Driver
+# -------------------------
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    from fixtures import FixtureServer, FixtureSite
+
+    site = FixtureSite(
+        pages=args.pages,
+        images_per_page=args.images_per_page,
+        image_kb=tuple(int(x) for x in args.image_kb.split(",")),
+        latency_ms=args.latency_ms,
+    )
+    results: Dict[str, Any] = {}
+    with FixtureServer(site) as server:
+        for name in args.scenarios.split(","):
+            cmd = [sys.executable, __file__, "--child", name, "--base-url", server.base_url] + _shared_argv(args)
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            if out.returncode != 0:
+                results[name] = {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+            else:
+                results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{name:9s} {json.dumps(results[name])}", file=sys.stderr)
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {k: getattr(args, k) for k in ("pages", "images_per_page", "image_kb", "latency_ms", "concurrency", "pack_images", "pack_workers", "library_runs")},
+        "results": results,
+    }
+
+
+def _shared_argv(args: argparse.Namespace) -> List[str]:
+    return [
+        "--pages", str(args.pages),
+        "--images-per-page", str(args.images_per_page),
+        "--image-kb", args.image_kb,
+        "--latency-ms", str(args.latency_ms),
+        "--concurrency", str(args.concurrency),
+        "--pack-images", str(args.pack_images),
+        "--pack-workers", str(args.pack_workers),
+        "--library-runs", str(args.library_runs),
+    ]
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Prints metric changes and returns the regressions beyond tolerance."""
+    regressions: List[str] = []
+    if current.get("params") != baseline.get("params"):
+        print("note: params differ from the baseline; comparison is indicative only", file=sys.stderr)
+    print(f"{'metric':32s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for scenario, metrics in current["results"].items():
+        base = baseline.get("results", {}).get(scenario, {})
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            higher = metric.endswith(HIGHER_IS_BETTER)
+            lower = metric.endswith(LOWER_IS_BETTER)
+            if not (higher or lower) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            worse = -change if higher else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{scenario + '.' + metric:32s} {old:12.2f} {value:12.2f} {change:+8.1%}{flag}")
+            if flag:
+                regressions.append(f"{scenario}.{metric} {change:+.1%}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Local throughput benchmarks (no network).")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--pages", type=int, default=20)
+    ap.add_argument("--images-per-page", type=int, default=8)
+    ap.add_argument("--image-kb", default="60,250,1000", help="comma-separated image sizes, cycled")
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="server time to first byte")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--pack-images", type=int, default=24, help="images rendered by the pack scenario")
+    ap.add_argument("--pack-workers", type=int, default=0, help="pack render processes (0 = all cores)")
+    ap.add_argument("--library-runs", type=int, default=1000, help="synthetic runs indexed by the library scenario")
+    ap.add_argument("--out", type=Path, default=None, help="write results JSON here")
+    ap.add_argument("--compare", type=Path, default=None, help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression (0.15 = 15%%)")
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--base-url", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        metrics = BENCHES[args.child](args.base_url, args)
+        metrics["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        print(json.dumps(metrics))
+        return 0
+
+    report = run_suite(args)
+    out = args.out or ROOT / "benchmarks" / "results" / f"{datetime.utcnow():%Y-%m-%d_%H%M%S}_{report['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(str(out))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import os
+import re
+
+import metrics
+from extractors import PageExtract, extract_page
+from http_cache import PageCache
+from result_store import canonicalize_url
+
+DEFAULT_CRAWL_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "10"))
+DEFAULT_CRAWL_DEPTH = 10  # a "next" chain is one hop per page, so depth must allow max_pages - 1 hops
+DEFAULT_CRAWL_WORKERS = 4
+DIGITS_RE = re.compile(r"\d+")
+PAGE_PARAMS = {"page", "p", "slide"}
+# Second-level labels under which the registrable domain has three labels (example.co.uk)
+SECOND_LEVEL_LABELS = {"co", "com", "net", "org", "ac", "gov", "edu", "ne", "or"}
+
+
+@dataclass
+class CrawlResult:
+    candidates: List[str] = field(default_factory=list)  # ordered by page, then rank; deduped
+    pages: List[str] = field(default_factory=list)       # pages fetched, in crawl order
+    errors: Dict[str, str] = field(default_factory=dict)  # page url -> error
+
+
+def site_of(url: str) -> str:
+    """Registrable domain, approximately: the last two host labels (three for example.co.uk)."""
+    labels = (urlsplit(url).hostname or "").lower().split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _adjacent_segment(seg_a: str, seg_b: str) -> bool:
+    """Same text around the numbers, and exactly one number that is off by one (look-2 / look-3)."""
+    if DIGITS_RE.split(seg_a) != DIGITS_RE.split(seg_b):
+        return False
+    diffs = [(int(x), int(y)) for x, y in zip(DIGITS_RE.findall(seg_a), DIGITS_RE.findall(seg_b)) if x != y]
+    return len(diffs) == 1 and abs(diffs[0][0] - diffs[0][1]) == 1
+
+
+def is_numbered_sibling(url: str, other: str) -> bool:
+    """
+    True when other is the previous / next page of url: the number in the last path segment
+    (/look-2 vs /look-3, /collection vs /collection/2) or in a page-like query parameter
+    (?page=1 vs ?page=2) moves by one, and nothing else changes. Other numbers in a URL
+    (seasons, years, article ids) are not pagination.
+    """
+    a, b = urlsplit(url), urlsplit(other)
+    if a.hostname != b.hostname:
+        return False
+    path_a, path_b = a.path.rstrip("/"), b.path.rstrip("/")
+    qa, qb = dict(parse_qsl(a.query)), dict(parse_qsl(b.query))
+    if path_a == path_b:
+        changed = [k for k in set(qa) | set(qb) if qa.get(k) != qb.get(k)]
+        if len(changed) != 1 or changed[0].lower() not in PAGE_PARAMS:
+            return False
+        na, nb = qa.get(changed[0], "1"), qb.get(changed[0], "1")  # no parameter = page 1
+        return na.isdigit() and nb.isdigit() and abs(int(na) - int(nb)) == 1
+    if qa != qb:
+        return False
+    if path_b == path_a + "/2" or path_a == path_b + "/2":
+        return True  # page 1 often has no number at all
+    head_a, _, seg_a = path_a.rpartition("/")
+    head_b, _, seg_b = path_b.rpartition("/")
+    return head_a == head_b and _adjacent_segment(seg_a, seg_b)
+
+
+def pagination_links(page_url: str, page: PageExtract) -> List[str]:
+    """rel="next" / "Next ›" targets first, then same-host links to the page before / after (see is_numbered_sibling)."""
+    out = list(page.next_links)
+    out.extend(u for u in page.links if u not in out and is_numbered_sibling(page_url, u))
+    return out
+
+
+def crawl_gallery(
+    start_url: str,
+    max_pages: int = DEFAULT_CRAWL_PAGES,
+    max_depth: int = DEFAULT_CRAWL_DEPTH,
+    max_images: int = 40,
+    max_workers: int = DEFAULT_CRAWL_WORKERS,
+    same_site: bool = True,
+    cache: Optional[PageCache] = None,
+    slot: Optional[Callable[[str], object]] = None,
+    on_page: Optional[Callable[[str, PageExtract], None]] = None,
+) -> CrawlResult:
+    """
+    Follows a gallery's pagination (slides, "next" pages) from start_url and pools the image candidates.
+    - Bounded: at most max_pages fetched, max_depth link hops from start_url, same site by default
+    - Only pagination links are followed (see pagination_links), never the whole site
+    - A visited set on canonical URLs (fragments dropped) keeps each page to one fetch
+    - Up to max_workers pages in flight; slot(url) is entered around each fetch
+      (pass HostLimiter.slot to share the pipeline's politeness budget)
+    - A failing start page raises; later failures are recorded in errors and skipped
+    """
+    result = CrawlResult()
+    seen_candidates: set = set()
+    visited = {canonicalize_url(start_url)}
+    frontier: Deque[Tuple[str, int]] = deque([(start_url, 0)])
+    by_page: Dict[str, List[str]] = {}
+    site = site_of(start_url)
+
+    def fetch(url: str) -> PageExtract:
+        with (slot(url) if slot is not None else nullcontext()):
+            return extract_page(url, max_images=max_images, cache=cache, want_links=True)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="crawl")
+    inflight: Dict[Future, Tuple[str, int]] = {}
+    try:
+        with metrics.timer("crawl_seconds"):
+            while frontier or inflight:
+                while frontier and len(inflight) < max(1, max_workers):
+                    url, depth = frontier.popleft()
+                    inflight[pool.submit(metrics.propagate(fetch), url)] = (url, depth)
+                    result.pages.append(url)
+                done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    url, depth = inflight.pop(fut)
+                    try:
+                        page = fut.result()
+                    except Exception as e:
+                        if url == start_url:
+                            raise
+                        result.errors[url] = str(e)
+                        continue
+                    by_page[url] = page.candidates
+                    if on_page is not None:
+                        on_page(url, page)
+                    if depth >= max_depth:
+                        continue
+                    for link in pagination_links(url, page):
+                        key = canonicalize_url(link)
+                        if key in visited or len(visited) >= max_pages:
+                            continue
+                        if same_site and site_of(link) != site:
+                            continue
+                        visited.add(key)
+                        frontier.append((link, depth + 1))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Crawl order, not completion order, so results are stable across runs
+    for url in result.pages:
+        for c in by_page.get(url, []):
+            if c not in seen_candidates:
+                seen_candidates.add(c)
+                result.candidates.append(c)
+    metrics.inc("crawl_pages_total", len(result.pages))
+    return result
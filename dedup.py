@@ -0,0 +1,141 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
+
+from packer import AssetRecord
+
+HASH_SIZE = 8          # 8x8 low-frequency DCT block -> 64-bit hash
+DEFAULT_THRESHOLD = 6  # max Hamming distance (of 64 bits) to count as the same image
+BLOCK_ROWS = 512       # rows compared per NumPy batch
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(x)
+    return _POPCOUNT[x[..., None].view(np.uint8)].sum(axis=-1, dtype=np.uint16)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0, :] = np.sqrt(1.0 / n)
+    return m
+
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+
+
+@dataclass
+class ImageHash:
+    path: str
+    bits: np.ndarray  # packed uint8[8]
+    width: int
+    height: int
+    size: int
+
+
+def phash_file(path: str) -> Optional[ImageHash]:
+    """DCT perceptual hash of an image file, or None if Pillow can't read it."""
+    side = HASH_SIZE * 4
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+            im.draft("L", (side * 2, side * 2))  # JPEG: decode at reduced scale
+            px = np.asarray(im.convert("L").resize((side, side), Image.LANCZOS), dtype=np.float64)
+        size = Path(path).stat().st_size
+    except Exception:
+        return None
+    coeffs = (_DCT @ px @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    flat = coeffs.flatten()
+    bits = flat > np.median(flat[1:])
+    return ImageHash(path, np.packbits(bits), width, height, size)
+
+
+def near_duplicate_pairs(hashes: np.ndarray, threshold: int = DEFAULT_THRESHOLD) -> np.ndarray:
+    """
+    Returns (i, j) index pairs with i < j whose Hamming distance is <= threshold.
+    hashes is an (n, 8) uint8 array; rows are compared in blocks to bound memory.
+    """
+    n = len(hashes)
+    words = np.ascontiguousarray(hashes, dtype=np.uint8).view(np.uint64).ravel()
+    found: List[np.ndarray] = []
+    for start in range(0, n, BLOCK_ROWS):
+        xor = words[start:start + BLOCK_ROWS, None] ^ words[None, :]
+        dist = _popcount64(xor)
+        rows, cols = np.nonzero(dist <= threshold)
+        rows = rows + start
+        keep = cols > rows
+        if keep.any():
+            found.append(np.stack([rows[keep], cols[keep]], axis=1))
+    return np.concatenate(found) if found else np.empty((0, 2), dtype=np.int64)
+
+
+def cluster_duplicates(items: List[ImageHash], threshold: int = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """Groups near-duplicate images (union-find over matching pairs); singletons are omitted."""
+    if len(items) < 2:
+        return []
+    hashes = np.stack([it.bits for it in items])
+    parent = list(range(len(items)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in near_duplicate_pairs(hashes, threshold):
+        ri, rj = find(int(i)), find(int(j))
+        if ri != rj:
+            parent[rj] = ri
+
+    groups: Dict[int, List[int]] = {}
+    for idx in range(len(items)):
+        groups.setdefault(find(idx), []).append(idx)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def dedupe_records(records: List[AssetRecord], threshold: int = DEFAULT_THRESHOLD, delete_files: bool = True) -> int:
+    """
+    Drops near-duplicate downloads across all records, keeping the highest-resolution
+    member of each cluster. Dropped files are removed from downloaded_files (and from
+    disk when delete_files) and listed in the notes of every record that owns them.
+    Returns the number of files dropped.
+    """
+    # One file can belong to several records: pages that share an image link the same path
+    owners: Dict[str, List[AssetRecord]] = {}
+    items: List[ImageHash] = []
+    for rec in records:
+        for f in rec.downloaded_files:
+            if f in owners:
+                owners[f].append(rec)
+                continue
+            owners[f] = [rec]
+            h = phash_file(f)
+            if h is not None:
+                items.append(h)
+
+    dropped_total = 0
+    for group in cluster_duplicates(items, threshold):
+        members = sorted((items[i] for i in group), key=lambda h: (h.width * h.height, h.size), reverse=True)
+        keeper = members[0]
+        for dup in members[1:]:
+            note = f"Dropped near-duplicate {Path(dup.path).name} ({dup.width}x{dup.height}) of {Path(keeper.path).name} ({keeper.width}x{keeper.height})."
+            for rec in owners[dup.path]:
+                if dup.path not in rec.downloaded_files:
+                    continue  # same record listed the path twice
+                rec.downloaded_files = [f for f in rec.downloaded_files if f != dup.path]
+                rec.notes = f"{rec.notes} {note}".strip() if rec.notes else note
+            if delete_files:
+                try:
+                    Path(dup.path).unlink(missing_ok=True)
+                except Exception:
+                    pass
+            dropped_total += 1
+    return dropped_total
+
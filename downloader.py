@@ -1,11 +1,26 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Iterator, Optional
 from pathlib import Path
 from urllib.parse import urlparse
+import functools
 import hashlib
+import time
+
 import requests
 
+import metrics
+from http_client import get_session, request_timeout
+from validate import sniff_image_ext, sniff_image_size
+from asset_store import AssetStore, BlobRef
+from rate_limit import parse_retry_after
+
+SNIFF_BYTES = 32
+PIXEL_SNIFF_BYTES = 64 * 1024  # how far to read looking for width/height before giving up
+DEFAULT_MAX_MB = 40
+# Raised to the caller instead of becoming a failed DownloadResult, so rate_limit.retry_call can retry them
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
 
 @dataclass
 class DownloadResult:
@@ -14,6 +29,41 @@ class DownloadResult:
     reason: str
     content_type: str = ""
     bytes_written: int = 0
+    status: int = 0
+    final_url: str = ""
+    retry_after: float = 0.0  # seconds, from a 429 / 503 Retry-After header
+
+
+def _outcome(res: DownloadResult) -> str:
+    if res.ok:
+        return "reused" if res.reason == "Reused from store" else "ok"
+    if res.reason == "HTTP error":
+        return "http_error"
+    if res.reason.startswith("Skipped"):
+        return "skipped"
+    if res.reason.startswith("Not an image"):
+        return "not_image"
+    return "failed"
+
+
+def _instrumented(fn: Callable[..., DownloadResult]) -> Callable[..., DownloadResult]:
+    """Records image_download_seconds{outcome}; bytes are counted for network downloads only."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs) -> DownloadResult:
+        t0 = time.perf_counter()
+        try:
+            res = fn(*args, **kwargs)
+        except TRANSIENT_ERRORS:
+            metrics.observe("image_download_seconds", time.perf_counter() - t0, outcome="transport_error")
+            raise
+        outcome = _outcome(res)
+        metrics.observe("image_download_seconds", time.perf_counter() - t0, outcome=outcome)
+        if outcome == "ok":
+            metrics.inc("image_download_bytes_total", res.bytes_written)
+        return res
+
+    return wrapper
 
 
 def _safe_ext_from_content_type(ct: str) -> str:
@@ -33,54 +83,239 @@ def _filename_from_url(url: str) -> str:
     return name if name else ""
 
 
-def download_image(url: str, out_dir: Path, base_name: str, min_kb: int = 30, timeout: int = 25) -> DownloadResult:
+def _ext_from_url(url: str) -> str:
+    from_url = _filename_from_url(url).lower()
+    if from_url.endswith((".jpg", ".jpeg")):
+        return ".jpg"
+    if from_url.endswith(".png"):
+        return ".png"
+    if from_url.endswith(".webp"):
+        return ".webp"
+    return ""
+
+
+def _read_head(chunks: Iterator[bytes], min_width: int = 0, min_height: int = 0) -> bytes:
+    """
+    Reads just enough of the body to identify the format and, when a pixel rule
+    is set, the dimensions (up to PIXEL_SNIFF_BYTES).
+    """
+    want_size = bool(min_width or min_height)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) < SNIFF_BYTES:
+            continue
+        if not want_size or len(head) >= PIXEL_SNIFF_BYTES or sniff_image_size(head) is not None:
+            break
+    return head
+
+
+def _too_few_pixels(head: bytes, min_width: int, min_height: int) -> str:
+    """Skip reason when the header shows the image is below the pixel rule, else ""."""
+    if not (min_width or min_height):
+        return ""
+    size = sniff_image_size(head)
+    if size is None:
+        return ""
+    w, h = size
+    if w < min_width or h < min_height:
+        return f"Skipped: too small ({w}x{h} px)."
+    return ""
+
+
+@_instrumented
+def download_image(
+    url: str,
+    out_dir: Path,
+    base_name: str,
+    min_kb: int = 30,
+    timeout: int = 25,
+    min_width: int = 0,
+    min_height: int = 0,
+) -> DownloadResult:
     """
     Downloads an image URL to out_dir.
-    - Skips tiny files (icons/thumbnails) using min_kb threshold
+    - Skips tiny files (icons/thumbnails) using min_kb threshold, from Content-Length when it is sent
+    - Skips images below min_width x min_height from the header, before writing anything
     - Uses content-type to pick extension
+    - Writes to a .part file and only keeps it when the download passes min_kb
+    - Connection errors and timeouts are raised (TRANSIENT_ERRORS); other failures are returned
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; PortfolioAssetFinder/1.0)"}
+    tmp_path: Optional[Path] = None
 
     try:
-        r = requests.get(url, headers=headers, stream=True, timeout=timeout)
-        r.raise_for_status()
-        ct = r.headers.get("Content-Type", "")
-
-        ext = _safe_ext_from_content_type(ct)
-        if not ext:
-            # fallback from URL name
-            from_url = _filename_from_url(url).lower()
-            if from_url.endswith((".jpg", ".jpeg")):
-                ext = ".jpg"
-            elif from_url.endswith(".png"):
-                ext = ".png"
-            elif from_url.endswith(".webp"):
-                ext = ".webp"
-
-        if not ext:
-            return DownloadResult(False, None, "Not an image (content-type not recognized).", ct, 0)
-
-        h = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
-        filename = f"{base_name}_{h}{ext}"
-        path = out_dir / filename
-
-        total = 0
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if not chunk:
-                    continue
-                f.write(chunk)
-                total += len(chunk)
-
-        if total < (min_kb * 1024):
+        with get_session().get(url, stream=True, timeout=request_timeout(timeout)) as r:
+            ct = r.headers.get("Content-Type", "")
+            if r.status_code >= 400:
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                return DownloadResult(False, None, "HTTP error", ct, 0, r.status_code, r.url, retry_after)
+
+            ext = _safe_ext_from_content_type(ct)
+            if not ext:
+                # fallback from URL name
+                ext = _ext_from_url(url)
+
+            if not ext:
+                return DownloadResult(False, None, "Not an image (content-type not recognized).", ct, 0)
+
+            length = int(r.headers.get("Content-Length") or 0)
+            if "image/" in ct.lower() and 0 < length < min_kb * 1024 and not r.headers.get("Content-Encoding"):
+                return DownloadResult(False, None, f"Skipped: too small ({length/1024:.1f} KB).", ct, 0)
+
+            chunks = r.iter_content(chunk_size=8192)
+            head = _read_head(chunks, min_width, min_height)
+            too_few = _too_few_pixels(head, min_width, min_height)
+            if too_few:
+                return DownloadResult(False, None, too_few, ct, 0)
+
+            h = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+            filename = f"{base_name}_{h}{ext}"
+            path = out_dir / filename
+            tmp_path = path.with_name(path.name + ".part")
+
+            total = len(head)
+            with open(tmp_path, "wb") as f:
+                f.write(head)
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    total += len(chunk)
+
+            if total < (min_kb * 1024):
+                tmp_path.unlink(missing_ok=True)
+                return DownloadResult(False, None, f"Skipped: too small ({total/1024:.1f} KB).", ct, total)
+
+            tmp_path.replace(path)
+            return DownloadResult(True, str(path), "Downloaded", ct, total)
+
+    except Exception as e:
+        if tmp_path is not None:
             try:
-                path.unlink(missing_ok=True)
+                tmp_path.unlink(missing_ok=True)
             except Exception:
                 pass
-            return DownloadResult(False, None, f"Skipped: too small ({total/1024:.1f} KB).", ct, total)
+        if isinstance(e, TRANSIENT_ERRORS):
+            raise
+        return DownloadResult(False, None, f"Download failed: {e}", "", 0)
+
+
+@_instrumented
+def fetch_image(
+    url: str,
+    out_dir: Path,
+    base_name: str,
+    min_kb: int = 30,
+    max_mb: int = DEFAULT_MAX_MB,
+    timeout: int = 25,
+    store: Optional[AssetStore] = None,
+    min_width: int = 0,
+    min_height: int = 0,
+) -> DownloadResult:
+    """
+    Validates and downloads an image with a single streamed GET (no HEAD round trip).
+    - Decides from the response headers + first bytes whether the body is an image
+    - Aborts early on HTTP errors, non-images, and bodies over max_mb
+    - Aborts after the header when the image is below min_width x min_height
+    - Writes to a .part file and only keeps it when the download passes min_kb
+    - With a store: known URLs are linked from the store without any request,
+      new bodies are hashed while streaming and linked into out_dir
+    Reasons match check_image_url() / download_image(); connection errors and timeouts
+    are raised (TRANSIENT_ERRORS), as in download_image().
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    max_bytes = max_mb * 1024 * 1024
+    min_bytes = min_kb * 1024
+
+    if store is not None:
+        known = store.lookup(url)
+        if known is not None:
+            if known.size < min_bytes:
+                return DownloadResult(False, None, f"Skipped: too small ({known.size/1024:.1f} KB).", known.content_type, known.size, 200, url)
+            if min_width or min_height:
+                with open(store.blob_path(known.digest, known.ext), "rb") as f:
+                    too_few = _too_few_pixels(f.read(PIXEL_SNIFF_BYTES), min_width, min_height)
+                if too_few:
+                    return DownloadResult(False, None, too_few, known.content_type, 0, 200, url)
+            path = store.link_into(known, out_dir, base_name)
+            return DownloadResult(True, str(path), "Reused from store", known.content_type, known.size, 200, url)
 
-        return DownloadResult(True, str(path), "Downloaded", ct, total)
+    status = 0
+    final_url = url
+    ct = ""
+    tmp_path: Optional[Path] = None
+
+    try:
+        with get_session().get(url, stream=True, allow_redirects=True, timeout=request_timeout(timeout)) as r:
+            status = r.status_code
+            final_url = r.url
+            ct = (r.headers.get("Content-Type") or "").lower()
+            if status >= 400:
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                return DownloadResult(False, None, "HTTP error", ct, 0, status, final_url, retry_after)
+
+            length = int(r.headers.get("Content-Length") or 0)
+            if length > max_bytes:
+                return DownloadResult(False, None, f"Skipped: too large ({length/1024/1024:.1f} MB).", ct, 0, status, final_url)
+            if "image/" in ct and 0 < length < min_bytes and not r.headers.get("Content-Encoding"):
+                return DownloadResult(False, None, f"Skipped: too small ({length/1024:.1f} KB).", ct, 0, status, final_url)
+
+            chunks = r.iter_content(chunk_size=8192)
+            head = _read_head(chunks, min_width, min_height)
+
+            ext = sniff_image_ext(head)
+            if not ext:
+                if "image/" not in ct:
+                    return DownloadResult(False, None, "Not an image content-type", ct, 0, status, final_url)
+                ext = _safe_ext_from_content_type(ct) or _ext_from_url(final_url)
+            if not ext:
+                return DownloadResult(False, None, "Not an image (content-type not recognized).", ct, 0, status, final_url)
+            too_few = _too_few_pixels(head, min_width, min_height)
+            if too_few:
+                return DownloadResult(False, None, too_few, ct, 0, status, final_url)
+
+            h = hashlib.sha1(final_url.encode("utf-8")).hexdigest()[:10]
+            path = out_dir / f"{base_name}_{h}{ext}"
+            tmp_path = store.temp_path() if store is not None else path.with_name(path.name + ".part")
+
+            digest = hashlib.sha256(head)
+            total = len(head)
+            with open(tmp_path, "wb") as f:
+                f.write(head)
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    total += len(chunk)
+                    if total > max_bytes:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            if total > max_bytes:
+                tmp_path.unlink(missing_ok=True)
+                return DownloadResult(False, None, f"Skipped: too large (> {max_mb} MB).", ct, 0, status, final_url)
+            if total < min_bytes:
+                tmp_path.unlink(missing_ok=True)
+                return DownloadResult(False, None, f"Skipped: too small ({total/1024:.1f} KB).", ct, total, status, final_url)
+
+            if store is not None:
+                ref = BlobRef(digest.hexdigest(), ext, total, ct)
+                store.ingest(tmp_path, ref)
+                store.remember(url, ref)
+                if final_url != url:
+                    store.remember(final_url, ref)
+                path = store.link_into(ref, out_dir, base_name)
+            else:
+                tmp_path.replace(path)
+            return DownloadResult(True, str(path), "Downloaded", ct, total, status, final_url)
 
     except Exception as e:
-        return DownloadResult(False, None, f"Download failed: {e}", "", 0)
+        if tmp_path is not None:
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+        if isinstance(e, TRANSIENT_ERRORS):
+            raise
+        return DownloadResult(False, None, f"Download failed: {e}", ct, 0, status, final_url)
@@ -1,55 +1,485 @@
 from __future__ import annotations
-from typing import List, Set
-from urllib.parse import urljoin
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+import json
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+import metrics
+from http_client import get_session, request_timeout
+from http_cache import PageCache
 
 IMAGE_EXT_RE = re.compile(r"\.(jpg|jpeg|png|webp)(\?|$)", re.IGNORECASE)
+SIZES_LENGTH_RE = re.compile(r"([\d.]+)\s*(px|vw)\s*$", re.IGNORECASE)
+DOWNLOADABLE_TYPES = ("image/jpeg", "image/jpg", "image/png", "image/webp")
+DEFAULT_VIEWPORT_PX = 1920
+HIGH_QUALITY_MIN_WIDTH = 800
+DEFAULT_MAX_PAGE_BYTES = 4 * 1024 * 1024
+STREAM_CHUNK_BYTES = 64 * 1024
+MAX_JSON_BLOB_BYTES = 8 * 1024 * 1024
+MAX_JSON_NODES = 200_000     # per blob; a runaway app state shouldn't stall a page worker
+MAX_LINKS_PER_PAGE = 500
+# JSON keys whose string value is an image even without an image extension (CDN URLs often lack one)
+JSON_IMAGE_KEYS = {"image", "images", "contenturl", "thumbnailurl", "imageurl", "image_url", "src", "srcurl"}
+JSON_URL_KEYS = ("contentUrl", "url", "src", "href")
+NEXT_TEXT_RE = re.compile(r"^\s*(next|next page|next slide|older|more|load more|›|»|→|>)\s*$", re.IGNORECASE)
+
+
+@dataclass
+class SrcCandidate:
+    url: str
+    width: float = 0.0    # from a "w" descriptor (or estimated from "x")
+    density: float = 0.0  # from an "x" descriptor
+
 
 def is_probably_image_url(url: str) -> bool:
     return bool(IMAGE_EXT_RE.search(url))
 
-def extract_image_urls_from_page(page_url: str, timeout: int = 20, max_images: int = 40) -> List[str]:
+
+def parse_srcset(srcset: str) -> List[SrcCandidate]:
     """
-    Fetches the page HTML and extracts candidate image URLs.
-    This will NOT work for pages that require JS rendering for content.
+    Parses a srcset attribute (HTML spec rules, so URLs may contain commas).
+    Returns one candidate per entry with its w / x descriptor.
+    """
+    out: List[SrcCandidate] = []
+    s = srcset or ""
+    i, n = 0, len(s)
+    while i < n:
+        while i < n and (s[i].isspace() or s[i] == ","):
+            i += 1
+        if i >= n:
+            break
+        start = i
+        while i < n and not s[i].isspace():
+            i += 1
+        url = s[start:i]
+        descriptor = ""
+        if url.endswith(","):
+            url = url.rstrip(",")
+        else:
+            start = i
+            depth = 0
+            while i < n:
+                c = s[i]
+                if c == "(":
+                    depth += 1
+                elif c == ")":
+                    depth = max(0, depth - 1)
+                elif c == "," and depth == 0:
+                    break
+                i += 1
+            descriptor = s[start:i].strip()
+        if not url:
+            continue
+
+        cand = SrcCandidate(url)
+        for d in descriptor.split():
+            try:
+                if d.endswith("w"):
+                    cand.width = float(d[:-1])
+                elif d.endswith("x"):
+                    cand.density = float(d[:-1])
+            except ValueError:
+                continue
+        if not cand.width and not cand.density:
+            cand.density = 1.0
+        out.append(cand)
+    return out
+
+
+def sizes_slot_px(sizes: str, viewport_px: int = DEFAULT_VIEWPORT_PX) -> float:
+    """
+    Width in px of the slot described by a sizes attribute, using its final
+    (unconditional) entry, e.g. "(max-width: 600px) 100vw, 50vw" -> viewport / 2.
+    """
+    if not sizes:
+        return float(viewport_px)
+    last = sizes.split(",")[-1].strip()
+    m = SIZES_LENGTH_RE.search(last)
+    if not m:
+        return float(viewport_px)
+    value, unit = float(m.group(1)), m.group(2).lower()
+    return value if unit == "px" else viewport_px * value / 100.0
+
+
+def _attr_px(value) -> float:
+    try:
+        return float(str(value).strip().rstrip("px"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def best_candidate(cands: List[SrcCandidate]) -> Optional[SrcCandidate]:
+    """Widest candidate (first one wins ties)."""
+    best: Optional[SrcCandidate] = None
+    for c in cands:
+        if best is None or c.width > best.width:
+            best = c
+    return best
+
+
+def _img_group_candidates(img: Mapping[str, str], sources: List[Mapping[str, str]], page_url: str) -> List[SrcCandidate]:
     """
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; PortfolioAssetFinder/1.0)"}
-    resp = requests.get(page_url, headers=headers, timeout=timeout)
-    resp.raise_for_status()
+    Every variant of one logical image: <img> src/srcset plus its <picture> <source>s.
+    x descriptors are converted to widths using the width attribute or sizes slot.
+    """
+    slot = _attr_px(img.get("width")) or sizes_slot_px(img.get("sizes") or "")
+    cands: List[SrcCandidate] = []
+
+    for source in sources:
+        typ = (source.get("type") or "").lower()
+        if typ and typ not in DOWNLOADABLE_TYPES:
+            continue  # e.g. AVIF variants we can't store
+        src_slot = sizes_slot_px(source.get("sizes") or "") if source.get("sizes") else slot
+        for c in parse_srcset(source.get("srcset") or source.get("data-srcset") or ""):
+            if not c.width and c.density:
+                c.width = src_slot * c.density
+            cands.append(c)
+
+    for c in parse_srcset(img.get("srcset") or img.get("data-srcset") or ""):
+        if not c.width and c.density:
+            c.width = slot * c.density
+        cands.append(c)
+
+    src = img.get("src") or img.get("data-src")
+    if src and not src.startswith("data:"):
+        # Plain src is the fallback; with no width attribute it only wins when nothing else exists.
+        cands.append(SrcCandidate(src, width=_attr_px(img.get("width"))))
+
+    for c in cands:
+        c.url = urljoin(page_url, c.url)
+    return [c for c in cands if c.url.startswith("http")]
+
+
+class _Collector:
+    """Candidate URLs with their best-known width, shared by both parsing engines."""
+
+    def __init__(self, page_url: str):
+        self.page_url = page_url
+        self.found: Dict[str, float] = {}
+        self.high_quality = 0
+        self.parse_s = 0.0  # time spent in the parser, for the fetch / parse split in metrics
+        self.from_json = 0
+        # For the crawler: rel="next" / "Next ›" targets, and every same-host link in page order
+        self.next_links: List[str] = []
+        self.links: List[str] = []
+        self._link_set: set = set()
+
+    def add(self, url: str, width: float = 0.0) -> None:
+        if not url.startswith("http"):
+            return
+        prev = self.found.get(url)
+        if prev is None or width > prev:
+            if width >= HIGH_QUALITY_MIN_WIDTH and (prev is None or prev < HIGH_QUALITY_MIN_WIDTH):
+                self.high_quality += 1
+            self.found[url] = width
+
+    def add_meta(self, attrs: Mapping[str, str]) -> None:
+        key = attrs.get("property") or attrs.get("name") or ""
+        if key in ("og:image", "twitter:image") and attrs.get("content"):
+            self.add(urljoin(self.page_url, attrs["content"]))
+
+    def add_img(self, img: Mapping[str, str], sources: List[Mapping[str, str]]) -> None:
+        best = best_candidate(_img_group_candidates(img, sources, self.page_url))
+        if best is not None:
+            self.add(best.url, best.width)
+
+    def add_json(self, text: str) -> None:
+        """Image URLs from an embedded JSON blob (JSON-LD, __NEXT_DATA__ and similar app state)."""
+        if len(text) > MAX_JSON_BLOB_BYTES:
+            return
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return
+        before = len(self.found)
+        stack: List[Tuple[Any, str]] = [(data, "")]
+        nodes = 0
+        while stack and nodes < MAX_JSON_NODES:
+            node, key = stack.pop()
+            nodes += 1
+            if isinstance(node, dict):
+                width = node.get("width")
+                if isinstance(width, (int, float)) and not isinstance(width, bool):
+                    for k in JSON_URL_KEYS:
+                        url = node.get(k)
+                        if isinstance(url, str) and (is_probably_image_url(url) or node.get("@type") == "ImageObject"):
+                            self.add(urljoin(self.page_url, url), float(width))
+                            break
+                if node.get("@type") == "ImageObject":
+                    url = node.get("contentUrl") or node.get("url")
+                    if isinstance(url, str):
+                        self.add(urljoin(self.page_url, url))
+                stack.extend((v, k.lower()) for k, v in node.items() if isinstance(v, (dict, list, str)))
+            elif isinstance(node, list):
+                stack.extend((v, key) for v in node if isinstance(v, (dict, list, str)))
+            elif node.startswith(("http://", "https://", "//", "/")) and (
+                key in JSON_IMAGE_KEYS or is_probably_image_url(node)
+            ):
+                self.add(urljoin(self.page_url, node))
+        self.from_json += len(self.found) - before
+
+    def add_link(self, href: str, rel: str = "", text: str = "") -> None:
+        href = (href or "").strip()
+        if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")):
+            return
+        url = urljoin(self.page_url, href).split("#", 1)[0]
+        if not url.startswith("http"):
+            return
+        if "next" in rel.lower().split() or NEXT_TEXT_RE.match(text or ""):
+            if url not in self.next_links:
+                self.next_links.append(url)
+        if url not in self._link_set and len(self.links) < MAX_LINKS_PER_PAGE and (
+            urlsplit(url).hostname == urlsplit(self.page_url).hostname
+        ):
+            self._link_set.add(url)
+            self.links.append(url)
+
+    def ranked(self, max_images: int) -> List[str]:
+        # Prefer direct image URLs first, then the widest variants
+        clean = list(self.found)
+        clean.sort(key=lambda x: (not is_probably_image_url(x), -self.found[x]))
+        return clean[:max_images]
+
+
+class _StreamTarget:
+    """lxml parser target: sees start/end events only, never builds a tree."""
 
-    soup = BeautifulSoup(resp.text, "lxml")
-    found: Set[str] = set()
+    def __init__(self, collector: _Collector):
+        self.collector = collector
+        self.picture_depth = 0
+        self.sources: List[Dict[str, str]] = []
+        self.json_buf: Optional[List[str]] = None  # inside a JSON <script>
+        self.anchor: Optional[Tuple[str, str, List[str]]] = None  # (href, rel, text) of the open <a>
+
+    def start(self, tag, attrib) -> None:
+        if tag == "script":
+            if _is_json_script(attrib):
+                self.json_buf = []
+        elif tag == "a" and attrib.get("href"):
+            self.anchor = (attrib["href"], attrib.get("rel", ""), [])
+        elif tag == "link" and "next" in (attrib.get("rel") or "").lower().split():
+            self.collector.add_link(attrib.get("href", ""), "next")
+        elif tag == "meta":
+            self.collector.add_meta(attrib)
+        elif tag == "picture":
+            self.picture_depth += 1
+            self.sources = []
+        elif tag == "source" and self.picture_depth:
+            self.sources.append(dict(attrib))
+        elif tag == "img":
+            self.collector.add_img(attrib, self.sources if self.picture_depth else [])
+
+    def end(self, tag) -> None:
+        if tag == "picture" and self.picture_depth:
+            self.picture_depth -= 1
+            self.sources = []
+        elif tag == "script" and self.json_buf is not None:
+            self.collector.add_json("".join(self.json_buf))
+            self.json_buf = None
+        elif tag == "a" and self.anchor is not None:
+            href, rel, text = self.anchor
+            self.collector.add_link(href, rel, "".join(text)[:40])
+            self.anchor = None
+
+    def data(self, data) -> None:
+        if self.json_buf is not None:
+            self.json_buf.append(data)
+        elif self.anchor is not None and len(self.anchor[2]) < 8:
+            self.anchor[2].append(data)
+
+    def close(self) -> None:
+        return None
+
+
+def _is_json_script(attrib: Mapping[str, str]) -> bool:
+    script_type = (attrib.get("type") or "").lower()
+    return "json" in script_type or attrib.get("id") in ("__NEXT_DATA__", "__NUXT_DATA__")
+
+
+def _extract_with_soup(html, collector: _Collector) -> None:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
 
     # og:image
     og = soup.find("meta", property="og:image")
     if og and og.get("content"):
-        found.add(urljoin(page_url, og["content"]))
+        collector.add(urljoin(collector.page_url, og["content"]))
 
     # twitter:image
     tw = soup.find("meta", attrs={"name": "twitter:image"})
     if tw and tw.get("content"):
-        found.add(urljoin(page_url, tw["content"]))
+        collector.add(urljoin(collector.page_url, tw["content"]))
 
-    # <img src=""> and srcset
+    # <img> / <picture>: one best variant per image
     for img in soup.find_all("img"):
-        src = img.get("src")
-        if src:
-            found.add(urljoin(page_url, src))
-
-        srcset = img.get("srcset")
-        if srcset:
-            parts = [p.strip().split(" ")[0] for p in srcset.split(",") if p.strip()]
-            for p in parts:
-                found.add(urljoin(page_url, p))
-
-    # Filter
-    clean: List[str] = []
-    for u in found:
-        if u.startswith("http"):
-            clean.append(u)
-
-    # Prefer direct image URLs first
-    clean.sort(key=lambda x: (not is_probably_image_url(x), len(x)))
-    return clean[:max_images]
+        # find_parent: some parsers nest <img> inside an unclosed <source>
+        picture = img.find_parent("picture")
+        sources = [src.attrs for src in picture.find_all("source")] if picture is not None else []
+        collector.add_img(img.attrs, sources)
+
+    # Embedded JSON (JSON-LD, __NEXT_DATA__ ...) and links for the crawler
+    for script in soup.find_all("script"):
+        if _is_json_script(script.attrs):
+            collector.add_json(script.string or "")
+    for link in soup.find_all("link", href=True):
+        rel = " ".join(link.get("rel") or [])
+        if "next" in rel.lower().split():
+            collector.add_link(link["href"], rel)
+    for a in soup.find_all("a", href=True):
+        collector.add_link(a["href"], " ".join(a.get("rel") or []), a.get_text(" ", strip=True)[:40])
+
+
+def _extract_streaming(chunks: Iterable[bytes], collector: _Collector, max_images: int, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    Feeds the body chunks (a streamed response's iter_content) to an lxml target parser.
+    Stops after max_bytes, or once max_images high-quality candidates are found.
+    Returns the bytes read and whether the incremental parse succeeded; on failure
+    the rest of the body (up to max_bytes) is still read for the BeautifulSoup fallback.
+    """
+    from lxml import etree
+
+    parser = etree.HTMLParser(target=_StreamTarget(collector), recover=True)
+    ok = True
+    buf: List[bytes] = []
+    read = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        chunk = chunk[: max(0, max_bytes - read)]
+        buf.append(chunk)
+        read += len(chunk)
+        if ok:
+            t0 = time.perf_counter()
+            try:
+                parser.feed(chunk)
+            except Exception:
+                ok = False
+            collector.parse_s += time.perf_counter() - t0
+        if read >= max_bytes or (ok and collector.high_quality >= max_images):
+            break
+    if ok:
+        t0 = time.perf_counter()
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        except Exception:
+            ok = False
+        collector.parse_s += time.perf_counter() - t0
+    return b"".join(buf), ok
+
+
+def _parse_response(resp, page_url: str, mode: str, max_images: int, max_bytes: int) -> Tuple[_Collector, bytes]:
+    """Runs the selected engine on a streamed response; returns the collector and the bytes read."""
+    collector = _Collector(page_url)
+    if mode == "soup":
+        body = resp.content
+        t0 = time.perf_counter()
+        _extract_with_soup(body, collector)
+        collector.parse_s = time.perf_counter() - t0
+        return collector, body
+
+    body, ok = _extract_streaming(resp.iter_content(chunk_size=STREAM_CHUNK_BYTES), collector, max_images, max_bytes)
+    if not ok or not collector.found:
+        streamed_s = collector.parse_s
+        collector = _Collector(page_url)
+        t0 = time.perf_counter()
+        if body:
+            _extract_with_soup(body, collector)
+        collector.parse_s = streamed_s + time.perf_counter() - t0
+    return collector, body
+
+
+@dataclass
+class PageExtract:
+    candidates: List[str]
+    next_links: List[str] = field(default_factory=list)  # rel="next" / "Next" anchors
+    links: List[str] = field(default_factory=list)       # same-host links, in page order
+    from_json: int = 0  # candidates that came from embedded JSON
+
+
+def _cached_links(entry, page_url: str) -> PageExtract:
+    """Links re-read from a cached body (candidates come from the cache row)."""
+    collector = _Collector(page_url)
+    try:
+        body = entry.body_path.read_bytes()
+    except OSError:
+        body = b""
+    if body:
+        _extract_streaming([body], collector, max_images=10**9, max_bytes=len(body))
+    return PageExtract([], collector.next_links, collector.links)
+
+
+def extract_page(
+    page_url: str,
+    timeout: int = 20,
+    max_images: int = 40,
+    mode: str = "stream",
+    max_bytes: int = DEFAULT_MAX_PAGE_BYTES,
+    cache: Optional[PageCache] = None,
+    want_links: bool = False,
+) -> PageExtract:
+    """
+    Fetches the page HTML and extracts candidate image URLs (and, for the crawler, its links).
+    - Each <img> (with its <picture> sources) contributes only its largest srcset variant
+    - Image URLs in embedded JSON (JSON-LD, __NEXT_DATA__ style app state) are added too;
+      full galleries often live there rather than in the DOM
+    - mode="stream": incremental lxml parse of at most max_bytes, stopping early once
+      enough high-quality candidates are found; falls back to BeautifulSoup on failure
+    - mode="soup": full download + BeautifulSoup tree (the original engine)
+    - cache: fresh pages are served without a request; stale ones are revalidated and
+      a 304 reuses the stored candidate list. The stored body may be an early-stopped
+      prefix, so a request for more candidates than were stored refetches in full.
+    - want_links: on a cache hit, links are re-parsed from the stored body
+    This will NOT work for pages that require JS rendering for content.
+    """
+    entry = cache.get(page_url) if cache is not None else None
+    if entry is not None and entry.is_fresh() and entry.max_images >= max_images:
+        metrics.inc("page_cache_total", result="fresh")
+        out = _cached_links(entry, page_url) if want_links else PageExtract([])
+        out.candidates = entry.candidates[:max_images]
+        return out
+
+    reusable = entry is not None and entry.max_images >= max_images
+    headers = entry.validators() if reusable else {}
+    t0 = time.perf_counter()
+    with get_session().get(page_url, headers=headers, stream=True, timeout=request_timeout(timeout)) as resp:
+        if resp.status_code == 304 and reusable:
+            cache.refresh(page_url, resp.headers)
+            metrics.inc("page_cache_total", result="revalidated")
+            metrics.observe("page_fetch_seconds", time.perf_counter() - t0)
+            out = _cached_links(entry, page_url) if want_links else PageExtract([])
+            out.candidates = entry.candidates[:max_images]
+            return out
+
+        resp.raise_for_status()
+        collector, body = _parse_response(resp, page_url, mode, max_images, max_bytes)
+        resp_headers = resp.headers
+
+    # Parsing runs between chunk reads, so the network share is the remainder
+    metrics.observe("page_fetch_seconds", time.perf_counter() - t0 - collector.parse_s)
+    metrics.observe("page_parse_seconds", collector.parse_s, engine=mode)
+    metrics.inc("page_bytes_total", len(body))
+    if collector.from_json:
+        metrics.inc("page_json_candidates_total", collector.from_json)
+    if cache is not None:
+        metrics.inc("page_cache_total", result="miss")
+
+    candidates = collector.ranked(max_images)
+    if cache is not None:
+        cache.put(page_url, resp_headers, body, candidates, max_images)
+    return PageExtract(candidates, collector.next_links, collector.links, collector.from_json)
+
+
+def extract_image_urls_from_page(
+    page_url: str,
+    timeout: int = 20,
+    max_images: int = 40,
+    mode: str = "stream",
+    max_bytes: int = DEFAULT_MAX_PAGE_BYTES,
+    cache: Optional[PageCache] = None,
+) -> List[str]:
+    """Candidate image URLs of one page (see extract_page)."""
+    return extract_page(page_url, timeout, max_images, mode, max_bytes, cache).candidates
@@ -0,0 +1,199 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+import os
+import threading
+import time
+
+import metrics
+from result_store import canonicalize_url
+from search_providers import BaseSearchProvider, SearchResult
+
+DEFAULT_HEDGE_S = float(os.environ.get("SEARCH_HEDGE_S", "2.0"))  # hedge delay until enough latencies are seen
+HEDGE_QUANTILE = 0.95
+MIN_HEDGE_S = 0.25
+LATENCY_WINDOW = 50   # recent primary latencies the p95 budget is computed from
+MIN_SAMPLES = 5
+MERGE_GRACE_S = float(os.environ.get("SEARCH_MERGE_GRACE_S", "0.3"))
+DEFAULT_TIMEOUT_S = float(os.environ.get("SEARCH_TIMEOUT_S", "30"))  # per call, across both backends
+RRF_K = 60  # reciprocal rank fusion constant (Cormack et al.); damps the weight of the top ranks
+
+
+def fuse_ranked(lists: Sequence[List[SearchResult]], weights: Optional[Sequence[float]] = None) -> List[SearchResult]:
+    """
+    Reciprocal rank fusion: score(url) = sum(weight / (RRF_K + rank)) over the lists it appears in.
+    - Results are deduped by canonical URL; the first list's copy wins, with empty
+      fields (image_url, thumbnail_url, snippet) filled in from the others
+    - Ties keep the order of the first list, then the next
+    """
+    weights = list(weights or [1.0] * len(lists))
+    scores: Dict[str, float] = {}
+    best: Dict[str, SearchResult] = {}
+    order: Dict[str, int] = {}
+    for li, results in enumerate(lists):
+        for rank, r in enumerate(results, start=1):
+            key = canonicalize_url(r.url)
+            if not key:
+                continue
+            scores[key] = scores.get(key, 0.0) + weights[li] / (RRF_K + rank)
+            if key not in best:
+                best[key] = r
+                order[key] = len(order)
+            else:
+                kept = best[key]
+                best[key] = replace(
+                    kept,
+                    image_url=kept.image_url or r.image_url,
+                    thumbnail_url=kept.thumbnail_url or r.thumbnail_url,
+                    snippet=kept.snippet or r.snippet,
+                )
+    return [best[k] for k in sorted(best, key=lambda k: (-scores[k], order[k]))]
+
+
+class FederatedSearchProvider(BaseSearchProvider):
+    """
+    Queries a primary and a secondary provider with hedged requests.
+    - The primary is asked first; if it hasn't answered within its recent p95 latency
+      (hedge_s until enough calls were seen), the same query goes to the secondary
+    - The first successful answer is returned, merged with the other one if that lands
+      within merge_grace_s; results are deduped by URL and rank-fused (primary weighted higher)
+    - A failing primary hands over to the secondary at once; the primary's error is
+      raised only when both fail
+    - A call gives up with TimeoutError after timeout_s without a successful answer,
+      so it stays bounded without a caller-side timeout
+    - Calls that lose the race are not cancelled (HTTP clients can't be), they finish in the background
+    Each backend keeps its own throttle / quota wrapper; put the cache around this provider.
+    """
+
+    def __init__(
+        self,
+        primary: BaseSearchProvider,
+        secondary: BaseSearchProvider,
+        hedge_s: float = DEFAULT_HEDGE_S,
+        merge_grace_s: float = MERGE_GRACE_S,
+        primary_weight: float = 1.0,
+        secondary_weight: float = 0.8,
+        max_workers: int = 8,
+        timeout_s: float = DEFAULT_TIMEOUT_S,
+    ):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_s = hedge_s
+        self.merge_grace_s = merge_grace_s
+        self.weights = (primary_weight, secondary_weight)
+        self.timeout_s = timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=max(2, max_workers), thread_name_prefix="federated")
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.secondary_wins = 0
+        self.merged = 0
+        self.failovers = 0
+
+    @property
+    def provider_name(self) -> str:
+        names = [getattr(p, "provider_name", type(p).__name__) for p in (self.primary, self.secondary)]
+        return "Federated(" + "+".join(names) + ")"
+
+    def hedge_delay(self) -> float:
+        """The primary's recent p95 latency (hedge_s until MIN_SAMPLES calls have finished)."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_SAMPLES:
+            return self.hedge_s
+        return max(MIN_HEDGE_S, samples[min(len(samples) - 1, int(HEDGE_QUANTILE * len(samples)))])
+
+    def _submit_primary(self, call: Callable[[BaseSearchProvider], List[SearchResult]]) -> Future:
+        t0 = time.perf_counter()
+        fut = self._pool.submit(metrics.propagate(call), self.primary)
+
+        def record(f: Future) -> None:
+            # Also recorded when the hedge won, so slow primaries keep raising the budget
+            if f.exception() is None:
+                with self._lock:
+                    self._latencies.append(time.perf_counter() - t0)
+
+        fut.add_done_callback(record)
+        return fut
+
+    def _hedged(self, call: Callable[[BaseSearchProvider], List[SearchResult]]) -> List[SearchResult]:
+        with self._lock:
+            self.calls += 1
+        deadline = time.perf_counter() + self.timeout_s
+        primary = self._submit_primary(call)
+        done, _ = wait([primary], timeout=min(self.hedge_delay(), self.timeout_s))
+        if done and primary.exception() is None:
+            return primary.result()
+
+        if done:
+            with self._lock:
+                self.failovers += 1
+            metrics.inc("search_hedge_total", event="failover")
+        else:
+            with self._lock:
+                self.hedged += 1
+            metrics.inc("search_hedge_total", event="hedged")
+        secondary = self._pool.submit(metrics.propagate(call), self.secondary)
+
+        pending = {primary, secondary}
+        winner: Optional[Future] = None
+        while pending and winner is None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            winner = next((f for f in (primary, secondary) if f in done and f.exception() is None), None)
+        if winner is None:
+            if pending:
+                metrics.inc("search_hedge_total", event="timeout")
+                raise TimeoutError(f"{self.provider_name}: no answer within {self.timeout_s:.0f}s")
+            raise primary.exception() or secondary.exception()
+
+        other = secondary if winner is primary else primary
+        if winner is secondary:
+            with self._lock:
+                self.secondary_wins += 1
+            metrics.inc("search_hedge_total", event="secondary_won")
+        if other in pending:
+            wait([other], timeout=self.merge_grace_s)
+        if other.done() and other.exception() is None:
+            with self._lock:
+                self.merged += 1
+            metrics.inc("search_hedge_total", event="merged")
+            return fuse_ranked([primary.result(), secondary.result()], self.weights)
+        return fuse_ranked([winner.result()])
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        return self._hedged(lambda p: p.search(query=query, count=count))[:count]
+
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        return self._hedged(lambda p: p.search_images(query=query, count=count, tbs=tbs))[:count]
+
+    def quota(self) -> Dict[str, Any]:
+        return self.primary.quota()
+
+    def close(self) -> None:
+        # Calls that lost a race may still be running; they finish, nothing new is started
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.primary.close()
+        self.secondary.close()
+
+    def stats(self) -> Dict[str, Any]:
+        backends: Dict[str, Any] = {}
+        for role, p in (("primary", self.primary), ("secondary", self.secondary)):
+            backend_stats = getattr(p, "stats", None)
+            backends[role] = backend_stats() if callable(backend_stats) else {}
+        return {
+            # the sidebar's quota line follows the primary (the backend that is billed per search)
+            "quota": backends["primary"].get("quota", {}),
+            "hedge_delay_s": round(self.hedge_delay(), 3),
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "failovers": self.failovers,
+            "secondary_wins": self.secondary_wins,
+            "merged": self.merged,
+            "backends": backends,
+        }
@@ -0,0 +1,175 @@
+from __future__ import annotations
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_PAGE_CACHE_DIR = Path("output") / ".cache" / "pages"
+DEFAULT_MAX_CACHE_MB = int(os.environ.get("PAGE_CACHE_MAX_MB", "256"))
+MAX_AGE_RE = re.compile(r"max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+
+@dataclass
+class CachedPage:
+    url: str
+    etag: str
+    last_modified: str
+    expires_at: float
+    body_path: Path
+    candidates: List[str] = field(default_factory=list)
+    max_images: int = 0
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def freshness_deadline(headers: Mapping[str, str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Absolute expiry time from Cache-Control / Expires.
+    Returns None for no-store (don't cache); no-cache means "always revalidate".
+    """
+    now = now or time.time()
+    cc = (headers.get("Cache-Control") or "").lower()
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return now
+    m = MAX_AGE_RE.search(cc)
+    if m:
+        return now + int(m.group(1))
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return parsedate_to_datetime(expires).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now
+
+
+class PageCache:
+    """
+    On-disk HTTP cache for gallery pages, with the parsed candidate list stored alongside.
+    - Honors Cache-Control max-age / no-cache / no-store and Expires
+    - Revalidates with If-None-Match / If-Modified-Since (a 304 skips download and parse)
+    - Bodies are evicted least-recently-used once the cache exceeds max_mb
+    """
+
+    def __init__(self, root: Path = DEFAULT_PAGE_CACHE_DIR, max_mb: int = DEFAULT_MAX_CACHE_MB):
+        self.root = Path(root)
+        self.bodies_dir = self.root / "bodies"
+        self.bodies_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self._db_path = self.root / "index.sqlite"
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, expires_at REAL NOT NULL,"
+                " body_file TEXT NOT NULL, size INTEGER NOT NULL, candidates TEXT NOT NULL,"
+                " max_images INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages(accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own `with` only commits; closing() releases the connection too
+        with closing(sqlite3.connect(str(self._db_path), timeout=10)) as con, con:
+            yield con
+
+    def _body_path(self, url: str) -> Path:
+        return self.bodies_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.html"
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        with self._lock, self._connect() as con:
+            row = con.execute(
+                "SELECT etag, last_modified, expires_at, body_file, candidates, max_images FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if not row:
+                return None
+            con.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        body_path = self.bodies_dir / row[3]
+        if not body_path.exists():
+            return None
+        return CachedPage(url, row[0] or "", row[1] or "", float(row[2]), body_path, json.loads(row[4]), int(row[5]))
+
+    def put(self, url: str, headers: Mapping[str, str], body: bytes, candidates: List[str], max_images: int) -> None:
+        expires_at = freshness_deadline(headers)
+        if expires_at is None:
+            self.delete(url)
+            return
+        path = self._body_path(url)
+        # Unique per writer: concurrent puts for the same URL (batch profiles) each rename a whole file
+        tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.part")
+        try:
+            tmp.write_bytes(body)
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        with self._lock, self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO pages"
+                " (url, etag, last_modified, expires_at, body_file, size, candidates, max_images, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    headers.get("ETag") or "",
+                    headers.get("Last-Modified") or "",
+                    expires_at,
+                    path.name,
+                    len(body),
+                    json.dumps(candidates),
+                    max_images,
+                    time.time(),
+                ),
+            )
+        self._evict()
+
+    def refresh(self, url: str, headers: Mapping[str, str]) -> None:
+        """After a 304: extend freshness and pick up any updated validators."""
+        expires_at = freshness_deadline(headers) or time.time()
+        with self._lock, self._connect() as con:
+            con.execute(
+                "UPDATE pages SET expires_at = ?, accessed_at = ?,"
+                " etag = COALESCE(NULLIF(?, ''), etag), last_modified = COALESCE(NULLIF(?, ''), last_modified)"
+                " WHERE url = ?",
+                (expires_at, time.time(), headers.get("ETag") or "", headers.get("Last-Modified") or "", url),
+            )
+
+    def delete(self, url: str) -> None:
+        with self._lock, self._connect() as con:
+            con.execute("DELETE FROM pages WHERE url = ?", (url,))
+        self._body_path(url).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        with self._lock, self._connect() as con:
+            total = con.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            doomed = []
+            for url, body_file, size in con.execute("SELECT url, body_file, size FROM pages ORDER BY accessed_at ASC"):
+                if total <= self.max_bytes:
+                    break
+                doomed.append((url, body_file))
+                total -= size
+            con.executemany("DELETE FROM pages WHERE url = ?", [(u,) for u, _ in doomed])
+        for _, body_file in doomed:
+            (self.bodies_dir / body_file).unlink(missing_ok=True)
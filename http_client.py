@@ -0,0 +1,44 @@
+from __future__ import annotations
+from typing import Optional, Tuple, Union
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "Mozilla/5.0 (compatible; PortfolioAssetFinder/1.0)"
+CONNECT_TIMEOUT = 5.0
+MAX_HOSTS = int(os.environ.get("HTTP_MAX_HOSTS", "32"))
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "8"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    s = requests.Session()
+    s.headers.update({"User-Agent": USER_AGENT})
+    # pool_block keeps us at MAX_CONNECTIONS_PER_HOST open sockets per host
+    # instead of opening (and discarding) overflow connections.
+    adapter = HTTPAdapter(pool_connections=MAX_HOSTS, pool_maxsize=MAX_CONNECTIONS_PER_HOST, pool_block=True)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide keep-alive session.
+    - One connection pool per host, reused across the whole run
+    - Shared User-Agent for every request
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request_timeout(read_timeout: Union[int, float]) -> Tuple[float, float]:
+    """Shared timeout policy: short connect timeout, caller-chosen read timeout."""
+    return (min(CONNECT_TIMEOUT, float(read_timeout)), float(read_timeout))
@@ -0,0 +1,203 @@
+from __future__ import annotations
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import math
+import multiprocessing
+import os
+import time
+
+import metrics
+
+# Instagram's feed / square / story canvases
+IG_FORMATS: Dict[str, Tuple[int, int]] = {
+    "portrait": (1080, 1350),
+    "square": (1080, 1080),
+    "story": (1080, 1920),
+}
+RENDERABLE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+JPEG_QUALITY = 90
+# EXIF orientations that swap width and height once applied
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+@dataclass
+class RenderJob:
+    src: str
+    pack_dir: str
+    stem: str
+    formats: Tuple[str, ...]
+
+
+@dataclass
+class RenderResult:
+    src: str
+    written: List[str] = field(default_factory=list)
+    skipped: int = 0
+    error: str = ""
+    seconds: float = 0.0
+
+
+@dataclass
+class PackStats:
+    images: int = 0
+    variants_written: int = 0
+    variants_skipped: int = 0
+    failed: List[Dict[str, str]] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    @property
+    def images_per_s(self) -> float:
+        return round(self.images / self.elapsed_s, 2) if self.elapsed_s else 0.0
+
+
+def variant_path(pack_dir: Path, fmt: str, stem: str) -> Path:
+    w, h = IG_FORMATS[fmt]
+    return Path(pack_dir) / f"{fmt}_{w}x{h}" / f"{stem}.jpg"
+
+
+def _is_up_to_date(src: Path, out: Path) -> bool:
+    try:
+        return out.stat().st_mtime >= src.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def render_variants(job: RenderJob) -> RenderResult:
+    """
+    Renders one asset into every requested format (runs in a worker process).
+    - Variants newer than the source are left alone; if all are, the image isn't even opened
+    - JPEGs are decoded at the smallest DCT scale that still covers the largest canvas (draft mode)
+    - One shared Lanczos downscale to the smallest size that covers every canvas, then a
+      center crop + resize per format (cheaper than three full-size resamples); written atomically
+    """
+    t0 = time.perf_counter()
+    src = Path(job.src)
+    out = RenderResult(job.src)
+    todo = []
+    for fmt in job.formats:
+        path = variant_path(Path(job.pack_dir), fmt, job.stem)
+        if _is_up_to_date(src, path):
+            out.skipped += 1
+        else:
+            todo.append((fmt, path))
+    if not todo:
+        out.seconds = time.perf_counter() - t0
+        return out
+
+    try:
+        from PIL import Image, ImageOps
+
+        with Image.open(src) as im:
+            need_w = max(IG_FORMATS[fmt][0] for fmt, _ in todo)
+            need_h = max(IG_FORMATS[fmt][1] for fmt, _ in todo)
+            if im.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                need_w, need_h = need_h, need_w
+            im.draft("RGB", (need_w, need_h))
+            im = ImageOps.exif_transpose(im)
+            if im.mode != "RGB":
+                im = im.convert("RGB")
+            w, h = im.size
+            cover = max(max(cw / w, ch / h) for cw, ch in (IG_FORMATS[fmt] for fmt, _ in todo))
+            if cover < 1:
+                im = im.resize((math.ceil(w * cover), math.ceil(h * cover)), Image.LANCZOS, reducing_gap=3.0)
+            for fmt, path in todo:
+                variant = ImageOps.fit(im, IG_FORMATS[fmt], method=Image.LANCZOS)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(path.name + ".part")
+                variant.save(tmp, "JPEG", quality=JPEG_QUALITY)  # Instagram re-encodes; optimize/progressive cost ~40% more
+                os.replace(tmp, path)
+                out.written.append(str(path))
+    except Exception as e:
+        out.error = f"{type(e).__name__}: {e}"
+    out.seconds = time.perf_counter() - t0
+    return out
+
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def make_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """A render pool; spawned (not forked) so it's safe from threaded hosts like Streamlit."""
+    return ProcessPoolExecutor(max_workers=max_workers or default_workers(), mp_context=multiprocessing.get_context("spawn"))
+
+
+def _jobs(asset_paths: Iterable[str], pack_dir: Path, formats: Tuple[str, ...]) -> List[RenderJob]:
+    jobs: List[RenderJob] = []
+    seen: Dict[str, int] = {}
+    for p in dict.fromkeys(str(a) for a in asset_paths):  # ordered de-dup
+        path = Path(p)
+        if path.suffix.lower() not in RENDERABLE_EXTS or not path.is_file():
+            continue
+        # Same stem with another extension (x.jpg / x.png) gets a suffix instead of overwriting
+        n = seen.get(path.stem, 0)
+        seen[path.stem] = n + 1
+        stem = path.stem if n == 0 else f"{path.stem}_{n}"
+        jobs.append(RenderJob(str(path), str(pack_dir), stem, formats))
+    return jobs
+
+
+def render_instagram_pack(
+    asset_paths: Iterable[str],
+    pack_dir: Path,
+    formats: Optional[Iterable[str]] = None,
+    max_workers: Optional[int] = None,
+    pool: Optional[Executor] = None,
+    on_progress: Optional[Callable[[int, int, str], None]] = None,
+) -> PackStats:
+    """
+    Renders downloaded assets into Instagram_Pack/<format>_<w>x<h>/<stem>.jpg.
+    - CPU-bound decode / resize / encode runs in a process pool across all cores
+      (pass a shared pool to cap several runs at once, e.g. batch.py)
+    - Variants newer than their source are skipped; with one image to render (or one core)
+      the work is done inline, skipping the pool start-up
+    - on_progress(done, total, src) is called from the calling thread
+    """
+    fmts = tuple(formats or IG_FORMATS)
+    unknown = [f for f in fmts if f not in IG_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown Instagram format(s): {', '.join(unknown)}")
+
+    jobs = _jobs(asset_paths, Path(pack_dir), fmts)
+    stats = PackStats()
+    t0 = time.perf_counter()
+
+    def collect(res: RenderResult) -> None:
+        stats.images += 1
+        stats.variants_written += len(res.written)
+        stats.variants_skipped += res.skipped
+        if res.error:
+            stats.failed.append({"src": res.src, "error": res.error})
+        metrics.observe("pack_render_seconds", res.seconds, result="rendered" if res.written else ("failed" if res.error else "up_to_date"))
+        if on_progress:
+            on_progress(stats.images, len(jobs), res.src)
+
+    # Up-to-date check in the parent first: a re-run with nothing to do never starts the pool
+    todo: List[RenderJob] = []
+    for job in jobs:
+        if all(_is_up_to_date(Path(job.src), variant_path(Path(job.pack_dir), fmt, job.stem)) for fmt in job.formats):
+            collect(RenderResult(job.src, skipped=len(job.formats)))
+        else:
+            todo.append(job)
+
+    workers = min(len(todo), max_workers or default_workers())
+    if pool is None and workers <= 1:
+        for job in todo:
+            collect(render_variants(job))
+    else:
+        own_pool = pool is None
+        executor = make_pool(workers) if own_pool else pool
+        try:
+            futures: List[Future] = [executor.submit(render_variants, job) for job in todo]
+            for fut in as_completed(futures):
+                collect(fut.result())
+        finally:
+            if own_pool:
+                executor.shutdown()
+
+    stats.elapsed_s = round(time.perf_counter() - t0, 3)
+    metrics.inc("pack_variants_total", stats.variants_written, result="written")
+    metrics.inc("pack_variants_total", stats.variants_skipped, result="up_to_date")
+    return stats
@@ -0,0 +1,309 @@
+from __future__ import annotations
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+LIBRARY_DB_NAME = "library.sqlite"
+# Metadata folders sit at <base_output>/Portfolio/<year>/<location>/<project>/<photographer>/Metadata
+META_DEPTH = 6
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# bm25 weights, in FTS column order: title, project, location, photographer, tags, credit_line, urls
+FTS_WEIGHTS = (5.0, 4.0, 3.0, 4.0, 2.0, 2.0, 1.0)
+# bm25 scores every match before sorting (~2 µs a row); broader queries ("vogue") are listed newest first
+RANK_MAX_MATCHES = 2000
+RECORD_COLUMNS = (
+    "project", "year", "location", "photographer", "title", "source_url", "page_url",
+    "downloaded_files", "notes", "credit_line", "tags", "created_at", "sources",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    meta_dir TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL,
+    records INTEGER NOT NULL, indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY, meta_dir TEXT NOT NULL,
+    project TEXT, year TEXT, location TEXT, photographer TEXT, title TEXT,
+    source_url TEXT, page_url TEXT, downloaded_files TEXT, notes TEXT,
+    credit_line TEXT, tags TEXT, created_at TEXT, sources TEXT,
+    urls TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_assets_meta_dir ON assets(meta_dir);
+CREATE VIRTUAL TABLE IF NOT EXISTS assets_fts USING fts5(
+    title, project, location, photographer, tags, credit_line, urls,
+    content='assets', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS assets_ai AFTER INSERT ON assets BEGIN
+    INSERT INTO assets_fts(rowid, title, project, location, photographer, tags, credit_line, urls)
+    VALUES (new.id, new.title, new.project, new.location, new.photographer, new.tags, new.credit_line, new.urls);
+END;
+CREATE TRIGGER IF NOT EXISTS assets_ad AFTER DELETE ON assets BEGIN
+    INSERT INTO assets_fts(assets_fts, rowid, title, project, location, photographer, tags, credit_line, urls)
+    VALUES ('delete', old.id, old.title, old.project, old.location, old.photographer, old.tags, old.credit_line, old.urls);
+END;
+"""
+
+
+@dataclass
+class LibraryHit:
+    meta_dir: str
+    record: Dict[str, Any] = field(default_factory=dict)  # the AssetRecord fields, downloaded_files as a list
+    score: float = 0.0  # bm25; lower is better
+
+
+@dataclass
+class SyncStats:
+    indexed: int = 0    # runs (re)indexed
+    unchanged: int = 0
+    removed: int = 0    # runs whose folder is gone
+    elapsed_s: float = 0.0
+
+
+def base_output_for(meta_dir: Path) -> Optional[Path]:
+    """The output/ folder a run's Metadata/ belongs to, or None when it's not in the Portfolio layout."""
+    parents = Path(meta_dir).resolve().parents
+    if Path(meta_dir).name != "Metadata" or len(parents) < META_DEPTH:
+        return None
+    if parents[META_DEPTH - 2].name != "Portfolio":
+        return None
+    return parents[META_DEPTH - 1]
+
+
+def fts_query(text: str) -> str:
+    """
+    User text -> FTS5 MATCH expression: every word must match (AND), the last one as a prefix,
+    so results narrow while typing. Words are quoted, so FTS syntax in the input is inert.
+    """
+    words = TOKEN_RE.findall(text or "")
+    if not words:
+        return ""
+    return " ".join(f'"{w}"' for w in words[:-1]) + (" " if len(words) > 1 else "") + f'"{words[-1]}"*'
+
+
+def _read_records(meta_dir: Path) -> Iterator[Dict[str, Any]]:
+    """Streams a run's records from assets.jsonl, or assets.json for runs older than the JSONL export."""
+    jsonl = meta_dir / "assets.jsonl"
+    if jsonl.exists():
+        with open(jsonl, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with open(meta_dir / "assets.json", encoding="utf-8") as f:
+        yield from json.load(f)
+
+
+def _source_file(meta_dir: Path) -> Optional[Path]:
+    for name in ("assets.jsonl", "assets.json"):
+        if (meta_dir / name).exists():
+            return meta_dir / name
+    return None
+
+
+def _row(meta_dir: str, rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    values = []
+    for col in RECORD_COLUMNS:
+        v = rec.get(col, "")
+        values.append(json.dumps(v, ensure_ascii=False) if col == "downloaded_files" else ("" if v is None else str(v)))
+    # Scheme and "www." would match every row
+    urls = " ".join(
+        u.split("://", 1)[-1].removeprefix("www.") for u in dict.fromkeys((rec.get("source_url"), rec.get("page_url"))) if u
+    )
+    return (meta_dir, *values, urls)
+
+
+class LibraryIndex:
+    """
+    SQLite FTS5 index over the AssetRecords of every past run under one output/ folder.
+    - One row per record; title, project, location, photographer, tags, credit line and
+      source / page URLs are full-text searchable (unicode61, accents folded)
+    - index_run() replaces a single run's rows (export_metadata calls it after every export)
+    - sync() walks output/Portfolio and (re)indexes runs whose export changed since last time,
+      e.g. runs made before the index existed, and drops runs whose folder is gone
+    - The index only mirrors the Metadata/ exports; deleting it loses nothing
+    """
+
+    def __init__(self, base_output: Path = Path("output"), path: Optional[Path] = None):
+        self.base_output = Path(base_output)
+        self.path = Path(path) if path is not None else self.base_output / ".cache" / LIBRARY_DB_NAME
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")  # readers (the Library view) don't block exports
+            con.executescript(SCHEMA)
+
+    @classmethod
+    def for_meta_dir(cls, meta_dir: Path) -> Optional["LibraryIndex"]:
+        base = base_output_for(meta_dir)
+        return cls(base) if base is not None else None
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own `with` only commits; closing() releases the connection too
+        with closing(sqlite3.connect(str(self.path), timeout=30)) as con, con:
+            yield con
+
+    def index_run(self, meta_dir: Path) -> int:
+        """Replaces meta_dir's rows with its current export; returns the number of records indexed."""
+        meta_dir = Path(meta_dir).resolve()
+        src = _source_file(meta_dir)
+        key = str(meta_dir)
+        with metrics.timer("library_index_seconds"), self._lock, self._connect() as con:
+            con.execute("DELETE FROM assets WHERE meta_dir = ?", (key,))
+            if src is None:
+                con.execute("DELETE FROM runs WHERE meta_dir = ?", (key,))
+                return 0
+            st = src.stat()
+            cur = con.executemany(
+                f"INSERT INTO assets (meta_dir, {', '.join(RECORD_COLUMNS)}, urls)"
+                f" VALUES ({', '.join('?' * (len(RECORD_COLUMNS) + 2))})",
+                (_row(key, rec) for rec in _read_records(meta_dir)),
+            )
+            count = max(cur.rowcount, 0)
+            con.execute(
+                "INSERT OR REPLACE INTO runs (meta_dir, mtime, size, records, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, st.st_mtime, st.st_size, count, time.time()),
+            )
+        metrics.inc("library_records_indexed_total", count)
+        return count
+
+    def sync(self) -> SyncStats:
+        """Brings the index up to date with output/Portfolio (cheap when nothing changed: one stat per run)."""
+        t0 = time.perf_counter()
+        stats = SyncStats()
+        with self._connect() as con:
+            known = {row[0]: (row[1], row[2]) for row in con.execute("SELECT meta_dir, mtime, size FROM runs")}
+        found = set()
+        for meta_dir in (self.base_output / "Portfolio").glob("*/*/*/*/Metadata"):
+            src = _source_file(meta_dir)
+            if src is None:
+                continue
+            key = str(meta_dir.resolve())
+            found.add(key)
+            st = src.stat()
+            if known.get(key) == (st.st_mtime, st.st_size):
+                stats.unchanged += 1
+                continue
+            try:
+                self.index_run(meta_dir)
+                stats.indexed += 1
+            except (OSError, ValueError):
+                metrics.inc("library_index_errors_total")  # half-written or hand-edited export
+        gone = [k for k in known if k not in found]
+        if gone:
+            with self._lock, self._connect() as con:
+                con.executemany("DELETE FROM assets WHERE meta_dir = ?", ((k,) for k in gone))
+                con.executemany("DELETE FROM runs WHERE meta_dir = ?", ((k,) for k in gone))
+            stats.removed = len(gone)
+        stats.elapsed_s = round(time.perf_counter() - t0, 3)
+        return stats
+
+    def sync_in_background(self) -> threading.Thread:
+        """sync() on a daemon thread; search() keeps answering from what's indexed so far."""
+        thread = threading.Thread(target=self.sync, name="library-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def search(
+        self,
+        query: str,
+        limit: int = 50,
+        year: Optional[str] = None,
+        location: Optional[str] = None,
+        downloaded_only: bool = False,
+    ) -> List[LibraryHit]:
+        """
+        Best matches first (bm25, title / project / photographer weighted highest).
+        - Queries matching more than RANK_MAX_MATCHES records, and empty queries, list
+          the most recently indexed records instead
+        - year / location are exact filters
+        """
+        match = fts_query(query)
+        where, args = [], []
+        if year:
+            where.append("a.year = ?")
+            args.append(str(year))
+        if location:
+            where.append("a.location = ?")
+            args.append(location)
+        if downloaded_only:
+            where.append("a.downloaded_files != '[]'")
+        cols = ", ".join(f"a.{c}" for c in RECORD_COLUMNS)
+        with metrics.timer("library_search_seconds"), self._connect() as con:
+            if match:
+                broad = con.execute(
+                    "SELECT COUNT(*) FROM (SELECT rowid FROM assets_fts WHERE assets_fts MATCH ? LIMIT ?)",
+                    (match, RANK_MAX_MATCHES + 1),
+                ).fetchone()[0] > RANK_MAX_MATCHES
+                score = "0.0" if broad else f"bm25(assets_fts, {', '.join(str(w) for w in FTS_WEIGHTS)})"
+                sql = (
+                    f"SELECT a.meta_dir, {cols}, {score} AS score"
+                    " FROM assets_fts JOIN assets a ON a.id = assets_fts.rowid"
+                    " WHERE assets_fts MATCH ?" + "".join(f" AND {w}" for w in where)
+                    + (" ORDER BY assets_fts.rowid DESC" if broad else " ORDER BY score") + " LIMIT ?"
+                )
+                args = [match, *args, int(limit)]
+            else:
+                sql = (
+                    f"SELECT a.meta_dir, {cols}, 0.0 FROM assets a"
+                    + (" WHERE " + " AND ".join(where) if where else "")
+                    + " ORDER BY a.id DESC LIMIT ?"
+                )
+                args.append(int(limit))
+            rows = con.execute(sql, args).fetchall()
+        hits = []
+        for row in rows:
+            record = dict(zip(RECORD_COLUMNS, row[1:-1]))
+            record["downloaded_files"] = json.loads(record["downloaded_files"] or "[]")
+            hits.append(LibraryHit(row[0], record, row[-1]))
+        return hits
+
+    def facets(self) -> Dict[str, List[str]]:
+        """Distinct years (newest first) and locations, for filter widgets."""
+        with self._connect() as con:
+            years = [r[0] for r in con.execute("SELECT DISTINCT year FROM assets WHERE year != '' ORDER BY year DESC")]
+            locations = [r[0] for r in con.execute("SELECT DISTINCT location FROM assets WHERE location != '' ORDER BY location")]
+        return {"years": years, "locations": locations}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as con:
+            runs, records = con.execute("SELECT COUNT(*), COALESCE(SUM(records), 0) FROM runs").fetchone()
+        return {"runs": runs, "records": records, "path": str(self.path)}
+
+
+def index_export(meta_dir: Path) -> int:
+    """
+    Indexes a run right after its export (called by export_metadata).
+    Exports outside the output/Portfolio layout (benchmarks, scratch dirs) aren't indexed;
+    a failing index never fails the export, it's rebuilt by the next sync().
+    """
+    try:
+        index = LibraryIndex.for_meta_dir(meta_dir)
+        return index.index_run(meta_dir) if index is not None else 0
+    except (sqlite3.Error, OSError, ValueError):
+        metrics.inc("library_index_errors_total")
+        return 0
+
+
+def hit_rows(hits: Iterable[LibraryHit]) -> Iterator[Dict[str, Any]]:
+    """Flat rows for tables (st.dataframe, CSV)."""
+    for h in hits:
+        r = h.record
+        yield {
+            "title": r.get("title", ""),
+            "project": r.get("project", ""),
+            "year": r.get("year", ""),
+            "location": r.get("location", ""),
+            "photographer": r.get("photographer", ""),
+            "files": len(r.get("downloaded_files") or []),
+            "page_url": r.get("page_url", ""),
+            "folder": str(Path(h.meta_dir).parent),
+        }
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+import json
+import os
+import threading
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+@dataclass
+class ManifestState:
+    """What a manifest says has happened so far (later events win)."""
+    header: Dict[str, Any] = field(default_factory=dict)
+    pages: Dict[str, Dict[str, Any]] = field(default_factory=dict)     # page_url -> AssetRecord dict (done pages only)
+    images: Dict[str, Dict[str, str]] = field(default_factory=dict)    # page_url -> {image url: filepath}
+    complete: bool = False
+
+
+class RunManifest:
+    """
+    Append-only JSONL log in a run's Metadata/ folder.
+    - "run" header: jobs, record fields, base name, assets dir, pipeline config
+    - "image" per attempted candidate, "page" per finished page (the AssetRecord; done=False
+      when it failed, so a resume retries it)
+    - "complete" once metadata has been exported
+    Page events are fsynced so a killed session loses at most in-flight work.
+    """
+
+    def __init__(self, meta_dir: Path):
+        self.path = Path(meta_dir) / MANIFEST_NAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._end_torn_line()
+
+    def _end_torn_line(self) -> None:
+        # A crash mid-write leaves a partial last line; start new events on a fresh one
+        if not self.exists():
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def exists(self) -> bool:
+        return self.path.exists() and self.path.stat().st_size > 0
+
+    def append(self, event: str, durable: bool = False, **data: Any) -> None:
+        line = json.dumps({"event": event, "ts": datetime.utcnow().isoformat(), **data}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                if durable:
+                    os.fsync(f.fileno())
+
+    def replay(self) -> ManifestState:
+        state = ManifestState()
+        if not self.path.exists():
+            return state
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ev = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from a crash
+                kind = ev.get("event")
+                if kind == "run":
+                    state.header = ev
+                elif kind == "image" and ev.get("ok") and ev.get("filepath"):
+                    state.images.setdefault(ev["page_url"], {})[ev["url"]] = ev["filepath"]
+                elif kind == "page":
+                    if ev.get("done", True):
+                        state.pages[ev["record"]["page_url"]] = ev["record"]
+                    else:
+                        state.pages.pop(ev["record"]["page_url"], None)
+                elif kind == "complete":
+                    state.complete = True
+        return state
+
+
+def _is_complete(path: Path, tail_bytes: int = 4096) -> bool:
+    # "complete" is always the last event, so the tail is enough (no full replay on every rerun)
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - tail_bytes))
+        lines = f.read().splitlines()
+    return bool(lines) and b'"event": "complete"' in lines[-1]
+
+
+def find_incomplete_runs(base_output: Path = Path("output")) -> List[Path]:
+    """Metadata folders whose manifest has no "complete" event, newest first."""
+    found: List[Path] = []
+    for path in (Path(base_output) / "Portfolio").glob(f"**/Metadata/{MANIFEST_NAME}"):
+        if not _is_complete(path):
+            found.append(path.parent)
+    found.sort(key=lambda p: (p / MANIFEST_NAME).stat().st_mtime, reverse=True)
+    return found
+
@@ -0,0 +1,255 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+import bisect
+import json
+import random
+import threading
+import time
+
+METRICS_JSON = "metrics.json"
+METRICS_PROM = "metrics.prom"
+# Seconds; also fine for the few non-time histograms (they get their own buckets)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_SAMPLES = 4096  # per series, reservoir-sampled, for p50 / p95
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Exact bucket counts (for Prometheus) plus a bounded sample reservoir (for percentiles)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < MAX_SAMPLES:
+                self.samples[i] = value
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def merge(self, other: "Histogram") -> None:
+        for i, c in enumerate(other.bucket_counts):
+            self.bucket_counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.samples = (self.samples + other.samples)[-MAX_SAMPLES:]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms for one run.
+    - Series are identified by name + labels (e.g. image_download_seconds{outcome="ok"})
+    - snapshot() is the metrics.json payload; to_prometheus() the text exposition format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        self.histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self.started_at = datetime.utcnow().isoformat()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def merge(self, other: "MetricsRegistry") -> None:
+        with other._lock:
+            counters = dict(other.counters)
+            histograms = list(other.histograms.items())
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, hist in histograms:
+                mine = self.histograms.get(key)
+                if mine is None:
+                    mine = self.histograms[key] = Histogram(hist.buckets)
+                mine.merge(hist)
+
+    def stages(self) -> List[Dict[str, Any]]:
+        """One row per *_seconds series: count, total, mean / p50 / p95 / max in ms."""
+        rows = []
+        with self._lock:
+            items = sorted(self.histograms.items())
+        for (name, labels), h in items:
+            if not name.endswith("_seconds") or not h.count:
+                continue
+            rows.append({
+                "stage": name[: -len("_seconds")],
+                **dict(labels),
+                "count": h.count,
+                "total_s": round(h.sum, 3),
+                "mean_ms": round(h.sum / h.count * 1000, 1),
+                "p50_ms": round(h.percentile(0.50) * 1000, 1),
+                "p95_ms": round(h.percentile(0.95) * 1000, 1),
+                "max_ms": round(h.max * 1000, 1),
+            })
+        return rows
+
+    def counter_total(self, name: str, **labels: Any) -> float:
+        want = set(_label_key(labels))
+        with self._lock:
+            return sum(v for (n, lk), v in self.counters.items() if n == name and want <= set(lk))
+
+    def histogram_sum(self, name: str, **labels: Any) -> float:
+        want = set(_label_key(labels))
+        with self._lock:
+            return sum(h.sum for (n, lk), h in self.histograms.items() if n == name and want <= set(lk))
+
+    def snapshot(self) -> Dict[str, Any]:
+        downloaded = self.counter_total("image_download_bytes_total")
+        download_s = self.histogram_sum("image_download_seconds", outcome="ok")
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    "min": round(h.min, 6) if h.count else 0.0,
+                    "max": round(h.max, 6),
+                    "p50": round(h.percentile(0.50), 6),
+                    "p95": round(h.percentile(0.95), 6),
+                }
+                for (name, labels), h in sorted(self.histograms.items())
+            ]
+        return {
+            "started_at": self.started_at,
+            "written_at": datetime.utcnow().isoformat(),
+            "stages": self.stages(),
+            "downloads": {
+                "bytes": int(downloaded),
+                "seconds": round(download_s, 3),
+                # summed over requests, i.e. per-connection throughput, not wall-clock
+                "mb_per_s": round(downloaded / 1024 / 1024 / download_s, 2) if download_s else 0.0,
+            },
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def to_prometheus(self, prefix: str = "paf_") -> str:
+        def fmt_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                    seen.add(name)
+                lines.append(f"{prefix}{name}{fmt_labels(labels)} {int(value) if float(value).is_integer() else value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    seen.add(name)
+                cumulative = 0
+                for le, c in zip(list(h.buckets) + ["+Inf"], h.bucket_counts):
+                    cumulative += c
+                    lines.append(f"{prefix}{name}_bucket{fmt_labels(labels, (('le', str(le)),))} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{fmt_labels(labels)} {h.sum:.6f}")
+                lines.append(f"{prefix}{name}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, meta_dir: Path, prometheus: bool = False) -> Path:
+        """Writes Metadata/metrics.json (and metrics.prom); returns the JSON path."""
+        meta_dir = Path(meta_dir)
+        path = meta_dir / METRICS_JSON
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        if prometheus:
+            with open(meta_dir / METRICS_PROM, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+        return path
+
+
+# Process-wide fallback, so instrumented code never has to check for a registry
+GLOBAL = MetricsRegistry()
+_current: ContextVar[MetricsRegistry] = ContextVar("metrics_registry", default=GLOBAL)
+
+
+def current() -> MetricsRegistry:
+    return _current.get()
+
+
+@contextmanager
+def collecting(registry: MetricsRegistry) -> Iterator[MetricsRegistry]:
+    """Routes metrics recorded in this context (and in propagate()-wrapped workers) to registry."""
+    token = _current.set(registry)
+    try:
+        yield registry
+    finally:
+        _current.reset(token)
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Binds fn to the caller's context, for thread-pool submits (pools don't copy contextvars)."""
+    ctx = copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    current().inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    current().observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Observes the block's duration in seconds under name{labels}.
+    Labels can be added inside the block (e.g. the outcome) via the yielded dict.
+    """
+    extra: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        observe(name, time.perf_counter() - t0, **labels, **extra)
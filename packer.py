@@ -1,11 +1,13 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict
-from typing import List, Dict
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Dict, Iterable, List
 from pathlib import Path
+import csv
 import json
-import pandas as pd
 from slugify import slugify
 from datetime import datetime
+import metrics
+from library_index import index_export
 
 @dataclass
 class AssetRecord:
@@ -21,6 +23,7 @@ class AssetRecord:
     credit_line: str = ""
     tags: str = ""
     created_at: str = ""
+    sources: str = ""
 
 def build_project_paths(base_output: Path, year: str, location: str, project: str, photographer: str) -> Dict[str, Path]:
     year_s = slugify(str(year))
@@ -38,24 +41,96 @@ def build_project_paths(base_output: Path, year: str, location: str, project: st
 
     return {"root": root, "assets": assets_dir, "pack": pack_dir, "meta": meta_dir}
 
-def export_metadata(records: List[AssetRecord], meta_dir: Path) -> None:
-    now = datetime.utcnow().isoformat()
+ASSET_FIELDS = [f.name for f in fields(AssetRecord)]
+PARQUET_ROW_GROUP = 4096
+
+
+def _csv_value(value: Any) -> Any:
+    # Same cell text pandas wrote for list columns, so existing sheets keep working
+    return str(value) if isinstance(value, list) else value
+
+
+class MetadataWriter:
+    """
+    Streams AssetRecords to the Metadata/ exports as they arrive (constant memory).
+    - assets.jsonl: one record per line
+    - assets.csv / links.txt: one row per record
+    - assets.json: the same indented array export_metadata always wrote
+    - assets.parquet (optional, needs pyarrow): downloaded_files as a list<string> column
+    """
+
+    def __init__(self, meta_dir: Path, parquet: bool = False):
+        self.meta_dir = Path(meta_dir)
+        self.count = 0
+        self._pq_writer = None
+        self._pq_rows: List[Dict[str, Any]] = []
+        self._pq_schema = None
+        if parquet:
+            try:
+                import pyarrow as pa
+            except ImportError as e:
+                raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).") from e
+            self._pq_schema = pa.schema(
+                [(name, pa.list_(pa.string()) if name == "downloaded_files" else pa.string()) for name in ASSET_FIELDS]
+            )
+
+        self._json = open(self.meta_dir / "assets.json", "w", encoding="utf-8")
+        self._jsonl = open(self.meta_dir / "assets.jsonl", "w", encoding="utf-8")
+        self._csv_file = open(self.meta_dir / "assets.csv", "w", encoding="utf-8", newline="")
+        self._links = open(self.meta_dir / "links.txt", "w", encoding="utf-8")
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=ASSET_FIELDS, lineterminator="\n")
+        self._csv.writeheader()
+
+    def write(self, record: AssetRecord) -> None:
+        row = asdict(record)
+        item = json.dumps(row, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._json.write(("[\n  " if self.count == 0 else ",\n  ") + item)
+        self._jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._csv.writerow({k: _csv_value(v) for k, v in row.items()})
+        self._links.write(record.source_url.strip() + "\n")
+        if self._pq_schema is not None:
+            self._pq_rows.append(row)
+            if len(self._pq_rows) >= PARQUET_ROW_GROUP:
+                self._flush_parquet()
+        self.count += 1
 
-    # JSON
-    json_path = meta_dir / "assets.json"
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump([asdict(r) for r in records], f, ensure_ascii=False, indent=2)
+    def _flush_parquet(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-    # CSV
-    csv_path = meta_dir / "assets.csv"
-    df = pd.DataFrame([asdict(r) for r in records])
-    df.to_csv(csv_path, index=False)
+        table = pa.Table.from_pylist(self._pq_rows, schema=self._pq_schema)
+        if self._pq_writer is None:
+            self._pq_writer = pq.ParquetWriter(str(self.meta_dir / "assets.parquet"), self._pq_schema)
+        self._pq_writer.write_table(table)
+        self._pq_rows = []
 
-    # Links
-    links_path = meta_dir / "links.txt"
-    with open(links_path, "w", encoding="utf-8") as f:
+    def close(self) -> None:
+        self._json.write("[]" if self.count == 0 else "\n]")
+        if self._pq_schema is not None:
+            if self._pq_rows or self._pq_writer is None:
+                self._flush_parquet()
+            self._pq_writer.close()
+        for f in (self._json, self._jsonl, self._csv_file, self._links):
+            f.close()
+
+    def __enter__(self) -> "MetadataWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def export_metadata(records: Iterable[AssetRecord], meta_dir: Path, parquet: bool = False, index: bool = True) -> int:
+    now = datetime.utcnow().isoformat()
+
+    # JSON / JSONL / CSV / links (+ Parquet), written as the records are iterated
+    with metrics.timer("export_seconds"), MetadataWriter(meta_dir, parquet=parquet) as writer:
         for r in records:
-            f.write(r.source_url.strip() + "\n")
+            writer.write(r)
+
+    # Library search index (output/.cache/library.sqlite), for runs in the Portfolio layout
+    if index:
+        index_export(meta_dir)
 
     # Post plan stub
     plan_path = meta_dir / "post_plan.md"
@@ -65,6 +140,7 @@ def export_metadata(records: List[AssetRecord], meta_dir: Path) -> None:
         f.write("- 1) Strong hero image\n- 2) Detail\n- 3) BTS\n- 4) Final look\n\n")
         f.write("## Checklist\n")
         f.write("- Confirm usage/rights for each file\n- Confirm credits\n- Keep originals backed up\n")
+    return writer.count
 
 def generate_caption_files(pack_dir: Path, project: str, year: str, location: str, photographer: str, credits: str, hashtags: str) -> None:
     caption = f"""{project} — {location} ({year})
@@ -0,0 +1,406 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, as_completed
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+import threading
+import time
+
+import metrics
+from asset_store import AssetStore
+from dedup import DEFAULT_THRESHOLD, dedupe_records
+from downloader import TRANSIENT_ERRORS, DownloadResult, download_image, fetch_image
+from crawler import crawl_gallery
+from extractors import extract_image_urls_from_page
+from http_cache import PageCache
+from manifest import ManifestState, RunManifest
+from packer import AssetRecord, export_metadata
+from rate_limit import RetryableHTTPError, TokenBucket, is_retryable_status, retry_call
+from validate import check_image_url
+
+PAGE_FAILED = "Page failed"
+
+
+@dataclass
+class PipelineConfig:
+    min_kb: int = 30
+    min_width: int = 0   # pixel rule, checked from the image header before downloading the body
+    min_height: int = 0
+    max_images_per_page: int = 15
+    max_downloads_per_page: int = 8
+    single_request: bool = True
+    max_workers: int = 8          # global cap on concurrent requests
+    per_host: int = 2             # concurrent requests per host
+    host_interval_s: float = 0.2  # minimum spacing between request starts per host
+    store_dir: Optional[Path] = None  # content-addressed store shared across runs (None = plain files)
+    page_cache_dir: Optional[Path] = None  # conditional-request cache for gallery pages (None = off)
+    dedup_threshold: Optional[int] = DEFAULT_THRESHOLD  # perceptual-hash distance; None disables dedup
+    retry_attempts: int = 3       # per image on 429 / 5xx, jittered backoff honoring Retry-After
+    crawl: bool = False           # follow each gallery's pagination (see crawler.crawl_gallery)
+    crawl_max_pages: int = 10
+    crawl_max_depth: int = 10     # link hops; a linear "next" chain needs crawl_max_pages - 1
+    crawl_max_downloads: int = 40  # per crawled gallery; replaces max_downloads_per_page in crawl mode
+
+
+@dataclass
+class PageJob:
+    page_url: str
+    title: str = ""
+    image_url: str = ""  # direct image from an image search result, tried first
+    sources: List[str] = field(default_factory=list)  # search sources that returned this page
+
+
+@dataclass
+class PageOutcome:
+    downloaded: List[str] = field(default_factory=list)
+    notes: str = ""
+
+
+class HostLimiter:
+    """
+    Politeness gate shared by every stage.
+    - At most max_workers requests in flight overall
+    - At most per_host in flight per host; request starts are paced by a per-host token bucket
+      (one every interval_s, up to burst back to back)
+    - backoff(url, seconds) pauses a host for every worker, e.g. after a 429's Retry-After
+    """
+
+    def __init__(self, max_workers: int = 8, per_host: int = 2, interval_s: float = 0.2, burst: int = 1):
+        self.per_host = max(1, per_host)
+        self.interval_s = max(0.0, interval_s)
+        self.burst = max(1, burst)
+        self._global = threading.BoundedSemaphore(max(1, max_workers))
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return (urlparse(url).hostname or "").lower()
+
+    def _host_sem(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return sem
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate = 1.0 / self.interval_s if self.interval_s > 0 else 1e6
+                bucket = self._buckets[host] = TokenBucket(rate, self.burst)
+            return bucket
+
+    def backoff(self, url: str, seconds: float) -> None:
+        self._bucket(self._host(url)).pause(seconds)
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        host = self._host(url)
+        sem = self._host_sem(host)
+        t0 = time.perf_counter()
+        with sem:
+            self._bucket(host).acquire()
+            with self._global:
+                metrics.observe("host_wait_seconds", time.perf_counter() - t0)
+                yield
+
+
+@dataclass
+class _Run:
+    """Everything one pipeline run shares across its page and image workers."""
+    assets_dir: Path
+    base_name: str
+    record_fields: Dict[str, str]
+    cfg: PipelineConfig
+    limiter: HostLimiter
+    image_pool: ThreadPoolExecutor
+    store: Optional[AssetStore] = None
+    page_cache: Optional[PageCache] = None
+    manifest: Optional[RunManifest] = None
+    resumed_images: Dict[str, Dict[str, str]] = field(default_factory=dict)  # page_url -> {url: filepath}
+
+
+def _fetch_one(url: str, page_url: str, run: _Run) -> Optional[DownloadResult]:
+    cfg, store = run.cfg, run.store
+    done = run.resumed_images.get(page_url, {}).get(url)
+    if done and Path(done).exists():
+        return DownloadResult(True, done, "Resumed from manifest", "", Path(done).stat().st_size)
+
+    rules = {"min_kb": cfg.min_kb, "min_width": cfg.min_width, "min_height": cfg.min_height}
+    if store is not None and store.lookup(url) is not None:
+        # Known URL: fetch_image links it from the store without touching the network.
+        return fetch_image(url, out_dir=run.assets_dir, base_name=run.base_name, store=store, **rules)
+
+    last: List[Optional[DownloadResult]] = [None]
+
+    def attempt() -> Optional[DownloadResult]:
+        res = last[0] = _fetch_network(url, run, rules)
+        if res is not None and not res.ok and is_retryable_status(res.status):
+            raise RetryableHTTPError(res.status, res.reason, res.retry_after)
+        return res
+
+    try:
+        # Backing off pauses the whole host, so sibling workers don't keep hammering a throttling CDN;
+        # connection errors and timeouts (raised by the downloader) are retried the same way
+        return retry_call(attempt, attempts=cfg.retry_attempts, on_backoff=lambda s, _e: _backoff(run, url, s))
+    except RetryableHTTPError:
+        return last[0]
+    except TRANSIENT_ERRORS as e:
+        return DownloadResult(False, None, f"Download failed: {e}")
+
+
+def _backoff(run: _Run, url: str, seconds: float) -> None:
+    metrics.inc("image_retries_total")
+    run.limiter.backoff(url, seconds)
+
+
+def _fetch_network(url: str, run: _Run, rules: Dict[str, int]) -> Optional[DownloadResult]:
+    if run.cfg.single_request:
+        with run.limiter.slot(url):
+            return fetch_image(url, out_dir=run.assets_dir, base_name=run.base_name, store=run.store, **rules)
+
+    with run.limiter.slot(url):
+        chk = check_image_url(url)
+    if not chk.ok:
+        return DownloadResult(False, None, chk.reason, chk.content_type, 0, chk.status, chk.final_url, chk.retry_after)
+    with run.limiter.slot(chk.final_url):
+        return download_image(chk.final_url, out_dir=run.assets_dir, base_name=run.base_name, **rules)
+
+
+def _download_candidates(candidates: List[str], page_url: str, run: _Run, target: Optional[int] = None) -> List[str]:
+    """
+    Tries candidates in order, keeping at most (target - successes) in flight,
+    and returns the downloaded paths in candidate order.
+    target defaults to cfg.max_downloads_per_page.
+    """
+    target = target or run.cfg.max_downloads_per_page
+    ok: Dict[int, str] = {}
+    inflight: Dict[Future, int] = {}
+    next_idx = 0
+
+    def _collect(fut: Future) -> None:
+        idx = inflight.pop(fut)
+        try:
+            res = fut.result()
+        except Exception as e:
+            res = DownloadResult(False, None, f"Download failed: {e}")
+        if run.manifest is not None:
+            run.manifest.append(
+                "image", page_url=page_url, url=candidates[idx], ok=bool(res and res.ok),
+                filepath=(res.filepath if res else None) or "", reason=res.reason if res else "",
+            )
+        # Content-addressed names collapse the same bytes served from several URLs.
+        if res and res.ok and res.filepath and res.filepath not in ok.values():
+            ok[idx] = res.filepath
+
+    while True:
+        while next_idx < len(candidates) and len(inflight) < target - len(ok):
+            fut = run.image_pool.submit(metrics.propagate(_fetch_one), candidates[next_idx], page_url, run)
+            inflight[fut] = next_idx
+            next_idx += 1
+        if not inflight:
+            break
+        done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+        for fut in done:
+            _collect(fut)
+        if len(ok) >= target:
+            # Let stragglers finish, but keep only the first `target` in candidate order.
+            for fut in list(inflight):
+                _collect(fut)
+            break
+
+    return [ok[i] for i in sorted(ok)][:target] if ok else []
+
+
+def _process_page(job: PageJob, run: _Run) -> PageOutcome:
+    if "instagram.com" in job.page_url:
+        return PageOutcome([], "Instagram link saved (links-only).")
+
+    downloaded: List[str] = []
+    if job.image_url:
+        downloaded = _download_candidates([job.image_url], job.page_url, run)
+
+    if not downloaded:
+        target = run.cfg.crawl_max_downloads if run.cfg.crawl else run.cfg.max_downloads_per_page
+        try:
+            if run.cfg.crawl:
+                # Each crawled page takes its own limiter slot; none is held across the crawl
+                img_urls = crawl_gallery(
+                    job.page_url,
+                    max_pages=run.cfg.crawl_max_pages,
+                    max_depth=run.cfg.crawl_max_depth,
+                    max_images=run.cfg.max_images_per_page,
+                    max_workers=run.cfg.per_host,
+                    cache=run.page_cache,
+                    slot=run.limiter.slot,
+                ).candidates
+            else:
+                with run.limiter.slot(job.page_url):
+                    img_urls = extract_image_urls_from_page(
+                        job.page_url, max_images=run.cfg.max_images_per_page, cache=run.page_cache
+                    )
+        except Exception:
+            # Raised on so _run_page records a failed page, which a resume retries
+            metrics.inc("page_extract_errors_total")
+            raise
+        downloaded = _download_candidates(img_urls, job.page_url, run, target)
+
+    return PageOutcome(downloaded, "" if downloaded else "No downloadable images found (or skipped by rules).")
+
+
+def _page_record(job: PageJob, out: PageOutcome, record_fields: Dict[str, str]) -> AssetRecord:
+    fallback_title = "(instagram)" if "instagram.com" in job.page_url else "(selected)"
+    return AssetRecord(
+        **record_fields,
+        title=job.title or fallback_title,
+        source_url=job.page_url,
+        page_url=job.page_url,
+        downloaded_files=out.downloaded,
+        notes=out.notes,
+        sources=", ".join(job.sources),
+        created_at=datetime.utcnow().isoformat(),
+    )
+
+
+def _page_done(record: AssetRecord) -> bool:
+    """Finished for resume purposes: downloaded or deliberately skipped; failed pages are retried."""
+    return not record.notes.startswith(PAGE_FAILED)
+
+
+def _run_page(job: PageJob, run: _Run) -> AssetRecord:
+    with metrics.timer("page_seconds") as labels:
+        try:
+            out = _process_page(job, run)
+            labels["outcome"] = "downloaded" if out.downloaded else "empty"
+        except Exception as e:
+            out = PageOutcome([], f"{PAGE_FAILED}: {e}")
+            labels["outcome"] = "failed"
+    record = _page_record(job, out, run.record_fields)
+    if run.manifest is not None:
+        run.manifest.append("page", durable=True, record=asdict(record), done=_page_done(record))
+    return record
+
+
+def _config_to_dict(cfg: PipelineConfig) -> Dict[str, Any]:
+    return {k: (str(v) if isinstance(v, Path) else v) for k, v in asdict(cfg).items()}
+
+
+def _config_from_dict(data: Dict[str, Any]) -> PipelineConfig:
+    known = {f.name for f in fields(PipelineConfig)}
+    values = {k: v for k, v in data.items() if k in known}
+    for k in ("store_dir", "page_cache_dir"):
+        if values.get(k):
+            values[k] = Path(values[k])
+    return PipelineConfig(**values)
+
+
+def run_download_pipeline(
+    jobs: List[PageJob],
+    assets_dir: Path,
+    base_name: str,
+    record_fields: Dict[str, str],
+    config: Optional[PipelineConfig] = None,
+    on_progress: Optional[Callable[[int, int, str], None]] = None,
+    limiter: Optional[HostLimiter] = None,
+    manifest: Optional[RunManifest] = None,
+) -> List[AssetRecord]:
+    """
+    Extracts, validates and downloads every selected page concurrently.
+    - record_fields fills the shared AssetRecord fields (project, year, location,
+      photographer, credit_line, tags)
+    - on_progress(done, total, page_url) is called from the calling thread
+    - Pass a shared limiter to run several pipelines under one request budget
+    - With a manifest, every image and page outcome is logged as it completes;
+      pages (and images) already in the manifest are skipped, so the same call resumes a run
+    - Records come back in the same order as `jobs`, whatever order pages finish in
+    - Near-duplicate downloads are collapsed afterwards (see dedup.dedupe_records)
+    - Stage timings and counters go to the current metrics registry (see metrics.collecting)
+    """
+    cfg = config or PipelineConfig()
+    state = manifest.replay() if manifest is not None else ManifestState()
+    if manifest is not None and not state.header:
+        manifest.append(
+            "run", durable=True, jobs=[asdict(j) for j in jobs], record_fields=record_fields,
+            base_name=base_name, assets_dir=str(assets_dir), config=_config_to_dict(cfg),
+        )
+
+    records: Dict[int, AssetRecord] = {}
+    todo: List[int] = []
+    for i, job in enumerate(jobs):
+        prev = state.pages.get(job.page_url)
+        if prev is not None:
+            records[i] = AssetRecord(**prev)
+        else:
+            todo.append(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, cfg.max_workers), thread_name_prefix="page") as page_pool, \
+            ThreadPoolExecutor(max_workers=max(1, cfg.max_workers), thread_name_prefix="image") as image_pool:
+        run = _Run(
+            assets_dir=assets_dir,
+            base_name=base_name,
+            record_fields=record_fields,
+            cfg=cfg,
+            limiter=limiter or HostLimiter(cfg.max_workers, cfg.per_host, cfg.host_interval_s),
+            image_pool=image_pool,
+            store=AssetStore(cfg.store_dir) if cfg.store_dir is not None else None,
+            page_cache=PageCache(cfg.page_cache_dir) if cfg.page_cache_dir is not None else None,
+            manifest=manifest,
+            resumed_images=state.images,
+        )
+        futures = {page_pool.submit(metrics.propagate(_run_page), jobs[i], run): i for i in todo}
+        done_count = len(records)
+        if on_progress and done_count:
+            on_progress(done_count, len(jobs), "(resumed)")
+        for fut in as_completed(futures):
+            i = futures[fut]
+            records[i] = fut.result()
+            done_count += 1
+            if on_progress:
+                on_progress(done_count, len(jobs), jobs[i].page_url)
+
+    ordered = [records[i] for i in range(len(jobs))]
+    if cfg.dedup_threshold is not None:
+        with metrics.timer("dedup_seconds"):
+            changed = dedupe_records(ordered, threshold=cfg.dedup_threshold)
+    else:
+        changed = False
+    if changed and manifest is not None:
+        for record in ordered:
+            manifest.append("page", record=asdict(record), done=_page_done(record))
+    return ordered
+
+
+def resume_run(
+    meta_dir: Path,
+    on_progress: Optional[Callable[[int, int, str], None]] = None,
+    limiter: Optional[HostLimiter] = None,
+) -> List[AssetRecord]:
+    """
+    Replays Metadata/manifest.jsonl of an interrupted run, finishes the pages that
+    never completed, and rebuilds the metadata exports from the manifest.
+    """
+    manifest = RunManifest(meta_dir)
+    state = manifest.replay()
+    if not state.header:
+        raise ValueError(f"No run header in {manifest.path}")
+    header = state.header
+    records = run_download_pipeline(
+        [PageJob(**j) for j in header["jobs"]],
+        assets_dir=Path(header["assets_dir"]),
+        base_name=header["base_name"],
+        record_fields=header["record_fields"],
+        config=_config_from_dict(header.get("config", {})),
+        on_progress=on_progress,
+        limiter=limiter,
+        manifest=manifest,
+    )
+    export_metadata(records, meta_dir)
+    manifest.append("complete", durable=True)
+    return records
+
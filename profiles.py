@@ -0,0 +1,210 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Any, Dict, Mapping
+import re
+
+from search_providers import (
+    BaseSearchProvider,
+    MockSearchProvider,
+    BingWebSearchProvider,
+    SerpApiSearchProvider,
+)
+from federated_search import FederatedSearchProvider
+from search_cache import CachedSearchProvider
+from search_throttle import ThrottledSearchProvider
+
+
+# =========================
+# Search profiles (shared by app.py and batch.py)
+# =========================
+SAMPLE_PROFILE = {
+    "talent_name": "Holli Smith",
+    "agency": "Art Partner",
+    "brand": "Jean Paul Gaultier",
+    "season": "Haute Couture Spring",
+    "year": 2025,
+    "location": "Paris",
+    "project_event": "JPG Couture Spring 2025 (Paris)",
+    "photographer": "",
+    "brand_domain": "",
+    "keywords": "backstage, runway, beauty, hair",
+    "ig_handle": "jeanpaulgaultier",
+    "credits_line": "Hair: Holli Smith (Art Partner)",
+    "hashtags": "#hair #fashion #runway #backstage #editorial",
+    "ig_mode": "Links-only (handle + show terms)",
+    "sources": ["Web", "Instagram (links-only)"],
+    "provider": "Mock (no API key)",
+    "use_vogue": True,
+    "use_voguerunway": True,
+    "use_brand_site": True,
+    "max_results": 10,
+    "min_kb": 30,
+    "max_images_per_page": 15,
+}
+
+DEFAULT_PROFILE = {
+    "provider": "Mock (no API key)",
+    "brand": "",
+    "season": "",
+    "year": datetime.now().year,
+    "location": "",
+    "keywords": "",
+    "sources": ["Web"],
+    "talent_name": "",
+    "agency": "",
+    "project_event": "",
+    "photographer": "",
+    "brand_domain": "",
+    "credits_line": "",
+    "hashtags": "",
+    "ig_handle": "",
+    "ig_mode": "Links-only (handle + show terms)",
+    "use_vogue": True,
+    "use_voguerunway": True,
+    "use_brand_site": True,
+    "max_results": 10,
+    "min_kb": 30,
+    "min_width_px": 0,
+    "min_height_px": 0,
+    "max_images_per_page": 15,
+    "single_request_fetch": True,
+    "crawl_galleries": False,
+    "crawl_max_pages": 10,
+    "crawl_max_downloads": 40,
+    "write_prometheus": False,
+    "render_pack": True,
+}
+
+
+def normalize_text(s: str) -> str:
+    s = (s or "").strip().replace(",", " ")
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+def mk(*parts) -> str:
+    cleaned = []
+    for p in parts:
+        if p is None:
+            continue
+        if isinstance(p, int):
+            p = str(p)
+        p = normalize_text(str(p))
+        if p:
+            cleaned.append(p)
+    return " ".join(cleaned).strip()
+
+def make_provider(provider_choice: str) -> BaseSearchProvider:
+    if provider_choice.startswith("Mock"):
+        return MockSearchProvider()
+    # Cache outside the throttle: cache hits cost neither rate-limit tokens nor quota
+    if provider_choice.startswith("Federated"):
+        return CachedSearchProvider(FederatedSearchProvider(
+            ThrottledSearchProvider(SerpApiSearchProvider()),
+            ThrottledSearchProvider(BingWebSearchProvider()),
+        ))
+    if provider_choice.startswith("Bing"):
+        return CachedSearchProvider(ThrottledSearchProvider(BingWebSearchProvider()))
+    return CachedSearchProvider(ThrottledSearchProvider(SerpApiSearchProvider()))
+
+def auto_query(profile: Mapping[str, Any]) -> str:
+    return mk(
+        profile.get("brand", ""),
+        profile.get("season", ""),
+        profile.get("year", ""),
+        profile.get("location", ""),
+        profile.get("keywords", ""),
+        "runway backstage",
+    )
+
+def project_label(profile: Mapping[str, Any]) -> str:
+    project_event = str(profile.get("project_event") or "").strip()
+    if project_event:
+        return project_event
+    return mk(
+        str(profile.get("brand") or "").strip(),
+        str(profile.get("season") or "").strip(),
+        str(profile.get("year") or ""),
+        str(profile.get("location") or "").strip(),
+    ) or "Untitled Project"
+
+def build_queries(
+    base_query: str,
+    sources: list[str],
+    brand_domain: str,
+    ig_handle: str,
+    ig_mode: str,
+    use_vogue: bool,
+    use_voguerunway: bool,
+    use_brand_site: bool,
+) -> dict[str, dict[str, str]]:
+    q: dict[str, dict[str, str]] = {}
+
+    if "Web" in sources:
+        if use_vogue:
+            q["Vogue.com"] = {"mode": "images", "query": mk("site:vogue.com/fashion-shows", base_query)}
+        if use_voguerunway:
+            q["VogueRunway.com"] = {"mode": "images", "query": mk("site:voguerunway.com", base_query)}
+
+        if use_brand_site:
+            if brand_domain:
+                q["Brand site"] = {"mode": "images", "query": mk(f"site:{brand_domain}", base_query, "lookbook press runway")}
+            else:
+                q["Brand site (web)"] = {
+                    "mode": "images",
+                    "query": mk(base_query, "official site lookbook press runway", "-site:pinterest.com", "-site:tiktok.com"),
+                }
+
+    if "Instagram (links-only)" in sources:
+        base_ig = "site:instagram.com (inurl:/p/ OR inurl:/reel/)"
+        handle = (ig_handle or "").strip().lstrip("@")
+
+        if ig_mode == "Links-only (handle only)":
+            query = mk(base_ig, f"\"{handle}\"" if handle else base_query)
+        elif ig_mode == "Links-only (handle + show terms)":
+            query = mk(base_ig, f"\"{handle}\"" if handle else "", base_query)
+        else:
+            query = mk(base_ig, base_query)
+
+        q["Instagram"] = {"mode": "web", "query": query}
+
+    return q
+
+def queries_for_profile(profile: Mapping[str, Any]) -> dict[str, dict[str, str]]:
+    return build_queries(
+        base_query=str(profile.get("base_query") or "").strip() or auto_query(profile),
+        sources=list(profile.get("sources") or []),
+        brand_domain=profile.get("brand_domain", ""),
+        ig_handle=profile.get("ig_handle", ""),
+        ig_mode=profile.get("ig_mode", DEFAULT_PROFILE["ig_mode"]),
+        use_vogue=bool(profile.get("use_vogue", True)),
+        use_voguerunway=bool(profile.get("use_voguerunway", True)),
+        use_brand_site=bool(profile.get("use_brand_site", True)),
+    )
+
+def coerce_profile(raw: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Fills a loaded profile (JSONL or CSV row) from DEFAULT_PROFILE and coerces
+    string values to the default's type (unparseable numbers keep the default).
+    CSV lists use ";" or "|" separators.
+    """
+    out: Dict[str, Any] = dict(DEFAULT_PROFILE)
+    for k, v in raw.items():
+        if k is None:
+            continue
+        k = str(k).strip()
+        default = DEFAULT_PROFILE.get(k)
+        if isinstance(v, str):
+            v = v.strip()
+            if v == "" and default is not None and not isinstance(default, str):
+                continue
+            if isinstance(default, bool):
+                v = v.lower() in ("1", "true", "yes", "y", "on")
+            elif isinstance(default, int):
+                try:
+                    v = int(float(v))
+                except (ValueError, OverflowError):
+                    continue  # one bad cell keeps the default instead of failing the whole file
+            elif isinstance(default, list):
+                v = [p.strip() for p in re.split(r"[;|]", v) if p.strip()]
+        out[k] = v
+    return out
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+import os
+import threading
+import time
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_ATTEMPTS = int(os.environ.get("HTTP_RETRY_ATTEMPTS", "3"))
+MAX_RETRY_WAIT_S = float(os.environ.get("HTTP_MAX_RETRY_WAIT_S", "30"))
+
+T = TypeVar("T")
+
+
+class RetryableHTTPError(RuntimeError):
+    """429 / 5xx from an upstream; retry_after is the server's hint in seconds (0 = none)."""
+
+    def __init__(self, status: int, message: str = "", retry_after: float = 0.0):
+        super().__init__(message or f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class QuotaExhausted(RuntimeError):
+    pass
+
+
+def is_retryable_status(status: int) -> bool:
+    return status in RETRYABLE_STATUSES
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> float:
+    """Retry-After as seconds from now; accepts delta-seconds or an HTTP date. 0 when absent/invalid."""
+    value = (value or "").strip()
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: rate_per_s refill, up to burst tokens banked.
+    - acquire() reserves a token and sleeps until it is due (FIFO-fair across threads)
+    - pause(seconds) stops handing out tokens, e.g. for a 429's Retry-After
+    """
+
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate_per_s = max(1e-6, float(rate_per_s))
+        self.burst = max(1, int(burst))
+        self._lock = threading.Lock()
+        # Time at which the bucket would be full again; tokens are "spent" by pushing it forward
+        self._full_at = 0.0
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long the caller must wait before using it."""
+        interval = 1.0 / self.rate_per_s
+        with self._lock:
+            now = time.monotonic()
+            full_at = max(self._full_at, now)
+            start = max(now, full_at - (self.burst - 1) * interval)
+            self._full_at = full_at + interval
+        return start - now
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            until = time.monotonic() + seconds + (self.burst - 1) / self.rate_per_s
+            self._full_at = max(self._full_at, until)
+
+    def set_rate(self, rate_per_s: float) -> None:
+        with self._lock:
+            self.rate_per_s = max(1e-6, float(rate_per_s))
+
+
+class QuotaTracker:
+    """
+    Remaining upstream quota, refreshed from the provider and counted down locally in between.
+    - remaining is None until something reports it (unknown = unlimited)
+    - reserve calls are kept back so interactive use still works when a batch drains the plan
+    """
+
+    def __init__(self, reserve: int = 0):
+        self.reserve = max(0, reserve)
+        self.remaining: Optional[int] = None
+        self.used = 0
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, remaining: Optional[int]) -> None:
+        if remaining is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.updated_at = time.time()
+
+    def take(self) -> None:
+        with self._lock:
+            if self.remaining is not None and self.remaining <= self.reserve:
+                raise QuotaExhausted(f"Search quota exhausted ({self.remaining} left, {self.reserve} reserved).")
+            self.used += 1
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def refund(self) -> None:
+        with self._lock:
+            self.used -= 1
+            if self.remaining is not None:
+                self.remaining += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"remaining": self.remaining, "used": self.used, "reserve": self.reserve}
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, RetryableHTTPError):
+        return exc.retry_after <= MAX_RETRY_WAIT_S  # a long Retry-After means "come back later", not "retry"
+    try:
+        import requests
+    except ImportError:
+        return False
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_call(
+    fn: Callable[[], T],
+    attempts: int = DEFAULT_ATTEMPTS,
+    on_backoff: Optional[Callable[[float, BaseException], None]] = None,
+) -> T:
+    """
+    Calls fn, retrying 429 / 5xx (RetryableHTTPError) and connection errors.
+    - Waits are jittered exponential (0.5s, 1s, 2s ... capped), or the server's Retry-After if longer
+    - on_backoff(seconds, exc) runs before each wait, e.g. to pause a shared TokenBucket
+    - The last exception is re-raised unchanged when attempts run out
+    """
+    from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+    jitter = wait_random_exponential(multiplier=0.5, max=MAX_RETRY_WAIT_S)
+
+    def wait(retry_state) -> float:
+        exc = retry_state.outcome.exception()
+        return min(MAX_RETRY_WAIT_S, max(getattr(exc, "retry_after", 0.0) or 0.0, jitter(retry_state)))
+
+    def before_sleep(retry_state) -> None:
+        if on_backoff is not None:
+            on_backoff(retry_state.next_action.sleep, retry_state.outcome.exception())
+
+    retrying = Retrying(
+        stop=stop_after_attempt(max(1, attempts)),
+        wait=wait,
+        retry=retry_if_exception(_is_retryable),
+        before_sleep=before_sleep,
+        reraise=True,
+    )
+    return retrying(fn)
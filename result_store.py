@@ -0,0 +1,99 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from search_providers import SearchResult
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "igsh", "mc_cid", "mc_eid",
+    "ref", "ref_src", "ref_url", "_ga", "_gl", "spm", "cmpid", "mbid", "itm_source",
+}
+TRACKING_PREFIXES = ("utm_", "itm_", "pk_")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalized key for a result URL.
+    - Lowercases scheme/host, drops "www.", default ports and the fragment
+    - Removes tracking params (utm_*, fbclid, igshid, ...) and sorts the rest
+    - Drops a trailing slash from non-root paths
+    """
+    raw = (url or "").strip()
+    try:
+        parts = urlsplit(raw)
+    except ValueError:
+        return raw
+    if not parts.scheme or not parts.netloc:
+        return raw
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query.sort()
+    # http and https variants of the same page collapse to one key
+    return urlunsplit(("https" if scheme in ("http", "https") else scheme, host, path, urlencode(query), ""))
+
+
+@dataclass
+class StoredResult:
+    key: str
+    result: SearchResult
+    sources: List[str] = field(default_factory=list)
+    order: int = 0  # first-seen position in the store
+
+
+class ResultStore:
+    """
+    All search results of a run, deduplicated by canonical URL.
+    - O(1) lookup by any URL variant via get()
+    - Remembers every source that returned each URL
+    - Iterates in first-seen order
+    """
+
+    def __init__(self):
+        self._by_key: Dict[str, StoredResult] = {}
+
+    @classmethod
+    def from_results_by_source(cls, results_by_source: Mapping[str, Mapping]) -> "ResultStore":
+        store = cls()
+        for source, payload in results_by_source.items():
+            store.add(source, payload.get("results", []) or [])
+        return store
+
+    def add(self, source: str, results: Iterable[SearchResult]) -> None:
+        for r in results:
+            if not r.url:
+                continue
+            key = canonicalize_url(r.url)
+            item = self._by_key.get(key)
+            if item is None:
+                self._by_key[key] = StoredResult(key, r, [source], len(self._by_key))
+                continue
+            if source not in item.sources:
+                item.sources.append(source)
+            # Keep the first URL, but fill in fields a later source knows about
+            filled = {f: getattr(r, f) for f in ("title", "snippet", "thumbnail_url", "image_url")
+                      if not getattr(item.result, f) and getattr(r, f)}
+            if filled:
+                item.result = replace(item.result, **filled)
+
+    def get(self, url: str) -> Optional[StoredResult]:
+        return self._by_key.get(canonicalize_url(url))
+
+    def __iter__(self) -> Iterator[StoredResult]:
+        return iter(self._by_key.values())
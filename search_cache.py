@@ -0,0 +1,253 @@
+from __future__ import annotations
+from contextlib import closing, contextmanager
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Callable, Iterator
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from rate_limit import QuotaExhausted, RetryableHTTPError
+from search_providers import BaseSearchProvider, SearchResult
+
+DEFAULT_CACHE_PATH = Path("output") / ".cache" / "search_cache.sqlite"
+DEFAULT_TTL_S = int(os.environ.get("SEARCH_CACHE_TTL", str(6 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_STALE_S = int(os.environ.get("SEARCH_CACHE_STALE_S", str(7 * 24 * 3600)))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.results: Optional[List[SearchResult]] = None
+        self.error: Optional[BaseException] = None
+
+
+class CachedSearchProvider(BaseSearchProvider):
+    """
+    Wraps another provider with an on-disk SQLite cache.
+    - Keyed on provider class, mode, query, count and tbs
+    - Entries expire after ttl_s; the least recently used rows are evicted past max_entries
+    - Identical concurrent queries share one upstream call (single-flight)
+    - Results served from the cache come back with cached=True
+    - When the upstream is out of quota or still throttling after retries, an expired entry
+      (up to stale_s past its TTL) is served instead of an error
+    """
+
+    def __init__(
+        self,
+        inner: BaseSearchProvider,
+        path: Path = DEFAULT_CACHE_PATH,
+        ttl_s: int = DEFAULT_TTL_S,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        stale_s: int = DEFAULT_STALE_S,
+    ):
+        self.inner = inner
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.stale_s = stale_s
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                " key TEXT PRIMARY KEY, provider TEXT, mode TEXT, query TEXT,"
+                " payload TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache(accessed_at)")
+
+    @property
+    def provider_name(self) -> str:
+        return getattr(self.inner, "provider_name", type(self.inner).__name__)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own `with` only commits; closing() releases the connection too
+        with closing(sqlite3.connect(str(self.path), timeout=10)) as con, con:
+            yield con
+
+    def _key(self, mode: str, query: str, count: int, tbs: str) -> str:
+        raw = json.dumps([self.provider_name, mode, query, int(count), tbs or ""])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _load(self, key: str, allow_stale: bool = False) -> Optional[List[SearchResult]]:
+        now = time.time()
+        max_age = self.ttl_s + (self.stale_s if allow_stale else 0)
+        with self._db_lock, self._connect() as con:
+            row = con.execute("SELECT payload, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            payload, created_at = row
+            if now - created_at > max_age:
+                return None  # kept until _store purges past ttl_s + stale_s (stale fallback)
+            con.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return [SearchResult(**{**item, "cached": True}) for item in json.loads(payload)]
+
+    def _store(self, key: str, mode: str, query: str, results: List[SearchResult]) -> None:
+        now = time.time()
+        payload = json.dumps([{k: v for k, v in asdict(r).items() if k != "cached"} for r in results])
+        with self._db_lock, self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO search_cache (key, provider, mode, query, payload, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, self.provider_name, mode, query, payload, now, now),
+            )
+            con.execute("DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl_s - self.stale_s,))
+            con.execute(
+                "DELETE FROM search_cache WHERE key NOT IN"
+                " (SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        metrics.inc("search_cache_lookups_total", result=outcome)
+
+    def _cached_call(self, mode: str, query: str, count: int, tbs: str, call: Callable[[], List[SearchResult]]) -> List[SearchResult]:
+        key = self._key(mode, query, count, tbs)
+        cached = self._load(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            self._count("hits")
+            return [replace(r, cached=True) for r in flight.results or []]
+
+        try:
+            results = call()
+            self._store(key, mode, query, results)
+            flight.results = results
+            self._count("misses")
+            return results
+        except (QuotaExhausted, RetryableHTTPError) as e:
+            stale = self._load(key, allow_stale=True)
+            if stale is None:
+                flight.error = e
+                raise
+            flight.results = stale
+            self._count("stale_hits")
+            return stale
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        return self._cached_call("web", query, count, "", lambda: self.inner.search(query=query, count=count))
+
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        return self._cached_call(
+            "images", query, count, tbs, lambda: self.inner.search_images(query=query, count=count, tbs=tbs)
+        )
+
+    def _cached_iter(
+        self, mode: str, query: str, count: int, tbs: str, pages: Callable[[], Iterator[List[SearchResult]]]
+    ) -> Iterator[List[SearchResult]]:
+        # The leader passes pages through as they arrive and stores the full list once the
+        # upstream stream is exhausted; identical concurrent queries wait for that list
+        # (single-flight, as in _cached_call) and get it as one page.
+        key = self._key(mode, query, count, tbs)
+        cached = self._load(key)
+        if cached is not None:
+            self._count("hits")
+            yield cached
+            return
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.results is None:
+                # The leader's consumer stopped early; fetch independently
+                yield from self._cached_iter(mode, query, count, tbs, pages)
+                return
+            self._count("hits")
+            yield [replace(r, cached=True) for r in flight.results]
+            return
+
+        collected: List[SearchResult] = []
+        try:
+            for page in pages():
+                collected.extend(page)
+                yield page
+            self._store(key, mode, query, collected)
+            flight.results = collected
+            self._count("misses")
+        except (QuotaExhausted, RetryableHTTPError) as e:
+            stale = None if collected else self._load(key, allow_stale=True)
+            if stale is None:
+                flight.error = e
+                raise
+            flight.results = stale
+            self._count("stale_hits")
+            yield stale
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def iter_search(self, query: str, count: int = 10) -> Iterator[List[SearchResult]]:
+        return self._cached_iter("web", query, count, "", lambda: self.inner.iter_search(query=query, count=count))
+
+    def iter_search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> Iterator[List[SearchResult]]:
+        return self._cached_iter(
+            "images", query, count, tbs, lambda: self.inner.iter_search_images(query=query, count=count, tbs=tbs)
+        )
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return (self.hits / total) if total else 0.0
+
+    def clear(self) -> None:
+        with self._db_lock, self._connect() as con:
+            con.execute("DELETE FROM search_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock, self._connect() as con:
+            entries = con.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate": self.hit_rate(),
+            "entries": entries,
+        }
+        inner_stats = getattr(self.inner, "stats", None)
+        if callable(inner_stats):
+            stats.update(inner_stats())
+        return stats
@@ -1,9 +1,19 @@
 from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Iterator
 import os
-import requests
-from serpapi import GoogleSearch
+
+import metrics
+from rate_limit import RetryableHTTPError, is_retryable_status, parse_retry_after
+
+SERPAPI_ACCOUNT_URL = "https://serpapi.com/account.json"
+SERPAPI_WEB_PAGE_SIZE = 10      # Google organic results per `start` page
+SERPAPI_IMAGES_PAGE_SIZE = 100  # Google Images results per `ijn` page
+DEFAULT_PAGE_WORKERS = int(os.environ.get("SEARCH_PAGE_WORKERS", "3"))
+MAX_EXTRA_PAGES = 2  # pages fetched past the estimate when cross-page duplicates leave us short
+BING_WEB_MAX_COUNT = 50      # per-request caps of the Bing v7 APIs
+BING_IMAGES_MAX_COUNT = 150
 
 
 @dataclass
@@ -14,15 +24,123 @@ class SearchResult:
     thumbnail_url: str = ""
     image_url: str = ""
     source: str = "web"
+    cached: bool = False
 
 
 class BaseSearchProvider:
+    # Every upstream request is run as call_gate(fn) when set (see search_throttle.ThrottledSearchProvider)
+    call_gate: Optional[Callable[[Callable[[], Any]], Any]] = None
+
+    def _gated(self, fn: Callable[[], Any]) -> Any:
+        gate = self.call_gate
+        # Timed around the gate, so throttling waits and retries count towards the request
+        with metrics.timer("search_request_seconds", provider=type(self).__name__) as labels:
+            labels["outcome"] = "error"
+            out = gate(fn) if gate is not None else fn()
+            labels["outcome"] = "ok"
+        return out
+
     def search(self, query: str, count: int = 10) -> List[SearchResult]:
         raise NotImplementedError
 
     def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
         raise NotImplementedError("Image search not supported by this provider.")
 
+    def iter_search(self, query: str, count: int = 10) -> Iterator[List[SearchResult]]:
+        """Yields results page by page as they arrive (single page unless the provider paginates)."""
+        yield self.search(query=query, count=count)
+
+    def iter_search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> Iterator[List[SearchResult]]:
+        yield self.search_images(query=query, count=count, tbs=tbs)
+
+    def quota(self) -> Dict[str, Any]:
+        """Plan limits, if the upstream reports them: {"remaining": int, "per_hour": int}."""
+        return {}
+
+    def close(self) -> None:
+        """Releases worker threads; wrappers close the provider they wrap."""
+        inner = getattr(self, "inner", None)
+        if isinstance(inner, BaseSearchProvider):
+            inner.close()
+
+    def __enter__(self) -> "BaseSearchProvider":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def raise_for_status(r: Any, provider: str) -> None:
+    """429 / 5xx become RetryableHTTPError (with Retry-After); other errors a RuntimeError."""
+    if r.status_code < 400:
+        return
+    try:
+        detail = (r.json() or {}).get("error") or ""
+    except ValueError:
+        detail = ""
+    if isinstance(detail, dict):
+        detail = detail.get("message", "")
+    message = f"{provider} HTTP {r.status_code}" + (f": {detail}" if detail else "")
+    if is_retryable_status(r.status_code):
+        raise RetryableHTTPError(r.status_code, message, parse_retry_after(r.headers.get("Retry-After")))
+    raise RuntimeError(message)
+
+
+def iter_pages(
+    fetch_page: Callable[[int], List[SearchResult]],
+    count: int,
+    page_size: int,
+    max_workers: int = DEFAULT_PAGE_WORKERS,
+) -> Iterator[List[SearchResult]]:
+    """
+    Fetches pages 0, 1, 2 ... concurrently (up to max_workers ahead) and yields each page's
+    new results in page order.
+    - URLs already seen on an earlier page are dropped
+    - Stops at `count` results, or at the first page that is empty / adds nothing new
+    - An error on the first page is raised; a later page failing just ends the stream early
+    """
+    planned = max(1, -(-count // page_size))
+    limit = planned + MAX_EXTRA_PAGES
+    seen: set = set()
+    yielded = 0
+    futures: Dict[int, Future] = {}
+    next_page = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, planned)), thread_name_prefix="search-page")
+
+    def fill(upto: int) -> None:
+        nonlocal next_page
+        while next_page < upto and len(futures) < max(1, max_workers):
+            futures[next_page] = pool.submit(metrics.propagate(fetch_page), next_page)
+            next_page += 1
+
+    try:
+        fill(planned)
+        page = 0
+        while page in futures:
+            try:
+                results = futures.pop(page).result()
+            except Exception:
+                if page == 0:
+                    raise
+                return
+            page += 1
+            fresh: List[SearchResult] = []
+            for r in results:
+                if r.url and r.url not in seen:
+                    seen.add(r.url)
+                    fresh.append(r)
+            if not fresh:
+                return
+            fresh = fresh[: count - yielded]
+            yielded += len(fresh)
+            yield fresh
+            if yielded >= count:
+                return
+            # Past the estimate only once nothing is in flight (each page costs quota)
+            fill(planned if next_page < planned or futures else min(limit, next_page + 1))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 
 class MockSearchProvider(BaseSearchProvider):
     def search(self, query: str, count: int = 10) -> List[SearchResult]:
@@ -47,18 +165,26 @@ class MockSearchProvider(BaseSearchProvider):
 
 
 class BingWebSearchProvider(BaseSearchProvider):
-    def __init__(self, endpoint: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(self, endpoint: Optional[str] = None, api_key: Optional[str] = None, images_endpoint: Optional[str] = None):
         self.endpoint = endpoint or os.environ.get("BING_ENDPOINT", "https://api.bing.microsoft.com/v7.0/search")
+        self.images_endpoint = images_endpoint or os.environ.get(
+            "BING_IMAGES_ENDPOINT", "https://api.bing.microsoft.com/v7.0/images/search"
+        )
         self.api_key = api_key or os.environ.get("BING_API_KEY")
 
-    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+    def _get_json(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
         if not self.api_key:
             raise RuntimeError("Missing BING_API_KEY env var.")
+        import requests  # lazy: keeps app start-up light until a search actually runs
+
         headers = {"Ocp-Apim-Subscription-Key": self.api_key}
-        params = {"q": query, "count": count, "textDecorations": False, "textFormat": "Raw"}
-        r = requests.get(self.endpoint, headers=headers, params=params, timeout=20)
-        r.raise_for_status()
-        data: Dict[str, Any] = r.json()
+        r = self._gated(lambda: requests.get(endpoint, headers=headers, params=params, timeout=20))
+        raise_for_status(r, "Bing")
+        return r.json()
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        params = {"q": query, "count": min(count, BING_WEB_MAX_COUNT), "textDecorations": False, "textFormat": "Raw"}
+        data = self._get_json(self.endpoint, params)
 
         results: List[SearchResult] = []
         for item in data.get("webPages", {}).get("value", []):
@@ -72,6 +198,29 @@ class BingWebSearchProvider(BaseSearchProvider):
             )
         return results
 
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        # Google's tbs has no Bing equivalent beyond the two filters it usually carries
+        params: Dict[str, Any] = {"q": query, "count": min(count, BING_IMAGES_MAX_COUNT)}
+        if "itp:photo" in (tbs or ""):
+            params["imageType"] = "Photo"
+        if "isz:l" in (tbs or ""):
+            params["size"] = "Large"
+        data = self._get_json(self.images_endpoint, params)
+
+        results: List[SearchResult] = []
+        for item in data.get("value", []) or []:
+            results.append(
+                SearchResult(
+                    title=item.get("name", "") or "",
+                    url=item.get("hostPageUrl", "") or item.get("contentUrl", "") or "",
+                    snippet=item.get("hostPageDisplayUrl", "") or "",
+                    thumbnail_url=item.get("thumbnailUrl", "") or "",
+                    image_url=item.get("contentUrl", "") or "",
+                    source="bing_images",
+                )
+            )
+        return results
+
 
 class SerpApiSearchProvider(BaseSearchProvider):
     def __init__(self, api_key: Optional[str] = None):
@@ -81,14 +230,45 @@ class SerpApiSearchProvider(BaseSearchProvider):
         if not self.api_key:
             raise RuntimeError("Missing SERPAPI_API_KEY env var.")
 
-    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+    def _get_dict(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        from serpapi import GoogleSearch  # lazy: imported on first real search
+
+        def call() -> Dict[str, Any]:
+            search = GoogleSearch(params)
+            search.params_dict["output"] = "json"
+            r = search.get_response()
+            raise_for_status(r, "SerpAPI")
+            return r.json()
+
+        return self._gated(call)
+
+    def quota(self) -> Dict[str, Any]:
+        # The account endpoint is free (doesn't count against the plan)
+        import requests
+
         self._require_key()
-        params = {"engine": "google", "q": query, "api_key": self.api_key, "num": min(count, 10)}
-        data = GoogleSearch(params).get_dict()
+        r = requests.get(SERPAPI_ACCOUNT_URL, params={"api_key": self.api_key}, timeout=10)
+        raise_for_status(r, "SerpAPI")
+        data = r.json()
+        out: Dict[str, Any] = {}
+        if data.get("total_searches_left") is not None:
+            out["remaining"] = int(data["total_searches_left"])
+        if data.get("account_rate_limit_per_hour"):
+            out["per_hour"] = int(data["account_rate_limit_per_hour"])
+        return out
+
+    def _web_page(self, query: str, page: int) -> List[SearchResult]:
+        params = {
+            "engine": "google",
+            "q": query,
+            "api_key": self.api_key,
+            "num": SERPAPI_WEB_PAGE_SIZE,
+            "start": page * SERPAPI_WEB_PAGE_SIZE,
+        }
+        data = self._get_dict(params)
 
         results: List[SearchResult] = []
-        organic = data.get("organic_results", []) or []
-        for item in organic[:count]:
+        for item in data.get("organic_results", []) or []:
             results.append(
                 SearchResult(
                     title=item.get("title", ""),
@@ -99,20 +279,18 @@ class SerpApiSearchProvider(BaseSearchProvider):
             )
         return results
 
-    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
-        self._require_key()
+    def _images_page(self, query: str, page: int, tbs: str) -> List[SearchResult]:
         params = {
             "engine": "google_images",
             "q": query,
             "api_key": self.api_key,
-            "ijn": 0,
+            "ijn": page,
             "tbs": tbs,
         }
-        data = GoogleSearch(params).get_dict()
+        data = self._get_dict(params)
 
         results: List[SearchResult] = []
-        images = data.get("images_results", []) or []
-        for item in images[:count]:
+        for item in data.get("images_results", []) or []:
             results.append(
                 SearchResult(
                     title=item.get("title", "") or item.get("source", ""),
@@ -124,3 +302,17 @@ class SerpApiSearchProvider(BaseSearchProvider):
                 )
             )
         return results
+
+    def iter_search(self, query: str, count: int = 10) -> Iterator[List[SearchResult]]:
+        self._require_key()
+        yield from iter_pages(lambda page: self._web_page(query, page), count, SERPAPI_WEB_PAGE_SIZE)
+
+    def iter_search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> Iterator[List[SearchResult]]:
+        self._require_key()
+        yield from iter_pages(lambda page: self._images_page(query, page, tbs), count, SERPAPI_IMAGES_PAGE_SIZE)
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        return [r for page in self.iter_search(query=query, count=count) for r in page]
+
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        return [r for page in self.iter_search_images(query=query, count=count, tbs=tbs) for r in page]
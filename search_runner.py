@@ -0,0 +1,128 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from typing import Callable, Dict, Iterator, List, Any, Optional
+import math
+import time
+
+import metrics
+from search_providers import SearchResult
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_QUERY_TIMEOUT = 30.0
+PARTIAL_POLL_S = 0.25
+
+
+def do_search(provider_obj, mode: str, query: str, count: int) -> List[SearchResult]:
+    if mode == "images":
+        try:
+            return provider_obj.search_images(query=query, count=count)
+        except Exception:
+            return provider_obj.search(query=query, count=count)
+    return provider_obj.search(query=query, count=count)
+
+
+def iter_search_pages(provider_obj, mode: str, query: str, count: int) -> Iterator[List[SearchResult]]:
+    """Streaming do_search(): yields pages as they arrive, with the same images -> web fallback."""
+    if mode == "images":
+        try:
+            pages = provider_obj.iter_search_images(query=query, count=count)
+            first = next(pages, None)
+        except Exception:
+            yield from provider_obj.iter_search(query=query, count=count)
+            return
+        if first is not None:
+            yield first
+            yield from pages
+        return
+    yield from provider_obj.iter_search(query=query, count=count)
+
+
+def run_searches(
+    provider_obj,
+    queries: Dict[str, Dict[str, str]],
+    count: int,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    timeout: float = DEFAULT_QUERY_TIMEOUT,
+    on_partial: Optional[Callable[[str, List[SearchResult]], None]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs every query from build_queries() concurrently and returns results_by_source.
+    - Each payload keeps query / mode / results and adds elapsed_s + error
+    - Multi-page providers stream pages; on_partial(source, results_so_far) is called from
+      the calling thread whenever a source has new results (and once when it finishes)
+    - A query that runs longer than `timeout` seconds is reported as timed out,
+      keeping the pages it already had; the other sources are returned as soon as they finish
+    """
+    out: Dict[str, Dict[str, Any]] = {
+        name: {"query": spec["query"], "mode": spec["mode"], "results": [], "elapsed_s": 0.0, "error": ""}
+        for name, spec in queries.items()
+    }
+    if not queries:
+        return out
+
+    started: Dict[str, float] = {}
+    partial: Dict[str, List[SearchResult]] = {}
+    reported: Dict[str, int] = {}
+
+    def _task(name: str, spec: Dict[str, str]) -> List[SearchResult]:
+        started[name] = time.perf_counter()
+        results = partial[name] = []
+        for page in iter_search_pages(provider_obj, mode=spec["mode"], query=spec["query"], count=count):
+            results.extend(page)
+        return results
+
+    def _report(name: str, results: List[SearchResult]) -> None:
+        if on_partial is not None and reported.get(name) != len(results):
+            reported[name] = len(results)
+            on_partial(name, list(results))
+
+    workers = max(1, min(max_workers, len(queries)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    t0 = time.perf_counter()
+    # Hard stop for queries still queued behind stuck workers.
+    run_deadline = t0 + timeout * math.ceil(len(queries) / workers) + timeout
+
+    pending: Dict[Future, str] = {pool.submit(metrics.propagate(_task), name, spec): name for name, spec in queries.items()}
+    try:
+        while pending:
+            now = time.perf_counter()
+            deadlines = [started[n] + timeout for n in pending.values() if n in started]
+            next_deadline = min(deadlines + [run_deadline])
+            wait_s = max(0.0, next_deadline - now)
+            if on_partial is not None:
+                wait_s = min(wait_s, PARTIAL_POLL_S)
+            done, _ = wait(list(pending), timeout=wait_s, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                name = pending.pop(fut)
+                payload = out[name]
+                payload["elapsed_s"] = round(time.perf_counter() - started.get(name, t0), 3)
+                try:
+                    payload["results"] = fut.result()
+                except Exception as e:
+                    payload["error"] = str(e)
+                metrics.observe("search_query_seconds", payload["elapsed_s"], source=name)
+                metrics.inc("search_results_total", len(payload["results"]), source=name)
+                _report(name, payload["results"])
+
+            now = time.perf_counter()
+            for fut, name in list(pending.items()):
+                start = started.get(name)
+                expired = (start is not None and now - start >= timeout) or now >= run_deadline
+                if expired:
+                    pending.pop(fut)
+                    fut.cancel()
+                    out[name]["elapsed_s"] = round(now - (start if start is not None else t0), 3)
+                    out[name]["results"] = list(partial.get(name, []))
+                    metrics.observe("search_query_seconds", out[name]["elapsed_s"], source=name)
+                    metrics.inc("search_results_total", len(out[name]["results"]), source=name)
+                    metrics.inc("search_timeouts_total", source=name)
+                    out[name]["error"] = f"Timed out after {timeout:.0f}s." + (
+                        f" Kept the first {len(out[name]['results'])} results." if out[name]["results"] else ""
+                    )
+                else:
+                    _report(name, partial.get(name, []))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return out
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, TypeVar
+import os
+import threading
+import time
+
+from rate_limit import QuotaTracker, TokenBucket, retry_call
+from search_providers import BaseSearchProvider, SearchResult
+
+DEFAULT_RATE_PER_S = float(os.environ.get("SEARCH_RATE_PER_S", "1.0"))
+DEFAULT_BURST = int(os.environ.get("SEARCH_BURST", "5"))
+DEFAULT_QUOTA_RESERVE = int(os.environ.get("SEARCH_QUOTA_RESERVE", "0"))
+QUOTA_REFRESH_S = 300
+
+T = TypeVar("T")
+
+
+class ThrottledSearchProvider(BaseSearchProvider):
+    """
+    Wraps a provider with a token bucket, retries and quota tracking.
+    - Calls are paced at rate_per_s (burst banked), lowered to the plan's hourly limit when known
+    - 429 / 5xx are retried with jittered backoff; Retry-After pauses the whole bucket
+    - Remaining quota is read from the provider every few minutes and counted down in between;
+      at the reserve, calls fail fast with QuotaExhausted instead of spending the last searches
+    Applied per upstream request through the inner provider's call_gate, so every
+    SerpAPI page costs one token and one search of quota.
+    Sits inside CachedSearchProvider, so cache hits cost neither tokens nor quota.
+    """
+
+    def __init__(
+        self,
+        inner: BaseSearchProvider,
+        rate_per_s: float = DEFAULT_RATE_PER_S,
+        burst: int = DEFAULT_BURST,
+        quota_reserve: int = DEFAULT_QUOTA_RESERVE,
+    ):
+        self.inner = inner
+        self.rate_per_s = rate_per_s
+        self.bucket = TokenBucket(rate_per_s, burst)
+        self.quota_tracker = QuotaTracker(quota_reserve)
+        self.retries = 0
+        self._quota_checked_at = 0.0
+        self._quota_lock = threading.Lock()
+        inner.call_gate = self._call
+
+    @property
+    def provider_name(self) -> str:
+        return getattr(self.inner, "provider_name", type(self.inner).__name__)
+
+    def _refresh_quota(self) -> None:
+        with self._quota_lock:
+            if time.time() - self._quota_checked_at < QUOTA_REFRESH_S:
+                return
+            self._quota_checked_at = time.time()
+        try:
+            info = self.inner.quota()
+        except Exception:
+            return  # quota is advisory; the search itself will surface real errors
+        self.quota_tracker.update(info.get("remaining"))
+        if info.get("per_hour"):
+            self.bucket.set_rate(min(self.rate_per_s, info["per_hour"] / 3600.0))
+
+    def _call(self, fn: Callable[[], T]) -> T:
+        self._refresh_quota()
+        self.quota_tracker.take()
+
+        def attempt() -> T:
+            self.bucket.acquire()
+            return fn()
+
+        def on_backoff(seconds: float, _exc: BaseException) -> None:
+            self.retries += 1
+            self.bucket.pause(seconds)
+
+        try:
+            return retry_call(attempt, on_backoff=on_backoff)
+        except BaseException:
+            self.quota_tracker.refund()
+            raise
+
+    def search(self, query: str, count: int = 10) -> List[SearchResult]:
+        return self.inner.search(query=query, count=count)
+
+    def search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> List[SearchResult]:
+        return self.inner.search_images(query=query, count=count, tbs=tbs)
+
+    def iter_search(self, query: str, count: int = 10) -> Iterator[List[SearchResult]]:
+        return self.inner.iter_search(query=query, count=count)
+
+    def iter_search_images(self, query: str, count: int = 20, tbs: str = "itp:photo,isz:l") -> Iterator[List[SearchResult]]:
+        return self.inner.iter_search_images(query=query, count=count, tbs=tbs)
+
+    def quota(self) -> Dict[str, Any]:
+        return self.inner.quota()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "quota": self.quota_tracker.stats(),
+            "rate_per_s": round(self.bucket.rate_per_s, 4),
+            "retries": self.retries,
+        }
@@ -0,0 +1,125 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_THUMB_DIR = Path("output") / ".cache" / "thumbs"
+DEFAULT_MAX_THUMB_MB = int(os.environ.get("THUMB_CACHE_MAX_MB", "64"))
+THUMB_PX = 320
+MAX_SOURCE_BYTES = 8 * 1024 * 1024
+FAILURE_TTL_S = 6 * 3600
+
+
+class ThumbnailCache:
+    """
+    Local cache of downscaled result thumbnails.
+    - Each remote thumbnail is fetched once, shrunk with Pillow to THUMB_PX and stored as JPEG
+    - Failed fetches leave a short-lived marker so reruns don't retry them every time
+    - Least-recently-used files are evicted once the cache exceeds max_mb
+    """
+
+    def __init__(self, root: Path = DEFAULT_THUMB_DIR, max_mb: int = DEFAULT_MAX_THUMB_MB, px: int = THUMB_PX):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.px = px
+        self._lock = threading.Lock()
+        self._total = sum(p.stat().st_size for p in self.root.glob("*/*.jpg"))
+
+    def _path(self, url: str) -> Path:
+        key = hashlib.sha1(f"{self.px}:{url}".encode("utf-8")).hexdigest()
+        return self.root / key[:2] / f"{key}.jpg"
+
+    def cached(self, url: str) -> Optional[Path]:
+        """The local thumbnail if it's already cached (no network)."""
+        if not url:
+            return None
+        path = self._path(url)
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            return None
+        return path
+
+    def get(self, url: str, timeout: float = 10) -> Optional[Path]:
+        if not url:
+            return None
+        path = self.cached(url)
+        if path is not None:
+            return path
+        path = self._path(url)
+        failed = path.with_suffix(".fail")
+        if failed.exists() and time.time() - failed.stat().st_mtime < FAILURE_TTL_S:
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            data = self._fetch(url, timeout)
+            size = self._shrink_to(data, path)
+        except Exception:
+            failed.touch()
+            return None
+        failed.unlink(missing_ok=True)
+        with self._lock:
+            self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+        return path
+
+    def prefetch(self, urls: Iterable[str], max_workers: int = 8) -> Dict[str, Optional[Path]]:
+        """Fills the cache for a page of results concurrently; returns url -> local path."""
+        urls = [u for u in dict.fromkeys(urls) if u]
+        out: Dict[str, Optional[Path]] = {u: self.cached(u) for u in urls}
+        missing = [u for u, p in out.items() if p is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing))), thread_name_prefix="thumb") as pool:
+                for u, p in zip(missing, pool.map(self.get, missing)):
+                    out[u] = p
+        return out
+
+    def _fetch(self, url: str, timeout: float) -> bytes:
+        from http_client import get_session, request_timeout  # lazy: requests only once thumbnails render
+
+        with get_session().get(url, timeout=request_timeout(timeout), stream=True) as r:
+            r.raise_for_status()
+            buf = bytearray()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                buf.extend(chunk)
+                if len(buf) > MAX_SOURCE_BYTES:
+                    raise ValueError("Thumbnail source too large.")
+        return bytes(buf)
+
+    def _shrink_to(self, data: bytes, path: Path) -> int:
+        from PIL import Image  # lazy: Pillow only once thumbnails render
+
+        with Image.open(BytesIO(data)) as im:
+            im.draft("RGB", (self.px, self.px))  # JPEG: decode at reduced scale
+            im.thumbnail((self.px, self.px))
+            if im.mode != "RGB":
+                im = im.convert("RGB")
+            # Unique per writer: two sessions can render the same thumbnail at once
+            tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.part")
+            try:
+                im.save(tmp, "JPEG", quality=80, optimize=True)
+                os.replace(tmp, path)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+        return path.stat().st_size
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = sorted(self.root.glob("*/*.jpg"), key=lambda p: p.stat().st_mtime)
+            total = sum(p.stat().st_size for p in files)
+            for p in files:
+                if total <= self.max_bytes * 0.9:  # evict a little extra so we don't churn
+                    break
+                total -= p.stat().st_size
+                p.unlink(missing_ok=True)
+            self._total = total
@@ -1,6 +1,9 @@
 from __future__ import annotations
 from dataclasses import dataclass
-import requests
+from typing import Optional, Tuple
+import metrics
+from http_client import get_session, request_timeout
+from rate_limit import parse_retry_after
 
 @dataclass
 class UrlCheck:
@@ -9,18 +12,77 @@ class UrlCheck:
     content_type: str
     final_url: str
     reason: str = ""
+    retry_after: float = 0.0
 
 def check_image_url(url: str, timeout: int = 15) -> UrlCheck:
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; PortfolioAssetFinder/1.0)"}
+    with metrics.timer("image_check_seconds") as labels:
+        res = _check_image_url(url, timeout)
+        labels["outcome"] = "ok" if res.ok else ("http_error" if res.status >= 400 else "failed")
+    return res
+
+def _check_image_url(url: str, timeout: int) -> UrlCheck:
     try:
-        r = requests.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+        r = get_session().head(url, allow_redirects=True, timeout=request_timeout(timeout))
         status = r.status_code
         ct = (r.headers.get("Content-Type") or "").lower()
         final_url = r.url
         if status >= 400:
-            return UrlCheck(False, status, ct, final_url, "HTTP error")
+            return UrlCheck(False, status, ct, final_url, "HTTP error", parse_retry_after(r.headers.get("Retry-After")))
         if "image/" not in ct:
             return UrlCheck(False, status, ct, final_url, "Not an image content-type")
         return UrlCheck(True, status, ct, final_url, "")
     except Exception as e:
         return UrlCheck(False, 0, "", url, f"HEAD failed: {e}")
+
+def sniff_image_ext(head: bytes) -> str:
+    """Returns the file extension for JPEG / PNG / WebP magic bytes, or "" if unrecognized."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return ""
+
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Reads (width, height) from the first bytes of a JPEG / PNG / WebP file.
+    Returns None if the header is unrecognized or the dimensions aren't in `head` yet.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24 and head[12:16] == b"IHDR":
+        return int.from_bytes(head[16:20], "big"), int.from_bytes(head[20:24], "big")
+
+    if len(head) >= 30 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            return int.from_bytes(head[26:28], "little") & 0x3FFF, int.from_bytes(head[28:30], "little") & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        return None
+
+    if head.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 9 <= len(head):
+            if head[i] != 0xFF:
+                i += 1
+                continue
+            marker = head[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            if marker in _JPEG_SOF_MARKERS:
+                height = int.from_bytes(head[i + 5:i + 7], "big")
+                width = int.from_bytes(head[i + 7:i + 9], "big")
+                return width, height
+            i += 2 + int.from_bytes(head[i + 2:i + 4], "big")
+    return None